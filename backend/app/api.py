@@ -9,19 +9,30 @@ from app.blueprints.box.box_blueprint import bp as box_blueprint
 from app.blueprints.building.building_blueprint import bp as building_blueprint
 from app.blueprints.calendar.calendar_api import bp as calendar_api_blueprint
 from app.blueprints.data.data_blueprint import bp as data_blueprint
+from app.blueprints.helpers import validate_admin
 from app.blueprints.login.login_blueprint import bp as login_blueprint, login_manager
 from app.blueprints.meeting.meeting_blueprint import bp as meeting_blueprint
 from app.blueprints.meeting_request.meeting_request_blueprint import bp as meeting_request_blueprint
 from app.blueprints.meeting_room.meeting_room_blueprint import bp as meeting_room_blueprint
+from app.blueprints.notifications.notifications_blueprint import bp as notifications_blueprint
 from app.blueprints.organization.organization_blueprint import bp as organization_blueprint
 from app.blueprints.reservation.reservation_blueprint import bp as reservation_blueprint
 from app.blueprints.user.user_blueprint import bp as user_blueprint
 from app.blueprints.working_space.working_space_blueprint import bp as working_space_blueprint
-from app.persistence.models import User
-from app.persistence.session import get_session
+from app.persistence.models import MeetingRequest, User
+from app.persistence.session import get_session, get_pool_status
+from app.services.directory_cache import get_directory_status
+from app.services.event_mirror import get_event_mirror_status
+from app.services.freebusy_cache import get_freebusy_cache_status
+from app.services.provider_concurrency import get_provider_concurrency_status
+from app.services.provider_quota import get_provider_quota_status
+from app.services.google_credentials import get_google_credentials_status
+from app.services.google_services import get_google_service_pool_status
+from app.services.graph_client import get_graph_client_status
+from app.services.office_credentials import get_office_token_status
+from app.services.working_hours import get_working_hours_status
 from app.task_queue.tasks import example
 
-
 def create_app(config_cls='app.api_config.ProductionConfig'):
     app = Flask(__name__)
 
@@ -68,17 +79,34 @@ def create_app(config_cls='app.api_config.ProductionConfig'):
         }
 
     @app.route('/task/<task_id>', methods=['GET'])
+    @login_required
     def task_status(task_id: str):
+        """Status of a task, only for the user that requested it (or an admin)"""
         q: Queue = current_app.task_queue
         job: Job = q.fetch_job(task_id)
-        if not job:
+        if not job or not can_see_task(current_user, task_id):
             return {'error': f'Task {task_id} does not exist'}
         else:
-            return {
-                "task_id": job.get_id(),
-                "task_status": job.get_status(),
-                "task_result": job.result,
-            }
+            return task_to_dict(job)
+
+    @app.route('/stats', methods=['GET'], endpoint='stats')
+    @login_required
+    @validate_admin
+    def stats():
+        """Resource usage of the worker process that handles the request, only for admins"""
+        return {
+            'db_pool': get_pool_status(),
+            'google_services': get_google_service_pool_status(),
+            'google_credentials': get_google_credentials_status(),
+            'office_token': get_office_token_status(),
+            'graph': get_graph_client_status(),
+            'freebusy_cache': get_freebusy_cache_status(),
+            'event_mirror': get_event_mirror_status(),
+            'directory': get_directory_status(),
+            'provider_quota': get_provider_quota_status(),
+            'provider_concurrency': get_provider_concurrency_status(),
+            'working_hours': get_working_hours_status(),
+        }
 
     @app.route('/hello', methods=['GET'])
     def greeting():
@@ -89,6 +117,26 @@ def create_app(config_cls='app.api_config.ProductionConfig'):
     return app
 
 
+def task_to_dict(job: Job):
+    return {
+        "task_id": job.get_id(),
+        "task_status": job.get_status(),
+        "task_progress": job.meta.get('progress'),
+        "task_result": job.result,
+    }
+
+
+def can_see_task(me: User, task_id: str) -> bool:
+    """The result of a meeting search has the attendees, rooms and times of the meeting"""
+    if me.admin:
+        return True
+    return get_session().query(MeetingRequest.id).filter(
+        MeetingRequest.task_id == task_id,
+        MeetingRequest.user_id == me.id,
+        MeetingRequest.deleted_at.is_(None)
+    ).first() is not None
+
+
 def register_task_queue(app):
     """Bind attributes to app object to be accesible through current_app flask proxt"""
     app.task_queue = Queue(connection=Redis.from_url(app.config['REDIS_URL']))
@@ -119,6 +167,7 @@ def register_blueprints(app, api):
     api.register_blueprint(working_space_blueprint)
     api.register_blueprint(building_blueprint)
     api.register_blueprint(data_blueprint)
+    api.register_blueprint(notifications_blueprint)
 
 
 def register_dbsession_hooks(app):
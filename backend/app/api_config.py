@@ -12,6 +12,65 @@ class ProductionConfig:
     DATABASE_URL = os.getenv('DATABASE_URL', MISSING)
     REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
 
+    # DB connection pool, shared by every request of a worker process
+    SQLALCHEMY_POOL_SIZE = int(os.getenv('SQLALCHEMY_POOL_SIZE', 5))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.getenv('SQLALCHEMY_MAX_OVERFLOW', 10))
+    SQLALCHEMY_POOL_TIMEOUT = int(os.getenv('SQLALCHEMY_POOL_TIMEOUT', 30))
+    SQLALCHEMY_POOL_RECYCLE = int(os.getenv('SQLALCHEMY_POOL_RECYCLE', 1800))
+    SQLALCHEMY_POOL_PRE_PING = os.getenv('SQLALCHEMY_POOL_PRE_PING', 'True') == 'True'
+
+    # Built googleapiclient services kept per worker process, one per api, delegated user and thread
+    GOOGLE_SERVICE_POOL_SIZE = int(os.getenv('GOOGLE_SERVICE_POOL_SIZE', 128))
+    # Delegated access tokens, refreshed this many seconds before they expire
+    GOOGLE_TOKEN_REFRESH_MARGIN = int(os.getenv('GOOGLE_TOKEN_REFRESH_MARGIN', 300))
+    GOOGLE_TOKEN_REFRESH_INTERVAL = int(os.getenv('GOOGLE_TOKEN_REFRESH_INTERVAL', 60))
+    GOOGLE_TOKEN_IDLE_TIMEOUT = int(os.getenv('GOOGLE_TOKEN_IDLE_TIMEOUT', 3600))
+    GOOGLE_TOKEN_SHARE_REDIS = os.getenv('GOOGLE_TOKEN_SHARE_REDIS', 'False') == 'True'
+    # Graph app token, refreshed this many seconds before it expires
+    OFFICE_TOKEN_REFRESH_MARGIN = int(os.getenv('OFFICE_TOKEN_REFRESH_MARGIN', 300))
+    OFFICE_TOKEN_REFRESH_INTERVAL = int(os.getenv('OFFICE_TOKEN_REFRESH_INTERVAL', 60))
+    OFFICE_TOKEN_SHARE_REDIS = os.getenv('OFFICE_TOKEN_SHARE_REDIS', 'False') == 'True'
+    # Keep-alive connections to Microsoft Graph per worker process, and timeouts in seconds
+    GRAPH_POOL_SIZE = int(os.getenv('GRAPH_POOL_SIZE', 10))
+    GRAPH_CONNECT_TIMEOUT = float(os.getenv('GRAPH_CONNECT_TIMEOUT', 5))
+    GRAPH_READ_TIMEOUT = float(os.getenv('GRAPH_READ_TIMEOUT', 30))
+    # Seconds the busy slots of a calendar are cached in redis, 0 disables the cache
+    FREEBUSY_CACHE_TTL = int(os.getenv('FREEBUSY_CACHE_TTL', 300))
+    # Public URL of this API, providers send calendar change notifications to it. Empty disables them
+    NOTIFICATIONS_URL = os.getenv('NOTIFICATIONS_URL', '')
+    # Seconds a calendar subscription lasts, renewed every RENEW_INTERVAL seconds when it expires within RENEW_MARGIN
+    CALENDAR_SUBSCRIPTION_TTL = int(os.getenv('CALENDAR_SUBSCRIPTION_TTL', 2 * 24 * 3600))
+    CALENDAR_SUBSCRIPTION_RENEW_INTERVAL = int(os.getenv('CALENDAR_SUBSCRIPTION_RENEW_INTERVAL', 3600))
+    CALENDAR_SUBSCRIPTION_RENEW_MARGIN = int(os.getenv('CALENDAR_SUBSCRIPTION_RENEW_MARGIN', 6 * 3600))
+    # Calendar events mirrored in the db, synced every SYNC_INTERVAL seconds (0 disables the mirror). The mirror
+    # answers for the calendars synced within MAX_AGE seconds, from PAST_DAYS ago to FUTURE_DAYS ahead
+    CALENDAR_MIRROR_SYNC_INTERVAL = int(os.getenv('CALENDAR_MIRROR_SYNC_INTERVAL', 0))
+    CALENDAR_MIRROR_MAX_AGE = int(os.getenv('CALENDAR_MIRROR_MAX_AGE', 900))
+    CALENDAR_MIRROR_PAST_DAYS = int(os.getenv('CALENDAR_MIRROR_PAST_DAYS', 7))
+    CALENDAR_MIRROR_FUTURE_DAYS = int(os.getenv('CALENDAR_MIRROR_FUTURE_DAYS', 90))
+    # Directory snapshot in redis, refreshed every REFRESH_INTERVAL seconds (0 disables it). Older than MAX_AGE
+    # seconds it's refreshed by the request that reads it
+    DIRECTORY_REFRESH_INTERVAL = int(os.getenv('DIRECTORY_REFRESH_INTERVAL', 3600))
+    DIRECTORY_MAX_AGE = int(os.getenv('DIRECTORY_MAX_AGE', 6 * 3600))
+    # Calls per second each worker makes to a provider, in total and per delegated user or mailbox (0 is unlimited).
+    # Throttled calls are retried up to MAX_RETRIES times with jittered exponential backoff from RETRY_BASE_DELAY
+    # seconds, or after the Retry-After of the provider. A call isn't retried after more than RETRY_MAX_DELAY seconds
+    GOOGLE_RATE_LIMIT = float(os.getenv('GOOGLE_RATE_LIMIT', 50))
+    GOOGLE_SUBJECT_RATE_LIMIT = float(os.getenv('GOOGLE_SUBJECT_RATE_LIMIT', 10))
+    OFFICE_RATE_LIMIT = float(os.getenv('OFFICE_RATE_LIMIT', 50))
+    OFFICE_SUBJECT_RATE_LIMIT = float(os.getenv('OFFICE_SUBJECT_RATE_LIMIT', 15))
+    PROVIDER_MAX_RETRIES = int(os.getenv('PROVIDER_MAX_RETRIES', 4))
+    PROVIDER_RETRY_BASE_DELAY = float(os.getenv('PROVIDER_RETRY_BASE_DELAY', 0.5))
+    PROVIDER_RETRY_MAX_DELAY = float(os.getenv('PROVIDER_RETRY_MAX_DELAY', 30))
+    # Provider calls each worker makes at the same time when they don't depend on each other (freebusy chunks,
+    # $batch calls, one listing per user). 1 makes them one after the other
+    GOOGLE_MAX_CONCURRENCY = int(os.getenv('GOOGLE_MAX_CONCURRENCY', 8))
+    OFFICE_MAX_CONCURRENCY = int(os.getenv('OFFICE_MAX_CONCURRENCY', 4))
+    # Calendar whose all day events are the holidays of the organization (i.e. a Google public holidays calendar),
+    # empty for none. Holidays and working hours of the users are kept per worker for WORKING_HOURS_MAX_AGE seconds
+    HOLIDAY_CALENDAR_ID = os.getenv('HOLIDAY_CALENDAR_ID', '')
+    WORKING_HOURS_MAX_AGE = int(os.getenv('WORKING_HOURS_MAX_AGE', 6 * 3600))
+
     # Open API Config
     OPENAPI_VERSION = "3.0.2"
     OPENAPI_JSON_PATH = "api-spec.json"
@@ -31,6 +90,65 @@ class DevelopmentConfig:
     DATABASE_URL = 'sqlite:///./testing.sqlite'
     REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
 
+    # DB connection pool, shared by every request of a worker process
+    SQLALCHEMY_POOL_SIZE = 2
+    SQLALCHEMY_MAX_OVERFLOW = 2
+    SQLALCHEMY_POOL_TIMEOUT = 10
+    SQLALCHEMY_POOL_RECYCLE = -1
+    SQLALCHEMY_POOL_PRE_PING = False
+
+    # Built googleapiclient services kept per worker process, one per api, delegated user and thread
+    GOOGLE_SERVICE_POOL_SIZE = 16
+    # Delegated access tokens, refreshed this many seconds before they expire
+    GOOGLE_TOKEN_REFRESH_MARGIN = 300
+    GOOGLE_TOKEN_REFRESH_INTERVAL = 0
+    GOOGLE_TOKEN_IDLE_TIMEOUT = 3600
+    GOOGLE_TOKEN_SHARE_REDIS = False
+    # Graph app token, refreshed this many seconds before it expires
+    OFFICE_TOKEN_REFRESH_MARGIN = 300
+    OFFICE_TOKEN_REFRESH_INTERVAL = 0
+    OFFICE_TOKEN_SHARE_REDIS = False
+    # Keep-alive connections to Microsoft Graph per worker process, and timeouts in seconds
+    GRAPH_POOL_SIZE = 2
+    GRAPH_CONNECT_TIMEOUT = 5
+    GRAPH_READ_TIMEOUT = 30
+    # Seconds the busy slots of a calendar are cached in redis, 0 disables the cache
+    FREEBUSY_CACHE_TTL = 0
+    # Public URL of this API, providers send calendar change notifications to it. Empty disables them
+    NOTIFICATIONS_URL = ''
+    # Seconds a calendar subscription lasts, renewed every RENEW_INTERVAL seconds when it expires within RENEW_MARGIN
+    CALENDAR_SUBSCRIPTION_TTL = 2 * 24 * 3600
+    CALENDAR_SUBSCRIPTION_RENEW_INTERVAL = 3600
+    CALENDAR_SUBSCRIPTION_RENEW_MARGIN = 6 * 3600
+    # Calendar events mirrored in the db, synced every SYNC_INTERVAL seconds (0 disables the mirror). The mirror
+    # answers for the calendars synced within MAX_AGE seconds, from PAST_DAYS ago to FUTURE_DAYS ahead
+    CALENDAR_MIRROR_SYNC_INTERVAL = 0
+    CALENDAR_MIRROR_MAX_AGE = 900
+    CALENDAR_MIRROR_PAST_DAYS = 7
+    CALENDAR_MIRROR_FUTURE_DAYS = 90
+    # Directory snapshot in redis, refreshed every REFRESH_INTERVAL seconds (0 disables it). Older than MAX_AGE
+    # seconds it's refreshed by the request that reads it
+    DIRECTORY_REFRESH_INTERVAL = 0
+    DIRECTORY_MAX_AGE = 6 * 3600
+    # Calls per second each worker makes to a provider, in total and per delegated user or mailbox (0 is unlimited).
+    # Throttled calls are retried up to MAX_RETRIES times with jittered exponential backoff from RETRY_BASE_DELAY
+    # seconds, or after the Retry-After of the provider. A call isn't retried after more than RETRY_MAX_DELAY seconds
+    GOOGLE_RATE_LIMIT = 0
+    GOOGLE_SUBJECT_RATE_LIMIT = 0
+    OFFICE_RATE_LIMIT = 0
+    OFFICE_SUBJECT_RATE_LIMIT = 0
+    PROVIDER_MAX_RETRIES = 4
+    PROVIDER_RETRY_BASE_DELAY = 0.5
+    PROVIDER_RETRY_MAX_DELAY = 30
+    # Provider calls each worker makes at the same time when they don't depend on each other (freebusy chunks,
+    # $batch calls, one listing per user). 1 makes them one after the other
+    GOOGLE_MAX_CONCURRENCY = 1
+    OFFICE_MAX_CONCURRENCY = 1
+    # Calendar whose all day events are the holidays of the organization (i.e. a Google public holidays calendar),
+    # empty for none. Holidays and working hours of the users are kept per worker for WORKING_HOURS_MAX_AGE seconds
+    HOLIDAY_CALENDAR_ID = ''
+    WORKING_HOURS_MAX_AGE = 6 * 3600
+
     # Open API Config
     OPENAPI_VERSION = "3.0.2"
     OPENAPI_JSON_PATH = "api-spec.json"
@@ -1,84 +1,31 @@
-import datetime
-import json
-import logging
-import os
-
-import msal
-from google.oauth2 import service_account
 from flask import abort
 from loguru import logger
 
 from app.calendar_class import DOMAIN
+from app.services.google_credentials import get_google_credential_manager
+from app.services.office_credentials import get_office_token_provider
 
 
 def get_service_credentials():
-    """Get service account credentials from google api or raise ValueError"""
-    scopes = ['https://www.googleapis.com/auth/calendar',
-              'https://www.googleapis.com/auth/admin.directory.user']
-
-    CREDENTIALS_FILE_NAME = 'service_credentials.json'
-    if os.path.exists(CREDENTIALS_FILE_NAME):
-        return service_account.Credentials.from_service_account_file(
-            'service_credentials.json',
-            scopes=scopes
-        )
-    else:
-        raise ValueError(f'Invalid credentials, check if {CREDENTIALS_FILE_NAME} exists on {os.getcwd()}')
-
-
-OFFICE_CONFIG = {
-    "client_id": os.getenv('OFFICE_CLIENT_ID', 'MISSING_KEY'),
-    "secret": os.getenv('OFFICE_SECRET', 'MISSING_KEY'),
-    "authority": f"https://login.microsoftonline.com/{os.getenv('OFFICE_TENANT_ID', 'MISSING_KEY')}",
-    "scope": ["https://graph.microsoft.com/.default"]  # Default means those registered within app.
-}
+    """Get service account credentials from google api or raise ValueError
 
-
-def _get_token_from_office():
-    logger.info('Trying to create a new instance of a client app')
-    client = msal.ConfidentialClientApplication(
-        OFFICE_CONFIG["client_id"],
-        authority=OFFICE_CONFIG["authority"],
-        client_credential=OFFICE_CONFIG["secret"],
-        validate_authority=False
-    )
-    logger.info('Trying to get a new token with the client app')
-    result = client.acquire_token_silent(OFFICE_CONFIG["scope"], account=None)
-    if not result:
-        logging.info("No suitable token exists in cache. Let's get a new one from AAD.")
-        result = client.acquire_token_for_client(scopes=OFFICE_CONFIG["scope"])
-
-    assert 'access_token' in result, f"Error authenticating against office API. Response:\n{result}"
-    dt = datetime.datetime.utcnow() + datetime.timedelta(seconds=result['expires_in'])
-    result['expires_datetime'] = dt.isoformat()
-    with open('token.json', 'w') as write_file:
-        json.dump(result, write_file)
-    return result
+    The account is loaded once per process and its delegated tokens are cached,
+    see app.services.google_credentials
+    """
+    return get_google_credential_manager()
 
 
 def get_office_credentials():
+    """Get the Graph token provider or raise ValueError
+
+    The token is kept in memory and refreshed before it expires, see app.services.office_credentials
+    """
     try:
-        if os.path.exists('token.json'):
-            logger.info('Checking existing credentials')
-            with open('token.json', "r") as read_file:
-                token = json.load(read_file)
-            if token.get('token_type') == 'Bearer':
-                if (datetime.datetime.utcnow()
-                        < datetime.datetime.fromisoformat(token.get('expires_datetime'))):
-                    return token
-                else:
-                    logger.info('Token expired, trying to get a new one')
-                    token = _get_token_from_office()
-                    return token
-            else:
-                logger.info('Invalid token, trying to get a new one')
-                token = _get_token_from_office()
-                return token
-        else:
-            logger.info('Token not found, trying to get a valid token')
-            token = _get_token_from_office()
-            return token
-    except Exception():
+        provider = get_office_token_provider()
+        provider.token()
+        return provider
+    except Exception as err:
+        logger.error(f'Could not get an office token: {err}')
         raise ValueError(f'Invalid credentials, check if the Office credentials are set on .env file')
 
 
@@ -1,8 +1,10 @@
+from typing import Optional
+
 from loguru import logger
 
 from app.api_credentials import get_service_credentials_or_abort_with_http_500
 from app.blueprints.helpers import get_model_by_id
-from app.calendar_class import CalendarManager
+from app.calendar_class import CalendarManager, EventLocator
 from app.persistence.models import Box
 
 
@@ -28,13 +30,31 @@ def create_all_date_event(email, box_id, start, end):
     )
 
 
-def delete_event(email, event_id):
+def delete_event(email, event_id, locator: Optional[EventLocator] = None, attendees: Optional[list[str]] = None):
     cred = get_service_credentials_or_abort_with_http_500()
     cman = CalendarManager(config=cred)
-    cman.delete_event_for_all_users(email, event_id)
+    cman.delete_event_for_all_users(email, event_id, locator, attendees)
 
 
-def get_event_meet_url_from_api(email, event_id):
+def get_event_meet_url_from_api(email, event_id, locator: Optional[EventLocator] = None):
     cred = get_service_credentials_or_abort_with_http_500()
     cman = CalendarManager(config=cred)
-    return cman.get_event_meet_url(email, event_id)
+    return cman.get_event_meet_url(email, event_id, locator)
+
+
+def get_event_locator(event_id, model) -> Optional[EventLocator]:
+    """Locator stored on a Meeting or Reservation, None for rows not backfilled yet"""
+    if not model.provider_event_id:
+        return None
+    return EventLocator(
+        event_id=event_id,
+        provider_event_id=model.provider_event_id,
+        calendar_id=model.event_calendar_id,
+        organizer=model.event_organizer
+    )
+
+
+def set_event_locator(model, locator: Optional[EventLocator]):
+    model.provider_event_id = locator.provider_event_id if locator else None
+    model.event_calendar_id = locator.calendar_id if locator else None
+    model.event_organizer = locator.organizer if locator else None
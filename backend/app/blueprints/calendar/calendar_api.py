@@ -1,16 +1,17 @@
 import dataclasses
 import os
-import random
 from datetime import datetime
 from pathlib import Path
 from string import Template
 from typing import Optional
 
-from flask import jsonify, redirect
+from flask import current_app, jsonify, redirect
 from flask_login import current_user, login_required
 from flask_smorest import Blueprint
+from loguru import logger
 
 from app.api_credentials import get_service_credentials_or_abort_with_http_500
+from app.blueprints.api_extra_functions import set_event_locator
 from app.blueprints.email_sender import send_email
 from app.blueprints.helpers import (
     ok,
@@ -25,7 +26,7 @@ from app.blueprints.meeting.meeting_blueprint import MeetingAPI
 from app.blueprints.meeting_request.meeting_request_blueprint import MeetingRequestAPI
 from app.blueprints.meeting_request_user.meeting_request_user_blueprint import MeetingRequestUserAPI
 from app.blueprints.meeting_user.meeting_user_blueprint import MeetingUserAPI
-from app.calendar_class import CalendarManager, DOMAIN_ADMIN_ACC
+from app.calendar_class import BusySlotsUnavailable, CalendarManager, DOMAIN_ADMIN_ACC
 from app.persistence.models.meeting_model import Meeting
 from app.persistence.models.meeting_request_model import MeetingRequest
 from app.persistence.models.meeting_request_user_model import MeetingRequestUser
@@ -33,17 +34,22 @@ from app.persistence.models.meeting_room_model import MeetingRoom
 from app.persistence.models.meeting_user_model import MeetingUser
 from app.persistence.models.user_model import User
 from app.persistence.session import get_session
+from app.services.directory_cache import find_directory_users, get_directory_users
+from app.services.working_hours import get_holidays, get_working_hours
+from app.task_queue.tasks import ORGANIZE_MEETING_JOB_TIMEOUT, organize_meeting as organize_meeting_task
 from .schemas import (
     QueryInputGetSlots,
     QueryInputPostOrganizeMeeting,
     QueryInputPostOrganizeMeetingConfirm,
     QueryInputPostOrganizeMeetingCancel,
+    QueryInputPostOrganizeMeetingReject,
     QueryInputEmailAccept,
     QueryInputEmailDecline,
     OrganizeMeetingIdResponse,
     OrganizeMeetingConfirmResponse,
     OrganizeMeetingListResponse,
     OrganizeMeetingSchema,
+    OrganizeMeetingTaskResponse,
     SlotsResponse,
     ParticipantsListResponse,
     ParticipantsSchema,
@@ -57,6 +63,9 @@ from .schemas import (
 
 bp = Blueprint('Calendar', __name__, description='Interact with Calendar api')
 
+# Weight of how much bigger than needed a room is in the score of a meeting slot, see TimeGrid.ranked_starts
+ROOM_FIT_WEIGHT = 1.0
+
 
 @dataclasses.dataclass
 class MeetingOption:
@@ -92,15 +101,7 @@ class MeetingOption:
 def get_participants():
     config = get_service_credentials_or_abort_with_http_500()
     cman = CalendarManager(config=config)
-    users = cman.get_users()
-    data = [
-        {
-            'name': user['name']['fullName'],
-            'email': user['primaryEmail']
-        }
-        for user in users
-        if user['primaryEmail'] != DOMAIN_ADMIN_ACC
-    ]
+    data = [user for user in get_directory_users(cman) if user['email'] != DOMAIN_ADMIN_ACC]
     return ok(ParticipantsListResponse().dump(
         {"data": ParticipantsSchema().dump(data, many=True)})
     )
@@ -117,13 +118,17 @@ def get_busy_slots(get_args):
     args = _parse_calendar_args(get_args)
     config = get_service_credentials_or_abort_with_http_500()
     cman = CalendarManager(config=config)
-    slots_response = cman.get_busy_slots_for_calendar(
-        args['email'],
-        args['cal_id'],
-        args['start'],
-        args['end'],
-        tz=cman.BS_AS_TIMEZONE
-    )
+    cal_id = args['cal_id'] or args['email']
+    try:
+        slots_response = cman.get_busy_slots_for_calendars(
+            [cal_id],
+            args['start'],
+            args['end'],
+            tz=cman.BS_AS_TIMEZONE,
+            email=args['email']
+        )[cal_id]
+    except BusySlotsUnavailable as err:
+        return _busy_slots_unavailable(err)
     busy_slots = [slot.to_dict() for slot in slots_response]
     return ok(SlotsResponse().dump(
         {"data": SlotsSchema().dump(busy_slots, many=True)})
@@ -141,12 +146,15 @@ def get_free_slots(get_args):
     args = _parse_calendar_args(get_args)
     config = get_service_credentials_or_abort_with_http_500()
     cman = CalendarManager(config=config)
-    free_slots_response = cman.get_free_slots_for_calendar(
-        args['email'],
-        args['cal_id'],
-        args['start'],
-        args['end']
-    )
+    try:
+        free_slots_response = cman.get_free_slots_for_calendar(
+            args['email'],
+            args['cal_id'],
+            args['start'],
+            args['end']
+        )
+    except BusySlotsUnavailable as err:
+        return _busy_slots_unavailable(err)
     free_slots = [slot.to_dict() for slot in free_slots_response]
     return ok(SlotsResponse().dump(
         {"data": SlotsSchema().dump(free_slots, many=True)})
@@ -193,26 +201,20 @@ def get_calendar_for_user_json(email, cal_id):
 @login_required
 @bp.arguments(QueryInputPostOrganizeMeeting)
 @bp.response(200, OrganizeMeetingListResponse())
+@bp.alt_response(202, OrganizeMeetingTaskResponse())
 def generate_meeting_multiple_calendars(args):
     """Coordinate meeting between multiple calendars
     ---
     Devuelve una reunion creada y agrega el evento al calendario de los usuarios
-    La duracion de la reunion tiene que ser multiplo de 5"""
+    La duracion de la reunion tiene que ser multiplo de 5
+    Con run_async la busqueda se encola y se devuelve el id de la solicitud y de la tarea,
+    el progreso y las opciones se consultan en /task/<task_id>"""
     me: User = current_user
-    data = []
-    attendees = args['emails'].copy()
-    attendees_without_org = args['emails'].copy()
-    if me.email in attendees:
-        organizer = me.email
-    else:
-        organizer = attendees[0]
-    attendees_without_org.remove(organizer)
     config = get_service_credentials_or_abort_with_http_500()
     cman = CalendarManager(config=config)
-    users = cman.get_users()
     users_by_email = {
-        user['primaryEmail']: user['name']['fullName']
-        for user in users
+        email: user['name']
+        for email, user in find_directory_users(cman, args['emails']).items()
     }
     s = get_session()
     users_from_db = s.query(User.email).filter(User.deleted_at.is_(None)).all()
@@ -227,109 +229,6 @@ def generate_meeting_multiple_calendars(args):
     s.add_all(users_to_db)
     s.commit()
 
-    kind = "ok"
-    missing_features = {}
-    slot_list = []
-    slot_list_conf = []
-    meeting_room_id = None
-    meeting_room_id_conf = None
-    meeting_room = None
-    conflicting_member = {}
-    if args['meeting_room_type'] != 'virtual':
-        meeting_rooms = _filter_meeting_rooms(args['features'], args['emails'], args['building_id'])
-        slot_list, meeting_room_id = _found_available_room(
-            cman=cman,
-            meeting_rooms=meeting_rooms.copy(),
-            emails=args['emails'],
-            start=args['start'],
-            end=args['end'],
-            time_start=args['time_start'],
-            time_end=args['time_end'],
-            duration=args['duration'],
-            timezone=args['timezone']
-        )
-        if not meeting_room_id:
-            for a in attendees_without_org:
-                attendees.remove(a)
-                slot_list_conf, meeting_room_id_conf = _found_available_room(
-                    cman=cman,
-                    meeting_rooms=meeting_rooms.copy(),
-                    emails=attendees,
-                    start=args['start'],
-                    end=args['end'],
-                    time_start=args['time_start'],
-                    time_end=args['time_end'],
-                    duration=args['duration'],
-                    timezone=args['timezone']
-                )
-                if meeting_room_id_conf:
-                    conflicting_member = {
-                        'name': get_model_by_email(a).name,
-                        'email': a
-                    }
-                    break
-                else:
-                    attendees.append(a)
-
-            kind = "missing_features"
-            meeting_rooms = get_session().query(MeetingRoom).filter(
-                MeetingRoom.capacity >= len(args['emails']),
-                MeetingRoom.deleted_at.is_(None),
-                MeetingRoom.building_id == args['building_id']
-            ).all()
-            slot_list, meeting_room_id = _found_available_room(
-                cman=cman,
-                meeting_rooms=meeting_rooms.copy(),
-                emails=args['emails'],
-                start=args['start'],
-                end=args['end'],
-                time_start=args['time_start'],
-                time_end=args['time_end'],
-                duration=args['duration'],
-                timezone=args['timezone']
-            )
-            if meeting_room_id:
-                missing_features = _get_missing_features(meeting_room_id, args['features'])
-    elif args['meeting_room_type'] == 'virtual':
-        slot_list = cman.organize_meeting(
-            cals=args['emails'],
-            start=args['start'],
-            end=args['end'],
-            time_start=args['time_start'],
-            time_end=args['time_end'],
-            duration=args['duration'],
-            meeting_room=args['meeting_room_type'],
-            tz=args['timezone']
-        )
-        if not slot_list:
-            for a in attendees_without_org:
-                attendees.remove(a)
-                slot_list_conf = cman.organize_meeting(
-                    cals=attendees,
-                    start=args['start'],
-                    end=args['end'],
-                    time_start=args['time_start'],
-                    time_end=args['time_end'],
-                    duration=args['duration'],
-                    meeting_room=args['meeting_room_type'],
-                    tz=args['timezone']
-                )
-                if slot_list_conf:
-                    conflicting_member = {
-                        'name': get_model_by_email(a).name,
-                        'email': a
-                    }
-                    break
-                else:
-                    attendees.append(a)
-
-    slots_found = [slot.to_dict() for slot in slot_list]
-    slots_found_conf = [slot.to_dict() for slot in slot_list_conf]
-
-    if slots_found or slots_found_conf:
-        status = status_meeting_request['in_process']
-    else:
-        status = status_meeting_request['no_results']
     cond_dict = {
         "start": args['start'].isoformat(),
         "end": args['end'].isoformat(),
@@ -338,12 +237,16 @@ def generate_meeting_multiple_calendars(args):
         "timezone": args['timezone'],
         "duration": args['duration'],
         "emails": args['emails'],
-        "meeting_room_type": args['meeting_room_type']
+        "meeting_room_type": args['meeting_room_type'],
+        "preferred_time": args['preferred_time'].isoformat(timespec='minutes') if args['preferred_time'] else None,
+        "options_count": args['options_count'],
+        "min_attendees": args['min_attendees'],
+        "required_emails": args['required_emails']
     }
     meeting_request_to_db = {
         "user_id": me.id,
         "conditions": cond_dict,
-        "status": status,
+        "status": status_meeting_request['computing'],
     }
     resp_meeting_request_dict = _add_request_to_db(class_=MeetingRequestAPI, args=meeting_request_to_db)
     users = get_models_by_email_list(args['emails'], User, "User")
@@ -355,31 +258,203 @@ def generate_meeting_multiple_calendars(args):
         for user in users
     ]
     _add_request_to_db(class_=MeetingRequestUserAPI, args=meeting_request_users_to_db)
-    if slots_found:
+
+    if args['run_async']:
+        mr = get_model_by_id(resp_meeting_request_dict['id'], MeetingRequest, "meeting_request")
+        try:
+            job = current_app.task_queue.enqueue(
+                organize_meeting_task,
+                args=(resp_meeting_request_dict['id'], me.email, args),
+                job_timeout=ORGANIZE_MEETING_JOB_TIMEOUT
+            )
+        except Exception as err:
+            logger.error(f'Meeting request {mr.id} could not be enqueued: {err}')
+            mr.status = status_meeting_request['failed']
+            s.commit()
+            return jsonify({"errors": "No se pudo iniciar la busqueda de la reunion, intente nuevamente."}), 503
+        mr.task_id = job.id
+        s.commit()
+        return ok(OrganizeMeetingTaskResponse().dump({"data": {
+            "meeting_request_id": mr.id,
+            "task_id": job.id,
+            "status": mr.status
+        }}), status=202)
+
+    try:
+        data = compute_meeting_options(cman, resp_meeting_request_dict['id'], me.email, args)
+    except Exception:
+        s.rollback()
+        mr = get_model_by_id(resp_meeting_request_dict['id'], MeetingRequest, "meeting_request")
+        # The search failed, it doesn't mean there's no slot
+        mr.status = status_meeting_request['failed']
+        s.commit()
+        raise
+    return ok(OrganizeMeetingListResponse().dump({"data": data}))
+
+
+def compute_meeting_options(cman, meeting_request_id, requester_email, args, progress=None):
+    """Search the meeting options for an already created MeetingRequest.
+
+    Up to options_count slots where everybody can meet are kept, best first (see
+    _found_available_rooms), or else the ones with quorum if the request has min_attendees or
+    required_emails (kind "quorum", the absentees are in members_conflicts), or else the options
+    where one attendee can't make it. Slots outside of the working hours of an attendee or on a
+    holiday of the organization are never offered.
+    The options are stored on the MeetingRequest (so confirming or rejecting one of them doesn't
+    need to search again) and returned as OrganizeMeetingSchema dumps.
+    Used by POST /organizemeeting and by the background job of its async mode, `progress`
+    is called with (step, percent) as the search moves on.
+    """
+    progress = progress or (lambda step, percent: None)
+    data = []
+    attendees_without_org = args['emails'].copy()
+    if requester_email in attendees_without_org:
+        organizer = requester_email
+    else:
+        organizer = attendees_without_org[0]
+    attendees_without_org.remove(organizer)
+
+    kind = "ok"
+    # (slot_list, meeting_room_id) of the options where everybody can meet, best first
+    slot_options = []
+    conflict_options = []
+    ranking = {'count': args['options_count'], 'preferred_time': args['preferred_time']}
+    quorum = _quorum(args, organizer)
+    progress('loading_availability', 10)
+    # Nobody is offered a slot outside of their working hours or on a holiday
+    calendar_rules = {
+        'working_hours': get_working_hours(cman, args['emails']),
+        'holidays': get_holidays(cman, args['start'], args['end']),
+    }
+    if args['meeting_room_type'] != 'virtual':
+        building_meeting_rooms = _get_building_meeting_rooms(len(args['emails']), args['building_id'])
+        meeting_rooms = _filter_meeting_rooms(args['features'], building_meeting_rooms)
+        availability = cman.load_availability(
+            cals=args['emails'],
+            meeting_rooms=[meeting_room.calendar for meeting_room in building_meeting_rooms],
+            start=args['start'],
+            end=args['end'],
+            time_start=args['time_start'],
+            time_end=args['time_end'],
+            tz=args['timezone'],
+            **calendar_rules
+        )
+        progress('searching_slots', 60)
+        slot_options = _found_available_rooms(
+            cman=cman,
+            availability=availability,
+            meeting_rooms=meeting_rooms,
+            emails=args['emails'],
+            duration=args['duration'],
+            **ranking
+        )
+        if not slot_options and quorum:
+            progress('searching_quorum', 70)
+            kind = "quorum"
+            slot_options = _found_quorum_options(
+                cman=cman,
+                availability=availability,
+                meeting_rooms=meeting_rooms,
+                emails=args['emails'],
+                quorum=quorum,
+                duration=args['duration'],
+                **ranking
+            )
+        if not slot_options:
+            progress('searching_conflicts', 75)
+            conflict_options = _found_conflict_options(
+                cman=cman,
+                availability=availability,
+                meeting_rooms=meeting_rooms,
+                emails=args['emails'],
+                excusable=attendees_without_org,
+                duration=args['duration']
+            )
+
+            kind = "missing_features"
+            slot_options = _found_available_rooms(
+                cman=cman,
+                availability=availability,
+                meeting_rooms=building_meeting_rooms,
+                emails=args['emails'],
+                duration=args['duration'],
+                **ranking
+            )
+    elif args['meeting_room_type'] == 'virtual':
+        availability = cman.load_availability(
+            cals=args['emails'],
+            meeting_rooms=[],
+            start=args['start'],
+            end=args['end'],
+            time_start=args['time_start'],
+            time_end=args['time_end'],
+            tz=args['timezone'],
+            **calendar_rules
+        )
+        progress('searching_slots', 60)
+        slot_options = [
+            ([slot], None)
+            for slot in cman.find_ranked_meeting_slots(
+                availability=availability, cals=args['emails'], duration=args['duration'], **ranking
+            )
+        ]
+        if not slot_options and quorum:
+            progress('searching_quorum', 70)
+            kind = "quorum"
+            slot_options = _found_quorum_options(
+                cman=cman,
+                availability=availability,
+                meeting_rooms=[],
+                emails=args['emails'],
+                quorum=quorum,
+                duration=args['duration'],
+                **ranking
+            )
+        if not slot_options:
+            progress('searching_conflicts', 75)
+            conflict_options = _found_conflict_options(
+                cman=cman,
+                availability=availability,
+                meeting_rooms=[],
+                emails=args['emails'],
+                excusable=attendees_without_org,
+                duration=args['duration']
+            )
+
+    progress('saving_options', 90)
+    for slot_list, meeting_room_id in slot_options:
+        slot_found = slot_list[0].to_dict()
+        meeting_room = None
+        missing_features = {}
         if meeting_room_id:
             meeting_room = get_model_by_id(meeting_room_id, MeetingRoom, "Meeting Room").to_dict()
+            if kind == "missing_features":
+                missing_features = _get_missing_features(meeting_room_id, args['features'])
         option_ok_or_missing_features = MeetingOption(
             kind=kind,
             emails=args['emails'],
-            meeting_request_id=resp_meeting_request_dict['id'],
+            meeting_request_id=meeting_request_id,
             meeting_room_type=args['meeting_room_type'],
             meeting_room=meeting_room,
-            start=slots_found[0]['start'],
-            end=slots_found[0]['end'],
+            start=slot_found['start'],
+            end=slot_found['end'],
             duration=args['duration'],
             missing_features=missing_features,
-            members_conflicts=[]
+            members_conflicts=[_participant(email) for email in slot_list[0].absentees]
         )
         data.append(option_ok_or_missing_features.to_dict())
-    if slots_found_conf:
+    for slot_list_conf, meeting_room_id_conf, conflicting_email in conflict_options:
+        slots_found_conf = [slot.to_dict() for slot in slot_list_conf]
+        meeting_room_conf = None
         if meeting_room_id_conf:
-            meeting_room = get_model_by_id(meeting_room_id_conf, MeetingRoom, "Meeting Room").to_dict()
+            meeting_room_conf = get_model_by_id(meeting_room_id_conf, MeetingRoom, "Meeting Room").to_dict()
+        conflicting_member = _participant(conflicting_email)
         option_conflicts = MeetingOption(
             kind="conflicts",
             emails=args['emails'],
-            meeting_request_id=resp_meeting_request_dict['id'],
+            meeting_request_id=meeting_request_id,
             meeting_room_type=args['meeting_room_type'],
-            meeting_room=meeting_room,
+            meeting_room=meeting_room_conf,
             start=slots_found_conf[0]['start'],
             end=slots_found_conf[0]['end'],
             duration=args['duration'],
@@ -388,9 +463,16 @@ def generate_meeting_multiple_calendars(args):
         )
         data.append(option_conflicts.to_dict())
 
-    return ok(OrganizeMeetingListResponse().dump(
-        {"data": OrganizeMeetingSchema().dump(data, many=True)})
-    )
+    options = OrganizeMeetingSchema().dump(data, many=True)
+    mr = get_model_by_id(meeting_request_id, MeetingRequest, "meeting_request")
+    mr.options = options
+    if options:
+        mr.status = status_meeting_request['in_process']
+    else:
+        mr.status = status_meeting_request['no_results']
+    get_session().commit()
+    progress('done', 100)
+    return options
 
 
 @bp.route('/organizemeeting/confirm', methods=['POST'])
@@ -400,8 +482,14 @@ def generate_meeting_multiple_calendars(args):
 def confirm_meeting_request(args):
     """Confirm the meeting request between multiple calendars
         ---
-        Devuelve una reunion creada y agrega el evento al calendario de los usuarios"""
+        Devuelve una reunion creada y agrega el evento al calendario de los usuarios
+        Con option_index se confirma una de las opciones guardadas en la solicitud"""
     me: User = current_user
+    if args['option_index'] is not None:
+        mr = _get_own_meeting_request(args['meeting_request_id'], me)
+        if mr is None:
+            return _meeting_request_not_found(args['meeting_request_id'])
+        args = _args_from_stored_option(args, mr)
     attendees = args['emails']
     if me.email in attendees:
         organizer = me.email
@@ -412,8 +500,10 @@ def confirm_meeting_request(args):
     mr = get_model_by_id(args['meeting_request_id'], MeetingRequest, "meeting_request")
     mr.summary = args['summary']
     get_session().commit()
+    # Timezone of the request, so the providers don't have to guess it from the offset
+    tz = (mr.conditions or {}).get('timezone')
     if args.get('members_conflicts'):
-        _build_email_for_member(args, me.name, me.email, organizer)
+        _build_email_for_member(args, me.name, me.email, organizer, tz)
         return jsonify({"data": "Email enviado al miembro que tiene el conflicto."})
 
     data = _create_meeting(
@@ -427,11 +517,32 @@ def confirm_meeting_request(args):
         end=args['end'].isoformat(),
         description=args['description'],
         meeting_request_id=args['meeting_request_id'],
-        duration=args['duration']
+        duration=args['duration'],
+        tz=tz
     )
     return ok(OrganizeMeetingConfirmResponse().dump({"data": data}))
 
 
+@bp.route('/organizemeeting/reject', methods=['POST'])
+@login_required
+@bp.arguments(QueryInputPostOrganizeMeetingReject)
+@bp.response(200, OrganizeMeetingListResponse())
+def reject_meeting_option(args):
+    """Reject one of the options of a meeting request
+    ---
+    Devuelve las opciones que quedan, las que se calcularon al organizar la reunion, sin volver a
+    consultar los calendarios. Los indices de las opciones siguientes bajan en uno"""
+    mr = _get_own_meeting_request(args['meeting_request_id'], current_user)
+    if mr is None:
+        return _meeting_request_not_found(args['meeting_request_id'])
+    options = [option for index, option in enumerate(mr.options) if index != args['option_index']]
+    mr.options = options
+    if not options:
+        mr.status = status_meeting_request['no_results']
+    get_session().commit()
+    return ok(OrganizeMeetingListResponse().dump({"data": options}))
+
+
 @bp.route('/organizemeeting/cancel', methods=['POST'])
 @bp.arguments(QueryInputPostOrganizeMeetingCancel)
 @bp.response(200, OrganizeMeetingIdResponse())
@@ -465,7 +576,7 @@ def email_accept(args):
                 ).filter(MeetingUser.user_id == user.id).one_or_none()
                 if meeting_user_model:
                     delete_instance_by_id(meeting_user_model.id, MeetingUser, "Meeting User")
-            cman.delete_event(args.get('member_email'), e)
+        cman.delete_events(args.get('member_email'), events)
         requester_id = get_model_by_email(args.get('requester')).id
         if args['summary'] == "None" or args['summary'] == "":
             args['summary'] = 'Reunion Ofisino'
@@ -482,7 +593,8 @@ def email_accept(args):
             end=args['end'],
             description=args['description'],
             meeting_request_id=args['meeting_request_id'],
-            duration=mr.conditions['duration']
+            duration=mr.conditions['duration'],
+            tz=mr.conditions.get('timezone')
         )
     return redirect(os.environ.get('EP_MEETING'), code=302)
 
@@ -519,14 +631,57 @@ def email_decline(args):
     return redirect(os.environ.get('EP_MEETING'), code=302)
 
 
-def _filter_meeting_rooms(features, emails, building_id):
-    meeting_rooms = get_session().query(
+def _busy_slots_unavailable(err: BusySlotsUnavailable):
+    """The provider didn't answer for some calendars, the request can be retried"""
+    logger.warning(str(err))
+    return jsonify({"errors": {
+        cal_id: ["No se pudo consultar la disponibilidad del calendario, intente nuevamente."]
+        for cal_id in err.calendar_ids
+    }}), 503
+
+
+def _get_own_meeting_request(meeting_request_id, me: User) -> Optional[MeetingRequest]:
+    """The MeetingRequest if `me` requested it, its options have the attendees and times of the meeting"""
+    return get_session().query(MeetingRequest).filter(
+        MeetingRequest.id == meeting_request_id,
+        MeetingRequest.user_id == me.id,
+        MeetingRequest.deleted_at.is_(None)
+    ).one_or_none()
+
+
+def _meeting_request_not_found(meeting_request_id):
+    return jsonify({"errors": f"El id {meeting_request_id} de la tabla meeting_request no existe."}), 404
+
+
+def _args_from_stored_option(args, mr: MeetingRequest):
+    """Confirm args with the meeting slot of the option chosen among the stored ones"""
+    option = mr.options[args['option_index']]
+    return {
+        **args,
+        'emails': option['emails'],
+        'meeting_room_type': option['meeting_room_type'],
+        'meeting_room_id': option['meeting_room']['id'] if option.get('meeting_room') else None,
+        'start': datetime.fromisoformat(option['start']),
+        'end': datetime.fromisoformat(option['end']),
+        'duration': option['duration'],
+        # Absentees of a meeting with quorum are invited anyway, they aren't asked to free the slot
+        'members_conflicts': [
+            member['email'] for member in option['members_conflicts']
+        ] if option.get('kind') != 'quorum' else [],
+    }
+
+
+def _get_building_meeting_rooms(attendees_count, building_id):
+    return get_session().query(
         MeetingRoom
     ).filter(
-        MeetingRoom.capacity >= len(emails),
+        MeetingRoom.capacity >= attendees_count,
         MeetingRoom.deleted_at.is_(None),
         MeetingRoom.building_id == building_id
     ).all()
+
+
+def _filter_meeting_rooms(features, meeting_rooms):
     valid_meeting_rooms = []
     for meeting_room in meeting_rooms:
         valid = True
@@ -540,24 +695,129 @@ def _filter_meeting_rooms(features, emails, building_id):
     return valid_meeting_rooms
 
 
-def _found_available_room(cman, meeting_rooms, emails, start, end, time_start, time_end, duration, timezone):
-    max_loop = len(meeting_rooms)
-    for i in range(max_loop):
-        meeting_room = random.choice(meeting_rooms)
-        meeting_rooms.remove(meeting_room)
-        slot_list = cman.organize_meeting(
-            cals=emails,
-            start=start,
-            end=end,
-            time_start=time_start,
-            time_end=time_end,
-            duration=duration,
-            meeting_room=meeting_room.calendar,
-            tz=timezone
-        )
-        if slot_list:
-            return slot_list, meeting_room.id
-    return [], None
+def _found_available_rooms(cman, availability, meeting_rooms, emails, duration, count, preferred_time=None):
+    """Up to `count` (slot_list, meeting_room_id) where all `emails` can meet, best first.
+
+    Every room is evaluated against the already loaded availability, no provider calls here.
+    The slots of each room are scored (see TimeGrid.ranked_starts) plus how much bigger than
+    needed the room is, and the best ones that don't overlap in time are kept, each with its room.
+    Ties go to the earliest slot and then to the lowest room id so the choice is deterministic.
+    """
+    slots_by_room = cman.find_ranked_meeting_slots_by_room(
+        availability=availability,
+        cals=emails,
+        meeting_rooms=[meeting_room.calendar for meeting_room in meeting_rooms],
+        duration=duration,
+        count=count,
+        preferred_time=preferred_time
+    )
+    return _best_slot_options(slots_by_room, meeting_rooms, len(emails), count)
+
+
+def _found_quorum_options(cman, availability, meeting_rooms, emails, quorum, duration, count, preferred_time=None):
+    """Up to `count` (slot_list, meeting_room_id) where the `quorum` of `emails` can meet, best first.
+
+    The absentees of each slot are in its `absentees`. Ranked as _found_available_rooms.
+    """
+    required, min_attendees = quorum
+    slots_by_room = cman.find_quorum_meeting_slots(
+        availability=availability,
+        cals=emails,
+        required=required,
+        min_attendees=min_attendees,
+        meeting_rooms=[meeting_room.calendar for meeting_room in meeting_rooms],
+        duration=duration,
+        count=count,
+        preferred_time=preferred_time
+    )
+    if not meeting_rooms:
+        return [([slot], None) for slot in slots_by_room[None]]
+    return _best_slot_options(slots_by_room, meeting_rooms, len(emails), count)
+
+
+def _best_slot_options(slots_by_room, meeting_rooms, attendees_count, count):
+    """Up to `count` (slot_list, meeting_room_id) among the ranked slots of every room, best first"""
+    candidates = sorted(
+        (
+            (slot.score + ROOM_FIT_WEIGHT * _room_fit(meeting_room, attendees_count), slot.start, meeting_room.id, slot)
+            for meeting_room in meeting_rooms
+            for slot in slots_by_room[meeting_room.calendar]
+        ),
+        key=lambda candidate: candidate[:3]
+    )
+    options = []
+    for _, _, meeting_room_id, slot in candidates:
+        if all(slot.end <= other.start or slot.start >= other.end for [other], _ in options):
+            options.append(([slot], meeting_room_id))
+            if len(options) == count:
+                break
+    return options
+
+
+def _quorum(args, organizer):
+    """(required emails, min attendees) if the meeting can go on without some attendees, else None.
+
+    The organizer is always required. Without min_attendees every required email is enough.
+    """
+    if args['min_attendees'] is None and not args['required_emails']:
+        return None
+    required = list(dict.fromkeys([organizer, *(args['required_emails'] or [])]))
+    return required, max(args['min_attendees'] or 0, len(required), 2)
+
+
+def _participant(email):
+    return {'name': get_model_by_email(email).name, 'email': email}
+
+
+def _room_fit(meeting_room, attendees_count):
+    """Share of the room left empty, 0 when it's the exact size"""
+    return (meeting_room.capacity - attendees_count) / meeting_room.capacity
+
+
+def _best_room(candidates, attendees_count):
+    """Smallest room that fits, then earliest slot, then lowest id. `candidates` are (room, slot_list)"""
+    return min(
+        candidates,
+        key=lambda candidate: (candidate[0].capacity - attendees_count, candidate[1][0].start, candidate[0].id)
+    )
+
+
+def _found_conflict_options(cman, availability, meeting_rooms, emails, excusable, duration):
+    """Options where a single attendee of `excusable` can't make it, best first.
+
+    Every attendee is excused in one pass over the loaded availability. For each one the
+    earliest slot (and best room) left for everybody else is kept, then the options are ranked
+    by how few events of the excused attendee they overlap, and then by earliest start.
+    Returns a list of (slot_list, meeting_room_id, excused email).
+    """
+    slots_by_attendee = cman.find_meeting_slots_excusing_attendee(
+        availability=availability,
+        cals=emails,
+        excusable=excusable,
+        meeting_rooms=[meeting_room.calendar for meeting_room in meeting_rooms],
+        duration=duration
+    )
+    options = []
+    for email in excusable:
+        slots_by_room = slots_by_attendee[email]
+        if meeting_rooms:
+            candidates = [
+                (meeting_room, slots_by_room[meeting_room.calendar])
+                for meeting_room in meeting_rooms
+                if slots_by_room[meeting_room.calendar]
+            ]
+            if not candidates:
+                continue
+            meeting_room, slot_list = _best_room(candidates, len(emails))
+            meeting_room_id = meeting_room.id
+        else:
+            slot_list, meeting_room_id = slots_by_room[None], None
+            if not slot_list:
+                continue
+        displaced = availability.count_busy_slots(email, slot_list[0].start, slot_list[0].end)
+        options.append((displaced, slot_list[0].start, slot_list, meeting_room_id, email))
+    options.sort(key=lambda option: option[:2])
+    return [(slot_list, meeting_room_id, email) for _, _, slot_list, meeting_room_id, email in options]
 
 
 def _get_missing_features(meeting_room_id, requested_features):
@@ -581,7 +841,8 @@ def _create_meeting(
         end: str,
         description: str,
         meeting_request_id: int,
-        duration: int
+        duration: int,
+        tz: Optional[str] = None
 ):
     config = get_service_credentials_or_abort_with_http_500()
     cman = CalendarManager(config=config)
@@ -590,7 +851,7 @@ def _create_meeting(
         meeting_room_calendar_id = get_model_by_id(meeting_room_id, MeetingRoom, "meeting_room").calendar
     else:
         meeting_room_calendar_id = None
-    event_id = cman.create_event(
+    locator = cman.create_event(
         email=organizer,
         calendar_id=organizer,
         event_summary=summary,
@@ -599,7 +860,8 @@ def _create_meeting(
         event_description=description,
         event_attendees=attendees,
         meeting_room_type=meeting_room_type,
-        meeting_room_calendar_id=meeting_room_calendar_id
+        meeting_room_calendar_id=meeting_room_calendar_id,
+        tz=tz
     )
     meeting_to_db = {
         "user_id": requester_id,
@@ -609,9 +871,10 @@ def _create_meeting(
         "duration": duration,
         "description": description,
         "summary": summary,
-        "event": event_id
+        "event": locator.event_id if locator else None
     }
     resp_meeting_dict = _add_request_to_db(class_=MeetingAPI, args=meeting_to_db)
+    set_event_locator(get_model_by_id(resp_meeting_dict['id'], Meeting, "Meeting"), locator)
     meeting_users_to_db = [
         {
             "meeting_id": resp_meeting_dict['id'],
@@ -626,7 +889,7 @@ def _create_meeting(
     return resp_meeting_dict
 
 
-def _build_email_for_member(args, requester_name, requester_email, organizer):
+def _build_email_for_member(args, requester_name, requester_email, organizer, tz=None):
     email_to = args.get('members_conflicts')[0]
     member = get_model_by_email(email_to)
     member_name = member.name
@@ -636,7 +899,8 @@ def _build_email_for_member(args, requester_name, requester_email, organizer):
     events = cman.get_events_between_time(
         email=email_to,
         start=args.get('start').isoformat(),
-        end=args.get('end').isoformat()
+        end=args.get('end').isoformat(),
+        tz=tz
     )
     events_ids_org = ""
     events_ids_mem = ""
@@ -667,7 +931,7 @@ def _build_email_for_member(args, requester_name, requester_email, organizer):
                                     .calendar)
     else:
         meeting_room_calendar_id = None
-    event_blocker_id = cman.create_event(
+    event_blocker = cman.create_event(
         email=DOMAIN_ADMIN_ACC,
         calendar_id=DOMAIN_ADMIN_ACC,
         event_summary="Posible futura reunión Ofisino",
@@ -676,7 +940,8 @@ def _build_email_for_member(args, requester_name, requester_email, organizer):
         event_end=args.get('end').isoformat(),
         event_attendees=args['emails'],
         meeting_room_type="placeholder",
-        meeting_room_calendar_id=meeting_room_calendar_id
+        meeting_room_calendar_id=meeting_room_calendar_id,
+        tz=tz
     )
     path = Path(__file__).resolve().parent.parent
     if os.environ.get('DOMAIN').casefold() == "GOOGLE".casefold():
@@ -700,7 +965,7 @@ def _build_email_for_member(args, requester_name, requester_email, organizer):
             events_org_summ=events_summ_org,
             events_mem=events_ids_mem,
             events_mem_summ=events_summ_mem,
-            event_blocker_id=event_blocker_id,
+            event_blocker_id=event_blocker.event_id if event_blocker else None,
             EP_EMAIL_ACCEPT=os.environ.get('EP_EMAIL_ACCEPT'),
             EP_EMAIL_DECLINE=os.environ.get('EP_EMAIL_DECLINE')
         )
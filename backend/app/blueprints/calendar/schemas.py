@@ -1,5 +1,5 @@
 from marshmallow import Schema, fields, validates, ValidationError, validates_schema
-from marshmallow.validate import Length, OneOf
+from marshmallow.validate import Length, OneOf, Range
 
 from app.blueprints.helpers import (
     get_model_by_id,
@@ -75,7 +75,7 @@ class OrganizeMeetingSchema(Schema):
     start = fields.String(required=True, error_messages=custom_error_messages)
     end = fields.String(required=True, error_messages=custom_error_messages)
     duration = fields.Int(required=True, error_messages=custom_error_messages)
-    kind = fields.String(validate=OneOf(["ok", "missing_features", "conflicts"]))
+    kind = fields.String(validate=OneOf(["ok", "missing_features", "quorum", "conflicts"]))
     missing_features = fields.Nested(FeaturesSchema, required=True, error_messages=custom_error_messages)
     members_conflicts = fields.List(
         fields.Nested(ParticipantsSchema, required=True, error_messages=custom_error_messages),
@@ -111,6 +111,26 @@ class QueryInputPostOrganizeMeeting(Schema):
     meeting_room_type = fields.String(required=True, error_messages=custom_error_messages)
     building_id = fields.Int(error_messages=custom_error_messages)
     features = fields.Nested(FeaturesSchema, required=False, error_messages=custom_error_messages)
+    run_async = fields.Boolean(required=False, missing=False, error_messages=custom_error_messages)
+    # Options where everybody can meet to offer, the best ones first. Rejecting one serves the next
+    options_count = fields.Int(
+        required=False,
+        missing=3,
+        strict=True,
+        validate=Range(min=1, max=10, error="Se pueden pedir entre 1 y 10 opciones."),
+        error_messages=custom_error_messages
+    )
+    # Time of the day the meeting should start closest to
+    preferred_time = fields.Time(required=False, missing=None, error_messages=custom_error_messages)
+    # Quorum: if everybody can't meet, the meeting can go on with at least min_attendees of the emails,
+    # required_emails (and the organizer) among them
+    min_attendees = fields.Int(required=False, missing=None, strict=True, error_messages=custom_error_messages)
+    required_emails = fields.List(
+        fields.String(required=True, error_messages=custom_error_messages),
+        required=False,
+        missing=None,
+        error_messages=custom_error_messages
+    )
 
     @validates_schema
     def check_building_id(self, data, **kwargs):
@@ -127,6 +147,17 @@ class QueryInputPostOrganizeMeeting(Schema):
         if data['duration'] % 5 != 0:
             raise ValidationError("La duracion no es multiplo de 5.")
 
+    @validates_schema
+    def check_quorum(self, data, **kwargs):
+        emails = data.get('emails') or []
+        not_invited = [email for email in data['required_emails'] or [] if email not in emails]
+        if not_invited:
+            raise ValidationError(
+                f"Los emails obligatorios tienen que estar entre los invitados: {', '.join(not_invited)}."
+            )
+        if data['min_attendees'] is not None and not 2 <= data['min_attendees'] <= len(emails):
+            raise ValidationError(f"La cantidad minima de asistentes tiene que estar entre 2 y {len(emails)}.")
+
 
 class QueryInputPostOrganizeMeetingConfirm(Schema):
     """meeting_room_type must be 'virtual' or another string representing a physical room"""
@@ -136,31 +167,63 @@ class QueryInputPostOrganizeMeetingConfirm(Schema):
         error_messages=custom_error_messages
     )
     summary = fields.String(required=False, missing=None, error_messages=custom_error_messages)
-    meeting_room_type = fields.String(required=True, error_messages=custom_error_messages)
+    meeting_room_type = fields.String(required=False, missing=None, error_messages=custom_error_messages)
     meeting_room_id = fields.Int(required=False, missing=None, error_messages=custom_error_messages)
-    start = fields.DateTime(required=True, error_messages=custom_error_messages)
-    end = fields.DateTime(required=True, error_messages=custom_error_messages)
+    start = fields.DateTime(required=False, missing=None, error_messages=custom_error_messages)
+    end = fields.DateTime(required=False, missing=None, error_messages=custom_error_messages)
     description = fields.String(required=True, error_messages=custom_error_messages)
     meeting_request_id = fields.Int(required=True, error_messages=custom_error_messages)
-    duration = fields.Int(required=True, strict=True, error_messages=custom_error_messages)
+    duration = fields.Int(required=False, missing=None, strict=True, error_messages=custom_error_messages)
     members_conflicts = fields.List(
         fields.String(required=True, error_messages=custom_error_messages),
         error_messages=custom_error_messages
     )
+    # Index of one of the options stored on the meeting request, replaces the fields of the meeting slot
+    option_index = fields.Int(required=False, missing=None, strict=True, error_messages=custom_error_messages)
 
     @validates("meeting_request_id")
     def check_meeting_request_id(self, meeting_request_id):
         get_model_by_id(meeting_request_id, MeetingRequest, "meeting_request")
 
+    @validates_schema
+    def check_option_or_slot(self, data, **kwargs):
+        if data['option_index'] is None:
+            missing = [
+                key
+                for key in ('meeting_room_type', 'start', 'end', 'duration')
+                if data[key] is None
+            ]
+            if missing:
+                raise ValidationError(f"Se necesita elegir una opcion o especificar: {', '.join(missing)}.")
+        else:
+            mr = get_model_by_id(data['meeting_request_id'], MeetingRequest, "meeting_request")
+            if not mr.options or not 0 <= data['option_index'] < len(mr.options):
+                raise ValidationError(
+                    f"La opcion {data['option_index']} de la solicitud {data['meeting_request_id']} no existe."
+                )
+
     @validates_schema
     def check_meeting_room_id(self, data, **kwargs):
-        if data['meeting_room_type'] != 'virtual':
+        if data['option_index'] is None and data['meeting_room_type'] != 'virtual':
             if data.get('meeting_room_id'):
                 get_model_by_id(data['meeting_room_id'], MeetingRoom, "meeting_room")
             else:
                 raise ValidationError("Si la reunión no es virtual se necesita especificar la sala.")
 
 
+class QueryInputPostOrganizeMeetingReject(Schema):
+    meeting_request_id = fields.Int(required=True, error_messages=custom_error_messages)
+    option_index = fields.Int(required=True, strict=True, error_messages=custom_error_messages)
+
+    @validates_schema
+    def check_option(self, data, **kwargs):
+        mr = get_model_by_id(data['meeting_request_id'], MeetingRequest, "meeting_request")
+        if not mr.options or not 0 <= data['option_index'] < len(mr.options):
+            raise ValidationError(
+                f"La opcion {data['option_index']} de la solicitud {data['meeting_request_id']} no existe."
+            )
+
+
 class QueryInputPostOrganizeMeetingCancel(Schema):
     meeting_request_id = fields.Int(required=True, error_messages=custom_error_messages)
 
@@ -217,6 +280,16 @@ class OrganizeMeetingListResponse(Schema):
     data = fields.List(fields.Nested(OrganizeMeetingSchema))
 
 
+class OrganizeMeetingTask(Schema):
+    meeting_request_id = fields.Int(required=True, error_messages=custom_error_messages)
+    task_id = fields.String(required=True, error_messages=custom_error_messages)
+    status = fields.String(required=True, error_messages=custom_error_messages)
+
+
+class OrganizeMeetingTaskResponse(Schema):
+    data = fields.Nested(OrganizeMeetingTask)
+
+
 class OrganizeMeetingConfirmResponse(Schema):
     data = fields.Nested(OrganizeMeetingConfirmSchema)
 
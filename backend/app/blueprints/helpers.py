@@ -36,8 +36,10 @@ custom_error_messages = {
 """Possible statuses of a meeting request"""
 status_meeting_request = {
     "pending": "Pendiente",
+    "computing": "Calculando",
     "in_process": "En proceso",
     "no_results": "Sin resultados",
+    "failed": "Fallida",
     "declined": "Rechazada",
     "accepted": "Aceptada",
     "cancelled": "Cancelada"
@@ -404,3 +406,13 @@ def validate_admin(func):
         return func(*args, **kwargs)
 
     return validate
+
+
+def get_organization_calendars() -> list[tuple[str, str]]:
+    """(owner email, calendar id) of the calendar of every user and meeting room"""
+    users = get_session().query(User.email).filter(User.deleted_at.is_(None)).all()
+    rooms = get_session().query(MeetingRoom.calendar).filter(MeetingRoom.deleted_at.is_(None)).all()
+    return (
+        [(user.email, user.email) for user in users]
+        + [(os.environ.get('DOMAIN_ADMIN_ACC'), room.calendar) for room in rooms]
+    )
@@ -6,7 +6,7 @@ from flask_login import current_user, login_required
 from flask_smorest import Blueprint
 from loguru import logger
 
-from app.blueprints.api_extra_functions import delete_event, get_event_meet_url_from_api
+from app.blueprints.api_extra_functions import delete_event, get_event_locator, get_event_meet_url_from_api
 from app.blueprints.helpers import (
     ok,
     get_model_by_id,
@@ -101,7 +101,9 @@ class MeetingAPI(MethodView):
         if meeting_room:
             meeting_json['meeting_room'] = meeting.MeetingRoom.to_dict()
         user_email = get_model_by_id(users[0].user_id, User, "User").email
-        meeting_event = get_event_meet_url_from_api(user_email, meeting.Meeting.event)
+        meeting_event = get_event_meet_url_from_api(
+            user_email, meeting.Meeting.event, get_event_locator(meeting.Meeting.event, meeting.Meeting)
+        )
         meeting_json['event'] = meeting_event
         return meeting_json
 
@@ -127,7 +129,13 @@ class MeetingAPI(MethodView):
         meeting = get_model_by_id(meeting_id, Meeting, "Meeting")
         users = get_session().query(MeetingUser).filter_by(meeting_id=meeting.id).all()
         user_email = get_model_by_id(users[0].user_id, User, "User").email
-        delete_event(user_email, meeting.event)
+        # Calendars whose busy slots change, the attendees and the meeting room
+        attendees = [
+            email for email, in get_session().query(User.email).filter(User.id.in_([u.user_id for u in users]))
+        ]
+        if meeting.meeting_room_id:
+            attendees.append(get_session().get(MeetingRoom, meeting.meeting_room_id).calendar)
+        delete_event(user_email, meeting.event, get_event_locator(meeting.event, meeting), attendees)
         delete_instance_by_id(meeting_id, Meeting, "Meeting")
         id_list = [user.id for user in users]
         delete_instances_by_id_list(id_list, MeetingUser)
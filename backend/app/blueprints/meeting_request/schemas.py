@@ -1,5 +1,6 @@
 from marshmallow import validates, Schema, fields
 
+from app.blueprints.calendar.schemas import OrganizeMeetingSchema
 from app.blueprints.helpers import get_model_by_id, custom_error_messages, admin_or_author_required
 from app.persistence.models import User, MeetingRequest
 
@@ -25,6 +26,8 @@ class MeetingRequestSchema(Schema):
     conditions = fields.Nested(ConditionsSchema)
     status = fields.String(required=True, error_messages=custom_error_messages)
     summary = fields.String(required=True, error_messages=custom_error_messages)
+    options = fields.List(fields.Nested(OrganizeMeetingSchema), allow_none=True)
+    task_id = fields.String(allow_none=True, error_messages=custom_error_messages)
 
 
 class MeetingRequestResponse(Schema):
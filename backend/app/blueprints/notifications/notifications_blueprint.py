@@ -0,0 +1,174 @@
+"""
+Push notifications of calendar changes made outside Ofisino.
+
+Google events.watch channels and Graph subscriptions call the webhooks of this blueprint when
+the events of an user or meeting room calendar change, its cached busy slots are invalidated and
+its changes are pulled into the event mirror.
+Subscriptions expire, renew_calendar_subscriptions (an rq job) renews them before they do.
+"""
+import datetime
+import secrets
+from typing import Optional
+
+from flask import Response, current_app, jsonify, request
+from flask.views import MethodView
+from flask_login import login_required
+from flask_smorest import Blueprint
+from loguru import logger
+
+from app.api_config import get_config
+from app.api_credentials import get_service_credentials_or_abort_with_http_500
+from app.blueprints.helpers import get_organization_calendars, ok, validate_admin
+from app.blueprints.notifications.schemas import CalendarSubscriptionListResponse
+from app.calendar_class import DOMAIN, CalendarManager
+from app.persistence.models import CalendarSubscription
+from app.persistence.session import get_session
+from app.services.event_mirror import mark_stale, mirror_enabled
+from app.services.freebusy_cache import get_freebusy_cache
+from app.task_queue.tasks import schedule_calendar_subscriptions_renewal, sync_calendar_events
+
+bp = Blueprint('notifications', __name__, description='Calendar push notifications')
+
+
+@bp.route('/notifications/google', methods=['POST'])
+def google_notification():
+    """Webhook of the Google events.watch channels"""
+    subscription = _active_subscription(request.headers.get('X-Goog-Channel-ID'))
+    if subscription is None or subscription.token != request.headers.get('X-Goog-Channel-Token'):
+        return '', 404
+    # The first message of a channel only confirms it was created
+    if request.headers.get('X-Goog-Resource-State') != 'sync':
+        _calendars_changed([subscription])
+    return '', 204
+
+
+@bp.route('/notifications/office', methods=['POST'])
+def office_notification():
+    """Webhook of the Graph subscriptions"""
+    validation_token = request.args.get('validationToken')
+    if validation_token:
+        # Graph checks the webhook before creating a subscription
+        return Response(validation_token, mimetype='text/plain')
+    changed = {}
+    for notification in (request.get_json(silent=True) or {}).get('value', []):
+        subscription = _active_subscription(notification.get('subscriptionId'))
+        if subscription is not None and subscription.token == notification.get('clientState'):
+            changed[subscription.id] = subscription
+    _calendars_changed(list(changed.values()))
+    return '', 202
+
+
+@bp.route('/notifications/subscriptions')
+class CalendarSubscriptionAPI(MethodView):
+
+    @login_required
+    @validate_admin
+    @bp.response(200, CalendarSubscriptionListResponse())
+    def get(self):
+        """Active subscriptions"""
+        return ok(CalendarSubscriptionListResponse().dump({"data": _active_subscriptions()}))
+
+    @login_required
+    @validate_admin
+    @bp.response(200, CalendarSubscriptionListResponse())
+    def post(self):
+        """Subscribe to the calendars of every user and meeting room not subscribed yet"""
+        if not get_config().NOTIFICATIONS_URL:
+            return jsonify({"errors": {"json": {"notifications": [
+                "Las notificaciones no están configuradas (NOTIFICATIONS_URL)."
+            ]}}}), 400
+        cman = CalendarManager(config=get_service_credentials_or_abort_with_http_500())
+        subscribe_calendars(cman)
+        schedule_calendar_subscriptions_renewal(current_app.task_queue)
+        return ok(CalendarSubscriptionListResponse().dump({"data": _active_subscriptions()}))
+
+
+def subscribe_calendars(cman: CalendarManager) -> list[CalendarSubscription]:
+    """Subscribe to the calendars of the users and the meeting rooms that have no active subscription"""
+    config = get_config()
+    subscribed = {subscription.calendar_id for subscription in _active_subscriptions()}
+    created = []
+    for owner_email, calendar_id in get_organization_calendars():
+        if calendar_id in subscribed:
+            continue
+        token = secrets.token_urlsafe(24)
+        try:
+            channel = cman.watch_calendar(
+                owner_email, calendar_id, _notification_url(), token, config.CALENDAR_SUBSCRIPTION_TTL
+            )
+        except Exception as err:
+            logger.warning(f'Could not subscribe to the calendar {calendar_id}: {err}')
+            continue
+        subscription = CalendarSubscription(
+            provider=DOMAIN.casefold(),
+            calendar_id=calendar_id,
+            owner_email=owner_email,
+            token=token,
+            **channel
+        )
+        get_session().add(subscription)
+        created.append(subscription)
+    get_session().commit()
+    logger.info(f'Subscribed to {len(created)} calendars')
+    return created
+
+
+def renew_subscriptions(cman: CalendarManager) -> int:
+    """Renew the subscriptions that expire within CALENDAR_SUBSCRIPTION_RENEW_MARGIN"""
+    config = get_config()
+    limit = datetime.datetime.utcnow() + datetime.timedelta(seconds=config.CALENDAR_SUBSCRIPTION_RENEW_MARGIN)
+    renewed = 0
+    for subscription in _active_subscriptions():
+        if subscription.expiration > limit:
+            continue
+        try:
+            channel = cman.renew_calendar_watch(
+                subscription.owner_email, subscription.calendar_id, _notification_url(), subscription.token,
+                config.CALENDAR_SUBSCRIPTION_TTL, subscription.channel_id, subscription.resource_id
+            )
+        except Exception as err:
+            logger.warning(f'Could not renew the subscription to {subscription.calendar_id}: {err}')
+            continue
+        subscription.channel_id = channel['channel_id']
+        subscription.resource_id = channel['resource_id']
+        subscription.expiration = channel['expiration']
+        renewed += 1
+    get_session().commit()
+    return renewed
+
+
+def _notification_url():
+    return f"{get_config().NOTIFICATIONS_URL.rstrip('/')}/notifications/{DOMAIN.casefold()}"
+
+
+def _active_subscriptions() -> list[CalendarSubscription]:
+    return get_session().query(CalendarSubscription).filter(
+        CalendarSubscription.deleted_at.is_(None),
+        CalendarSubscription.expiration > datetime.datetime.utcnow()
+    ).all()
+
+
+def _active_subscription(channel_id) -> Optional[CalendarSubscription]:
+    if not channel_id:
+        return None
+    return get_session().query(CalendarSubscription).filter(
+        CalendarSubscription.channel_id == channel_id,
+        CalendarSubscription.deleted_at.is_(None),
+        CalendarSubscription.expiration > datetime.datetime.utcnow()
+    ).one_or_none()
+
+
+def _calendars_changed(subscriptions: list[CalendarSubscription]):
+    """Invalidate the cached busy slots of the calendars and pull their changes into the event mirror"""
+    if not subscriptions:
+        return
+    calendar_ids = [subscription.calendar_id for subscription in subscriptions]
+    logger.info(f'Calendars changed: {calendar_ids}')
+    cache = get_freebusy_cache()
+    if cache is not None:
+        cache.invalidate(calendar_ids)
+    if mirror_enabled():
+        mark_stale(calendar_ids)
+        current_app.task_queue.enqueue(
+            sync_calendar_events, [[subscription.owner_email, subscription.calendar_id] for subscription in subscriptions]
+        )
@@ -0,0 +1,16 @@
+from marshmallow import Schema, fields
+
+from app.blueprints.helpers import custom_error_messages
+
+
+class CalendarSubscriptionSchema(Schema):
+    id = fields.Int(required=True, error_messages=custom_error_messages)
+    provider = fields.String(required=True, error_messages=custom_error_messages)
+    calendar_id = fields.String(required=True, error_messages=custom_error_messages)
+    owner_email = fields.String(required=True, error_messages=custom_error_messages)
+    channel_id = fields.String(required=True, error_messages=custom_error_messages)
+    expiration = fields.DateTime(required=True, error_messages=custom_error_messages)
+
+
+class CalendarSubscriptionListResponse(Schema):
+    data = fields.List(fields.Nested(CalendarSubscriptionSchema))
@@ -4,7 +4,12 @@ from flask_login import login_required, current_user
 from flask_smorest import Blueprint
 from loguru import logger
 
-from app.blueprints.api_extra_functions import create_all_date_event, delete_event
+from app.blueprints.api_extra_functions import (
+    create_all_date_event,
+    delete_event,
+    get_event_locator,
+    set_event_locator
+)
 from app.blueprints.helpers import (
     ok,
     get_model_by_id,
@@ -95,11 +100,12 @@ class ReservationAPI(MethodView):
         logger.info(f"Adding reservation {reservation}")
 
         user = get_model_by_id(current_user.id, User, "User")
-        event_id = create_all_date_event(user.email,
-                                         reservation.box_id,
-                                         args['date'],
-                                         args['date'])
-        reservation.event_id = event_id
+        locator = create_all_date_event(user.email,
+                                        reservation.box_id,
+                                        args['date'],
+                                        args['date'])
+        reservation.event_id = locator.event_id if locator else None
+        set_event_locator(reservation, locator)
         get_session().add(reservation)
         get_session().commit()
         return ok(ReservationResponse().dump({"data": reservation}))
@@ -120,7 +126,7 @@ class ReservationAPI(MethodView):
         reservation = get_model_by_id(reservation_id, Reservation, "Reservation")
         delete_instance_by_id(reservation_id, Reservation, "Reservation")
         user = get_model_by_id(reservation.user_id, User, "User")
-        delete_event(user.email, reservation.event_id)
+        delete_event(user.email, reservation.event_id, get_event_locator(reservation.event_id, reservation))
         return ok(ReservationIdResponse().dump({"data": {"id": reservation_id}}))
 
     @login_required
@@ -143,12 +149,13 @@ class ReservationAPI(MethodView):
             check_modify = True
         if check_modify:
             user = get_model_by_id(reservation.user_id, User, "User")
-            delete_event(user.email, reservation.event_id)
-            event_id = create_all_date_event(user.email,
-                                             reservation.box_id,
-                                             reservation.date,
-                                             reservation.date)
-            reservation.event_id = event_id
+            delete_event(user.email, reservation.event_id, get_event_locator(reservation.event_id, reservation))
+            locator = create_all_date_event(user.email,
+                                            reservation.box_id,
+                                            reservation.date,
+                                            reservation.date)
+            reservation.event_id = locator.event_id if locator else None
+            set_event_locator(reservation, locator)
         get_session().commit()
         return ok(ReservationResponse().dump({"data": reservation}))
 
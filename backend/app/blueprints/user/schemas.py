@@ -12,6 +12,7 @@ class UserSchema(Schema):
     email = fields.String(required=True, error_messages=custom_error_messages)
     avatar_url = fields.String(required=True, error_messages=custom_error_messages)
     admin = fields.Boolean(required=True, error_messages=custom_error_messages)
+    working_hours = fields.Dict(required=False, allow_none=True, error_messages=custom_error_messages)
 
 
 class UserListResponse(Schema):
@@ -2,19 +2,81 @@ import dataclasses
 import datetime
 import datetime as dt
 import os
-from typing import Optional
+import threading
+from typing import Iterable, Optional
 from uuid import uuid4
 
-import pandas as pd
 import pytz
-import requests
 from dateutil.parser import parse
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from app.services import event_mirror, intervals
+from app.services.freebusy_cache import get_freebusy_cache
+from app.services.google_services import get_google_service, google_retry_after
+from app.services.graph_client import GRAPH_URL, batch_request, batch_succeeded, get_graph_client
+from app.services.provider_concurrency import get_provider_executor
+from app.services.provider_quota import get_provider_quota
+from app.services.scheduler import Availability, TimeGrid
+from app.services.working_hours import WorkingHours, holidays_mask, working_hours_masks
+
 DOMAIN_ADMIN_ACC = os.environ.get('DOMAIN_ADMIN_ACC')
 DOMAIN = os.environ.get('DOMAIN')
 
+# Meetings start and end on multiples of this amount of minutes from the requested start
+MEETING_GRID_MINUTES = 5
+
+# Provider limits for a single availability query
+GOOGLE_FREEBUSY_MAX_ITEMS = 50
+OFFICE_GET_SCHEDULE_MAX_ITEMS = 20
+# Calls per Google HTTP batch request, the Calendar API rejects batches bigger than this
+GOOGLE_BATCH_MAX_REQUESTS = 50
+# Timezone sent to the providers when the offset of a datetime matches no common timezone
+FALLBACK_TIMEZONE = "Pacific Standard Time"
+# Days of the week as Graph names them, monday is 0 as in datetime
+OFFICE_WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+_timezones_by_offset = None
+_timezones_by_offset_lock = threading.Lock()
+
+
+class SyncTokenExpired(Exception):
+    """The provider no longer accepts the sync token, a full sync is needed"""
+
+
+class BusySlotsUnavailable(Exception):
+    """The provider didn't answer for some calendars, they can't be taken as free"""
+
+    def __init__(self, calendar_ids: list[str]):
+        super().__init__(f'Busy slots unavailable for {", ".join(calendar_ids)}')
+        self.calendar_ids = calendar_ids
+
+
+def _batch_body(responses: dict, request_id: str) -> dict:
+    """Body of a $batch response, empty if the request failed"""
+    response = responses.get(request_id)
+    return (response.get('body') or {}) if batch_succeeded(response) else {}
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _get_timezones_by_offset() -> dict[datetime.timedelta, str]:
+    """First common timezone of each standard UTC offset, built once per process"""
+    global _timezones_by_offset
+    if _timezones_by_offset is None:
+        with _timezones_by_offset_lock:
+            if _timezones_by_offset is None:
+                null_delta = datetime.timedelta(0)
+                timezones = {}
+                for tz_name in pytz.common_timezones:
+                    tz = pytz.timezone(tz_name)
+                    offset = getattr(tz, '_transition_info', [[null_delta]])[-1][0]
+                    timezones.setdefault(offset, tz_name)
+                _timezones_by_offset = timezones
+    return _timezones_by_offset
+
 
 @dataclasses.dataclass
 class BusySlot:
@@ -46,6 +108,10 @@ class FreeSlot:
 class MeetingSlot:
     start: dt.datetime
     end: dt.datetime
+    # Lower is better, see TimeGrid.ranked_starts
+    score: float = 0.0
+    # Attendees that can't make it to a meeting with quorum
+    absentees: list[str] = dataclasses.field(default_factory=list)
 
     def to_dict(self):
         meeting_slot_dict = {
@@ -55,6 +121,30 @@ class MeetingSlot:
         return meeting_slot_dict
 
 
+@dataclasses.dataclass
+class EventBatchResult:
+    """Outcome of each item of a bulk operation, by item id
+
+    Created events are keyed by their position in the request and map to the new event id.
+    Deleted events are keyed by their id (the ones that didn't exist count as deleted).
+    """
+    succeeded: dict = dataclasses.field(default_factory=dict)
+    failed: dict = dataclasses.field(default_factory=dict)
+
+
+@dataclasses.dataclass
+class EventLocator:
+    """Where the provider keeps an event created by Ofisino, so it's reached without a search
+
+    `event_id` is the id Ofisino stores (iCalUId on Office, the event id on Google) and
+    `provider_event_id` the id of the event on the calendar of `organizer`.
+    """
+    event_id: str
+    provider_event_id: str
+    calendar_id: Optional[str]
+    organizer: str
+
+
 @dataclasses.dataclass
 class CalendarAllDateEvent:
     summary: str
@@ -119,6 +209,8 @@ class CalendarEvent:
 
 class CalendarManager:
     BS_AS_TIMEZONE = 'America/Argentina/Buenos_Aires'
+    # Only the fields Ofisino uses are read from the Graph directory, /users only returns id if selected
+    OFFICE_USER_FIELDS = 'id,displayName,userPrincipalName'
 
     def __init__(self, config):
         if DOMAIN.casefold() == "GOOGLE".casefold():
@@ -126,6 +218,10 @@ class CalendarManager:
         elif DOMAIN.casefold() == "OFFICE".casefold():
             self.token = config
 
+    def _google_service(self, email, api='calendar', version='v3'):
+        """Pooled service acting as `email`, see app.services.google_services"""
+        return get_google_service(self.cred, email, api=api, version=version)
+
     def get_users(self):
         if DOMAIN.casefold() == "GOOGLE".casefold():
             return self.get_users_google()
@@ -133,8 +229,7 @@ class CalendarManager:
             return self.get_users_office()
 
     def get_users_google(self):
-        cred = self.cred.with_subject(DOMAIN_ADMIN_ACC)
-        service = build('admin', 'directory_v1', credentials=cred)
+        service = self._google_service(DOMAIN_ADMIN_ACC, api='admin', version='directory_v1')
         request = service.users().list(customer='my_customer', maxResults=500, orderBy='email')
         response = request.execute()
         users = response.get('users', [])
@@ -148,14 +243,63 @@ class CalendarManager:
     def get_users_office(self):
         return [
             {
+                'id': u['id'],
                 'name': {
                     'fullName': u['displayName']
                 },
                 'primaryEmail': u['userPrincipalName']
             }
-            for u in self._get_office('/users').get('value', [])
+            for u in self._iter_office(f'/users?$select={self.OFFICE_USER_FIELDS}&$top=999')
         ]
 
+    def sync_users(self, delta_link=None):
+        """Changes of the directory since `delta_link` was issued.
+
+        Without `delta_link` every user is returned. Raises SyncTokenExpired when the provider
+        asks for a full sync. Google has no directory delta, every user is returned each time.
+
+        Returns:
+            ([change, ...], next delta link), a change is {'id', 'removed': True} for a removed
+            user or {'id', 'removed': False, 'name', 'email'}, where an updated user may only have
+            the fields that changed
+        """
+        if DOMAIN.casefold() == "GOOGLE".casefold():
+            return self.sync_users_google()
+        elif DOMAIN.casefold() == "OFFICE".casefold():
+            return self.sync_users_office(delta_link)
+
+    def sync_users_google(self):
+        return [
+            {'id': u['id'], 'removed': False, 'name': u['name']['fullName'], 'email': u['primaryEmail']}
+            for u in self.get_users_google()
+        ], None
+
+    def sync_users_office(self, delta_link):
+        endpoint = delta_link.replace(GRAPH_URL, '') if delta_link else \
+            f'/users/delta?$select={self.OFFICE_USER_FIELDS}'
+        changes = []
+        while True:
+            resp = get_graph_client().get(endpoint, self.token)
+            if resp.status_code == 410:
+                raise SyncTokenExpired('users')
+            resp.raise_for_status()
+            page = resp.json()
+            changes.extend(self._user_change_office(user) for user in page.get('value', []))
+            if '@odata.nextLink' not in page:
+                return changes, page.get('@odata.deltaLink')
+            endpoint = page['@odata.nextLink'].replace(GRAPH_URL, '')
+
+    @staticmethod
+    def _user_change_office(user) -> dict:
+        if '@removed' in user:
+            return {'id': user['id'], 'removed': True}
+        return {
+            'id': user['id'],
+            'removed': False,
+            'name': user.get('displayName'),
+            'email': user.get('userPrincipalName'),
+        }
+
     def create_calendar(self, calendar_summary):
         if DOMAIN.casefold() == "GOOGLE".casefold():
             return self.create_calendar_google(calendar_summary)
@@ -168,8 +312,7 @@ class CalendarManager:
             'summary': calendar_summary,
             'timeZone': os.environ.get('SERVER_TIMEZONE') or "America/Argentina/Buenos_Aires"
         }
-        cred = self.cred.with_subject(DOMAIN_ADMIN_ACC)
-        api_service = build('calendar', 'v3', credentials=cred)
+        api_service = self._google_service(DOMAIN_ADMIN_ACC)
         created_calendar = api_service.calendars().insert(body=calendar).execute()
         return created_calendar.get('id')
 
@@ -177,13 +320,12 @@ class CalendarManager:
         if self._get_calendar_id_by_name_office(DOMAIN_ADMIN_ACC, calendar_summary):
             return None
 
-        return requests.post(
-            f'https://graph.microsoft.com/v1.0/users/{DOMAIN_ADMIN_ACC}/calendars',
-            headers={'Authorization': f'Bearer {self.token["access_token"]}'},
+        return self._post_office(
+            f'/users/{DOMAIN_ADMIN_ACC}/calendars',
             json={
                 "name": calendar_summary
             }
-        ).json().get('id')
+        ).get('id')
 
     def _get_calendar_id_by_name_office(self, email, calendar_name):
         user_calendars = self._get_user_calendars_office(email)
@@ -198,38 +340,62 @@ class CalendarManager:
         return self._get_office(f'/users/{user_id}/calendars')
 
     def _get_office(self, endpoint, **kwargs):
-        return requests.get(
-            f'https://graph.microsoft.com/v1.0/{endpoint}',
-            headers={'Authorization': f'Bearer {self.token["access_token"]}'},
-            **kwargs
-        ).json()
+        return get_graph_client().get(endpoint, self.token, **kwargs).json()
 
     def create_event(self, email, calendar_id,
                      event_summary, event_start, event_end, event_description, event_attendees,
-                     meeting_room_type, meeting_room_calendar_id
+                     meeting_room_type, meeting_room_calendar_id, tz=None
                      ):
+        """`tz` is the timezone of the event, guessed from the offset of `event_start` if not given"""
+        changed_calendars = [email, calendar_id, meeting_room_calendar_id, *event_attendees]
+        locator = None
         if DOMAIN.casefold() == "GOOGLE".casefold():
             if meeting_room_calendar_id:
                 event_attendees.append(meeting_room_calendar_id)
-            return self.create_event_google(email, calendar_id,
-                                            event_summary, event_start, event_end,
-                                            event_description, event_attendees,
-                                            meeting_room_type)
+            locator = self.create_event_google(email, calendar_id,
+                                                event_summary, event_start, event_end,
+                                                event_description, event_attendees,
+                                                meeting_room_type, tz)
         elif DOMAIN.casefold() == "OFFICE".casefold():
-            return self.create_event_office(email, meeting_room_calendar_id,
-                                            event_summary, event_start, event_end,
-                                            event_description, event_attendees,
-                                            meeting_room_type)
+            locator = self.create_event_office(email, meeting_room_calendar_id,
+                                               event_summary, event_start, event_end,
+                                               event_description, event_attendees,
+                                               meeting_room_type, tz)
+        self._invalidate_busy_slots(changed_calendars)
+        return locator
 
     def create_event_google(self, email, calendar_id,
                             event_summary, event_start, event_end, event_description, event_attendees,
-                            meeting_room_type
+                            meeting_room_type, tz=None
                             ):
+        created_event = self._insert_event_google(
+            self._google_service(email), calendar_id, event_summary, event_start, event_end,
+            event_description, event_attendees, meeting_room_type, tz
+        ).execute()
+        return self._locator_google(created_event, calendar_id, email)
+
+    @staticmethod
+    def _locator_google(event, calendar_id, email) -> Optional[EventLocator]:
+        if not event.get('id'):
+            return None
+        return EventLocator(event_id=event['id'], provider_event_id=event['id'], calendar_id=calendar_id, organizer=email)
+
+    @staticmethod
+    def _locator_office(event, calendar_id, user) -> Optional[EventLocator]:
+        if not event.get('iCalUId'):
+            return None
+        return EventLocator(event_id=event['iCalUId'], provider_event_id=event['id'], calendar_id=calendar_id,
+                            organizer=user)
+
+    def _insert_event_google(self, api_service, calendar_id,
+                             event_summary, event_start, event_end, event_description, event_attendees,
+                             meeting_room_type, tz=None
+                             ):
         event = CalendarEvent(
             summary=event_summary,
             start=event_start,
             end=event_end,
-            timezone=self._get_timezone_from_datetime(event_start),
+            timezone=self._get_timezone_from_datetime(event_start, tz),
             description=event_description,
             attendees=event_attendees
         ).to_dict()
@@ -237,50 +403,125 @@ class CalendarManager:
             conference_data_version = 0
         else:
             conference_data_version = 1
-        cred = self.cred.with_subject(email)
-        api_service = build('calendar', 'v3', credentials=cred)
-        created_event = api_service.events().insert(calendarId=calendar_id,
-                                                    body=event,
-                                                    sendUpdates='all',
-                                                    conferenceDataVersion=conference_data_version
-                                                    ).execute()
-        return created_event.get('id')
-
-    def _get_timezone_from_datetime(self, date_time: str):
-        tz_string = datetime.datetime.fromisoformat(date_time).strftime('%Z')
-        hour = tz_string.split('C')[1]
-        if hour:
-            h, m = hour.split(':')
-        else:
-            h = 0
-            m = 0
-
-        tz_offset = int(h) * 3600 + int(m) * 60
-        timezones = pytz.common_timezones
-        offset_days, offset_seconds = 0, int(tz_offset)
-        if offset_seconds < 0:
-            offset_days = -1
-            offset_seconds += 24 * 3600
-        desired_delta = datetime.timedelta(offset_days, offset_seconds)
-        null_delta = datetime.timedelta(0, 0)
-        for tz_name in timezones:
-            tz = pytz.timezone(tz_name)
-            non_dst_offset = getattr(tz, '_transition_info', [[null_delta]])[-1]
-            if desired_delta == non_dst_offset[0]:
-                return tz_name
-        return "Pacific Standard Time"
+        return api_service.events().insert(calendarId=calendar_id,
+                                           body=event,
+                                           sendUpdates='all',
+                                           conferenceDataVersion=conference_data_version
+                                           )
+
+    def create_events(self, email, calendar_id, events: list[dict]) -> EventBatchResult:
+        """Create many events on the calendar of `email`
+
+        Each item of `events` has the arguments of create_event (event_summary, event_start,
+        event_end, event_description, event_attendees, meeting_room_type, meeting_room_calendar_id
+        and optionally tz).
+        """
+        changed_calendars = [email, calendar_id]
+        for event in events:
+            changed_calendars.extend([event.get('meeting_room_calendar_id'), *event['event_attendees']])
+        result = None
+        if DOMAIN.casefold() == "GOOGLE".casefold():
+            for event in events:
+                if event.get('meeting_room_calendar_id'):
+                    event['event_attendees'].append(event['meeting_room_calendar_id'])
+            result = self.create_events_google(email, calendar_id, events)
+        elif DOMAIN.casefold() == "OFFICE".casefold():
+            result = EventBatchResult()
+            # Graph has no batch with online meetings, the events are created concurrently instead
+            locators = get_provider_executor('office').map(
+                lambda event: self.create_event_office(
+                    email, event.get('meeting_room_calendar_id'), event['event_summary'],
+                    event['event_start'], event['event_end'], event['event_description'],
+                    event['event_attendees'], event['meeting_room_type'], event.get('tz')
+                ),
+                events
+            )
+            for position, locator in enumerate(locators):
+                if locator:
+                    result.succeeded[position] = locator.event_id
+                else:
+                    result.failed[position] = None
+        self._invalidate_busy_slots(changed_calendars)
+        return result
+
+    def create_events_google(self, email, calendar_id, events: list[dict]) -> EventBatchResult:
+        api_service = self._google_service(email)
+        requests = {
+            str(position): self._insert_event_google(
+                api_service, calendar_id, event['event_summary'], event['event_start'], event['event_end'],
+                event['event_description'], event['event_attendees'], event['meeting_room_type'], event.get('tz')
+            )
+            for position, event in enumerate(events)
+        }
+        result = self._execute_batch_google(api_service, requests)
+        return EventBatchResult(
+            succeeded={int(position): event.get('id') for position, event in result.succeeded.items()},
+            failed={int(position): err for position, err in result.failed.items()}
+        )
+
+    def _execute_batch_google(self, api_service, requests: dict, tolerate_404: bool = False) -> EventBatchResult:
+        """Execute `requests` ({request id: HttpRequest}) in HTTP batches of GOOGLE_BATCH_MAX_REQUESTS
+
+        Every request is answered, a failed one maps to its HttpError.
+        """
+        result = EventBatchResult()
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                result.succeeded[request_id] = response
+            elif tolerate_404 and isinstance(exception, HttpError) and exception.resp.status == 404:
+                result.succeeded[request_id] = None
+            else:
+                result.failed[request_id] = exception
+
+        quota = get_provider_quota('google')
+        pending = requests
+        attempt = 0
+        while pending:
+            for chunk in _chunks(list(pending.items()), GOOGLE_BATCH_MAX_REQUESTS):
+                batch = api_service.new_batch_http_request(callback=callback)
+                for request_id, request in chunk:
+                    batch.add(request, request_id=request_id)
+                quota.call(getattr(chunk[0][1], 'subject', None), batch.execute, google_retry_after, cost=len(chunk))
+            # Throttled requests are sent again in a new batch
+            throttled = {
+                request_id: google_retry_after(err) for request_id, err in result.failed.items()
+                if google_retry_after(err) is not None
+            }
+            if not throttled:
+                break
+            delay = quota.retry_delay(attempt, max(throttled.values()))
+            if delay is None:
+                break
+            quota.pause(delay)
+            for request_id in throttled:
+                del result.failed[request_id]
+            pending = {request_id: requests[request_id] for request_id in throttled}
+            attempt += 1
+        return result
+
+    def _get_timezone_from_datetime(self, date_time: str, tz: Optional[str] = None):
+        """`tz` if given, otherwise a timezone with the UTC offset of `date_time`"""
+        if tz:
+            return tz
+        offset = datetime.datetime.fromisoformat(date_time).utcoffset() or datetime.timedelta(0)
+        return _get_timezones_by_offset().get(offset, FALLBACK_TIMEZONE)
 
     def create_event_office(self, email, meeting_room_calendar_id,
                             event_summary, event_start, event_end, event_description, event_attendees,
-                            meeting_room_type
+                            meeting_room_type, tz=None
                             ):
+        lookups = [batch_request('attendees', 'GET', f"/users?$filter=userPrincipalName in {tuple(event_attendees)}")]
+        if not meeting_room_calendar_id:
+            lookups.append(batch_request('calendar', 'GET', f'/users/{email}/calendar?$select=id'))
+        responses = self._batch_office(lookups)
         if meeting_room_calendar_id:
             user = DOMAIN_ADMIN_ACC
             calendar_id = meeting_room_calendar_id
         else:
             user = email
-            calendar_id = self._get_user_default_calendar_office(email).get('id')
-        resp = self._get_office(f"/users?$filter=userPrincipalName in {tuple(event_attendees)}")
+            calendar_id = _batch_body(responses, 'calendar').get('id')
+        resp = _batch_body(responses, 'attendees')
         event_attendees = [
             {
                 "emailAddress": {
@@ -295,20 +536,18 @@ class CalendarManager:
             online_meeting = False
         else:
             online_meeting = True
-        return requests.post(
-            f'https://graph.microsoft.com/v1.0/users/{user}/calendars/{calendar_id}/events',
-
-            headers={'Authorization': f'Bearer {self.token["access_token"]}'},
+        created_event = self._post_office(
+            f'/users/{user}/calendars/{calendar_id}/events',
             json={
                 "subject": event_summary,
                 "body": {"contentType": "HTML", "content": event_description},
                 "start": {
                     "dateTime": event_start,
-                    "timeZone": self._get_timezone_from_datetime(event_start)
+                    "timeZone": self._get_timezone_from_datetime(event_start, tz)
                 },
                 "end": {
                     "dateTime": event_end,
-                    "timeZone": self._get_timezone_from_datetime(event_end)
+                    "timeZone": self._get_timezone_from_datetime(event_end, tz)
                 },
                 "location": {
                     "displayName": "Ofisino Headquarters"
@@ -318,17 +557,21 @@ class CalendarManager:
                 "responseRequested": True,
                 "isOnlineMeeting": online_meeting
             }
-        ).json().get('iCalUId')
+        )
+        return self._locator_office(created_event, calendar_id, user)
 
     def create_all_date_event(self, email, calendar_id, event_summary, event_start, event_end):
+        locator = None
         if DOMAIN.casefold() == "GOOGLE".casefold():
-            return self.create_all_date_event_google(
+            locator = self.create_all_date_event_google(
                 email, calendar_id, event_summary, event_start, event_end
             )
         elif DOMAIN.casefold() == "OFFICE".casefold():
-            return self.create_all_date_event_office(
+            locator = self.create_all_date_event_office(
                 email, event_summary, event_start, event_end
             )
+        self._invalidate_busy_slots([email, calendar_id])
+        return locator
 
     def create_all_date_event_google(self, email, calendar_id, event_summary, event_start, event_end):
         event = CalendarAllDateEvent(
@@ -337,19 +580,16 @@ class CalendarManager:
             end=event_end,
             timezone=os.environ.get('SERVER_TIMEZONE') or "America/Argentina/Buenos_Aires"
         ).to_dict()
-        cred = self.cred.with_subject(email)
-        api_service = build('calendar', 'v3', credentials=cred)
+        api_service = self._google_service(email)
         created_event = api_service.events().insert(calendarId=calendar_id, body=event).execute()
-        return created_event.get('id')
+        return self._locator_google(created_event, calendar_id, email)
 
     def create_all_date_event_office(self, email, event_summary, event_start, event_end):
         event_start = f"{event_start}T00:00"
         event_end = (f"{(datetime.date.fromisoformat(event_end) + datetime.timedelta(days=1)).isoformat()}"
                      f"T00:00")
-        return requests.post(
-            f'https://graph.microsoft.com/v1.0/users/{email}/calendar/events',
-
-            headers={'Authorization': f'Bearer {self.token["access_token"]}'},
+        created_event = self._post_office(
+            f'/users/{email}/calendar/events',
             json={
                 "subject": event_summary,
                 "start": {
@@ -367,38 +607,93 @@ class CalendarManager:
                 "showAs": "free",
                 "isAllDay": True
             }
-        ).json().get('iCalUId')
+        )
+        return self._locator_office(created_event, None, email)
 
-    def get_event_meet_url(self, email, event_id):
+    def locate_event(self, email, event_id) -> Optional[EventLocator]:
+        """Locator of an event on the calendar of `email`, searched as Ofisino did before storing them"""
         if DOMAIN.casefold() == "GOOGLE".casefold():
             event = self.get_event_google(email, event_id)
             if event:
-                return event.get('hangoutLink')
+                organizer = event['organizer']['email']
+                return EventLocator(event_id=event_id, provider_event_id=event['id'], calendar_id=organizer,
+                                    organizer=organizer)
         elif DOMAIN.casefold() == "OFFICE".casefold():
             event = self._get_event_by_iCalUId(email, event_id)
+            if event:
+                organizer = event['organizer']['emailAddress']['address']
+                if organizer != email:
+                    event = self._get_event_by_iCalUId(organizer, event_id)
+                if event:
+                    return EventLocator(event_id=event_id, provider_event_id=event['id'], calendar_id=None,
+                                        organizer=organizer)
+
+    def get_event_meet_url(self, email, event_id, locator: Optional[EventLocator] = None):
+        """With the `locator` of the event it's read directly, otherwise it's searched"""
+        if DOMAIN.casefold() == "GOOGLE".casefold():
+            if locator:
+                event = self.get_event_google(locator.organizer, locator.provider_event_id, locator.calendar_id)
+            else:
+                event = self.get_event_google(email, event_id)
+            if event:
+                return event.get('hangoutLink')
+        elif DOMAIN.casefold() == "OFFICE".casefold():
+            if locator:
+                resp = get_graph_client().get(
+                    f'/users/{locator.organizer}/events/{locator.provider_event_id}?$select=onlineMeeting', self.token
+                )
+                event = resp.json() if resp.ok else None
+            else:
+                event = self._get_event_by_iCalUId(email, event_id)
             if event:
                 event_with_meet = event.get('onlineMeeting')
                 if event_with_meet:
                     return event_with_meet.get('joinUrl')
 
-    def get_event_google(self, email, event_id):
+    def get_event_google(self, email, event_id, calendar_id=None):
         try:
-            cred = self.cred.with_subject(email)
-            api_service = build('calendar', 'v3', credentials=cred)
-            return api_service.events().get(calendarId=email, eventId=event_id).execute()
+            api_service = self._google_service(email)
+            return api_service.events().get(calendarId=calendar_id or email, eventId=event_id).execute()
         except HttpError as err:
             if err.resp.status == 404:
                 return None
             else:
                 raise
 
-    def get_events_between_time(self, email, start, end):
+    def get_events_between_time(self, email, start, end, tz=None):
+        if event_mirror.mirror_enabled():
+            events = event_mirror.mirrored_events(email, parse(start), parse(end))
+            if events is not None:
+                return events
         if DOMAIN.casefold() == "GOOGLE".casefold():
             return self.get_events_between_time_google(email, start, end)
         elif DOMAIN.casefold() == "OFFICE".casefold():
-            return self.get_events_between_time_office(email, start, end)
+            return self.get_events_between_time_office(email, start, end, tz)
+
+    def get_events_between_time_for_users(self, emails, start, end, tz=None) -> dict[str, list]:
+        """get_events_between_time of each of `emails`, the calendars the mirror can't answer for are
+        listed concurrently"""
+        emails = list(dict.fromkeys(emails))
+        events = {}
+        if event_mirror.mirror_enabled():
+            for email in emails:
+                mirrored = event_mirror.mirrored_events(email, parse(start), parse(end))
+                if mirrored is not None:
+                    events[email] = mirrored
+        missing = [email for email in emails if email not in events]
+        listed = []
+        if DOMAIN.casefold() == "GOOGLE".casefold():
+            listed = get_provider_executor('google').map(
+                lambda email: self.get_events_between_time_google(email, start, end), missing
+            )
+        elif DOMAIN.casefold() == "OFFICE".casefold():
+            listed = get_provider_executor('office').map(
+                lambda email: self.get_events_between_time_office(email, start, end, tz), missing
+            )
+        events.update(zip(missing, listed))
+        return {email: events[email] for email in emails}
 
-    def get_events_between_time_office(self, email, start, end):
+    def get_events_between_time_office(self, email, start, end, tz=None):
         start_no_tz = datetime.datetime.fromisoformat(start).replace(tzinfo=None).isoformat()
         end_no_tz = datetime.datetime.fromisoformat(end).replace(tzinfo=None).isoformat()
         endpoint = (f"/users/{email}/calendar/events?"
@@ -406,11 +701,10 @@ class CalendarManager:
                     f"or (start/dateTime ge '{start_no_tz}'and start/dateTime le '{end_no_tz}') "
                     f"or (end/dateTime ge '{start_no_tz}'and end/dateTime le '{end_no_tz}')) "
                     f"and showAs ne 'free'")
-        resp = requests.get(
-            f'https://graph.microsoft.com/v1.0/{endpoint}',
-            headers={'Authorization': f'Bearer {self.token["access_token"]}',
-                     'Prefer': f'outlook.timezone = "{self._get_timezone_from_datetime(start)}"'}
-        ).json().get('value', [])
+        resp = self._get_office(
+            endpoint,
+            headers={'Prefer': f'outlook.timezone = "{self._get_timezone_from_datetime(start, tz)}"'}
+        ).get('value', [])
 
         return[
             {
@@ -429,8 +723,7 @@ class CalendarManager:
         events_list = []
         page_token = None
         sync_token = None
-        cred = self.cred.with_subject(email)
-        api_service = build('calendar', 'v3', credentials=cred)
+        api_service = self._google_service(email)
         while not sync_token:
             events = api_service.events().list(
                 calendarId=email,
@@ -445,46 +738,178 @@ class CalendarManager:
             sync_token = events.get('nextSyncToken')
         return events_list
 
-    def delete_event_for_all_users(self, email, event_id):
+    def sync_calendar_events(self, email, calendar_id, sync_token=None, start=None, end=None):
+        """Changes of the events of `calendar_id` since `sync_token` was issued.
+
+        Without `sync_token` every event from `start` to `end` is returned. Raises SyncTokenExpired
+        when the provider asks for a full sync.
+
+        Returns:
+            ([change, ...], next sync token), a change is {'provider_event_id', 'removed': True}
+            for a removed event or the fields of CalendarEventMirror with 'removed': False
+        """
+        if DOMAIN.casefold() == "GOOGLE".casefold():
+            return self.sync_calendar_events_google(email, calendar_id, sync_token, start, end)
+        elif DOMAIN.casefold() == "OFFICE".casefold():
+            return self.sync_calendar_events_office(email, calendar_id, sync_token, start, end)
+
+    def sync_calendar_events_google(self, email, calendar_id, sync_token, start, end):
+        api_service = self._google_service(email)
+        if sync_token:
+            query = {'syncToken': sync_token}
+        else:
+            query = {'timeMin': start.isoformat(), 'timeMax': end.isoformat()}
+        changes = []
+        page_token = None
+        while True:
+            try:
+                events = api_service.events().list(
+                    calendarId=calendar_id, pageToken=page_token, singleEvents=True, **query
+                ).execute()
+            except HttpError as err:
+                if err.resp.status == 410:
+                    raise SyncTokenExpired(calendar_id)
+                raise
+            changes.extend(self._event_change_google(event) for event in events.get('items', []))
+            page_token = events.get('nextPageToken')
+            if not page_token:
+                return changes, events.get('nextSyncToken')
+
+    def _event_change_google(self, event) -> dict:
+        if event.get('status') == 'cancelled':
+            return {'provider_event_id': event['id'], 'removed': True}
+        declined = any(
+            attendee.get('self') and attendee.get('responseStatus') == 'declined'
+            for attendee in event.get('attendees', [])
+        )
+        return {
+            'provider_event_id': event['id'],
+            'removed': False,
+            'event_id': event['id'],
+            'summary': event.get('summary'),
+            'organizer_email': event.get('organizer', {}).get('email'),
+            'html_link': event.get('htmlLink'),
+            'start': self._event_time_google(event['start']),
+            'end': self._event_time_google(event['end']),
+            'busy': event.get('transparency') != 'transparent' and not declined,
+        }
+
+    def _event_time_google(self, event_time) -> datetime.datetime:
+        if 'dateTime' in event_time:
+            return parse(event_time['dateTime'])
+        # All day events
+        timezone = pytz.timezone(event_time.get('timeZone') or self.BS_AS_TIMEZONE)
+        return timezone.localize(parse(event_time['date']))
+
+    def sync_calendar_events_office(self, email, calendar_id, sync_token, start, end):
+        if sync_token:
+            endpoint = sync_token.replace(GRAPH_URL, '')
+        else:
+            if calendar_id == email:
+                endpoint = f'/users/{email}/calendarView/delta'
+            else:
+                endpoint = f'/users/{email}/calendars/{calendar_id}/calendarView/delta'
+            endpoint = (f"{endpoint}?startDateTime={start.astimezone(pytz.utc).replace(tzinfo=None).isoformat()}"
+                        f"&endDateTime={end.astimezone(pytz.utc).replace(tzinfo=None).isoformat()}")
+        changes = []
+        while True:
+            resp = get_graph_client().get(endpoint, self.token, headers={'Prefer': 'outlook.timezone="UTC"'})
+            if resp.status_code == 410:
+                raise SyncTokenExpired(calendar_id)
+            resp.raise_for_status()
+            page = resp.json()
+            changes.extend(self._event_change_office(event) for event in page.get('value', []))
+            if '@odata.nextLink' not in page:
+                return changes, page.get('@odata.deltaLink')
+            endpoint = page['@odata.nextLink'].replace(GRAPH_URL, '')
+
+    @staticmethod
+    def _event_change_office(event) -> dict:
+        if '@removed' in event:
+            return {'provider_event_id': event['id'], 'removed': True}
+        return {
+            'provider_event_id': event['id'],
+            'removed': False,
+            'event_id': event.get('iCalUId'),
+            'summary': event.get('subject'),
+            'organizer_email': (event.get('organizer') or {}).get('emailAddress', {}).get('address'),
+            'html_link': event.get('webLink'),
+            'start': pytz.utc.localize(parse(event['start']['dateTime'])),
+            'end': pytz.utc.localize(parse(event['end']['dateTime'])),
+            'busy': event.get('showAs') != 'free' and not event.get('isCancelled'),
+        }
+
+    def delete_event_for_all_users(self, email, event_id, locator: Optional[EventLocator] = None,
+                                   attendees: Optional[list[str]] = None):
+        """With the `locator` of the event it's deleted with a single call, otherwise it's searched.
+
+        `attendees` are the calendars whose busy slots change, the search finds them by itself.
+        """
+        changed_calendars = []
+        if locator:
+            self.delete_located_event(locator)
+            changed_calendars = [locator.organizer, locator.calendar_id, *(attendees or [])]
+        elif DOMAIN.casefold() == "GOOGLE".casefold():
+            changed_calendars = self.delete_event_for_all_users_google(email, event_id)
+        elif DOMAIN.casefold() == "OFFICE".casefold():
+            changed_calendars = self.delete_event_for_all_users_office(email, event_id)
+        self._invalidate_busy_slots([email, *changed_calendars])
+
+    def delete_located_event(self, locator: EventLocator):
+        """Delete the event for every attendee, nothing happens if it no longer exists"""
         if DOMAIN.casefold() == "GOOGLE".casefold():
-            self.delete_event_for_all_users_google(email, event_id)
+            try:
+                self._google_service(locator.organizer).events().delete(
+                    calendarId=locator.calendar_id or locator.organizer,
+                    eventId=locator.provider_event_id,
+                    sendUpdates='all'
+                ).execute()
+            except HttpError as err:
+                if err.resp.status != 404:
+                    raise
         elif DOMAIN.casefold() == "OFFICE".casefold():
-            self.delete_event_for_all_users_office(email, event_id)
+            self._delete_office(f'/users/{locator.organizer}/events/{locator.provider_event_id}')
 
-    def delete_event_for_all_users_google(self, email, event_id):
+    def delete_event_for_all_users_google(self, email, event_id) -> list[str]:
+        """Returns the calendars the event was on (organizer and attendees)"""
         try:
-            cred = self.cred.with_subject(email)
-            api_service = build('calendar', 'v3', credentials=cred)
+            api_service = self._google_service(email)
             event = api_service.events().get(calendarId=email, eventId=event_id).execute()
-            cred_2 = self.cred.with_subject(event['organizer']['email'])
-            api_service_2 = build('calendar', 'v3', credentials=cred_2)
+            api_service_2 = self._google_service(event['organizer']['email'])
             api_service_2.events().delete(calendarId=event['organizer']['email'],
                                           eventId=event_id,
                                           sendUpdates='all').execute()
+            return [event['organizer']['email'], *[a['email'] for a in event.get('attendees', [])]]
         except HttpError as err:
             if err.resp.status == 404:
-                return
+                return []
             else:
                 raise
 
-    def delete_event_for_all_users_office(self, email, iCalUId):
+    def delete_event_for_all_users_office(self, email, iCalUId) -> list[str]:
+        """Returns the calendars the event was on (organizer and attendees)"""
         attendee_calendar_event = self._get_event_by_iCalUId(email, iCalUId)
         if attendee_calendar_event:
             organizador = attendee_calendar_event.get('organizer')['emailAddress']['address']
             organizer_calendar_event = self._get_event_by_iCalUId(organizador, iCalUId)
             if organizer_calendar_event:
                 self._delete_office(f"/users/{organizador}/events/{organizer_calendar_event.get('id')}")
+            return [
+                organizador,
+                *[a['emailAddress']['address'] for a in attendee_calendar_event.get('attendees', [])]
+            ]
+        return []
 
     def delete_event(self, email, event_id, send_updates: bool = True):
         if DOMAIN.casefold() == "GOOGLE".casefold():
             self.delete_event_google(email, event_id, send_updates)
         elif DOMAIN.casefold() == "OFFICE".casefold():
             self.delete_event_office(email, event_id)
+        self._invalidate_busy_slots([email])
 
     def delete_event_google(self, email, event_id, send_updates: bool = True):
         try:
-            cred = self.cred.with_subject(email)
-            api_service = build('calendar', 'v3', credentials=cred)
+            api_service = self._google_service(email)
             if send_updates:
                 send = 'all'
             else:
@@ -497,39 +922,210 @@ class CalendarManager:
                 raise
 
     def delete_event_office(self, email, iCalUId):
-        event = self._get_event_by_iCalUId(email, iCalUId)
-        if event:
+        self.delete_events_office(email, [iCalUId])
+
+    def delete_events(self, email, event_ids, send_updates: bool = True) -> EventBatchResult:
+        result = None
+        if DOMAIN.casefold() == "GOOGLE".casefold():
+            result = self.delete_events_google(email, event_ids, send_updates)
+        elif DOMAIN.casefold() == "OFFICE".casefold():
+            result = self.delete_events_office(email, event_ids)
+        self._invalidate_busy_slots([email])
+        return result
+
+    @staticmethod
+    def _invalidate_busy_slots(calendar_ids):
+        """Busy slots of calendars changed by Ofisino are fetched again from the provider"""
+        cache = get_freebusy_cache()
+        if cache is not None:
+            cache.invalidate(calendar_ids)
+        if event_mirror.mirror_enabled():
+            event_mirror.mark_stale(calendar_ids)
+
+    def delete_events_google(self, email, event_ids, send_updates: bool = True) -> EventBatchResult:
+        api_service = self._google_service(email)
+        send = 'all' if send_updates else 'none'
+        requests = {
+            event_id: api_service.events().delete(calendarId=email, eventId=event_id, sendUpdates=send)
+            for event_id in event_ids
+        }
+        return self._execute_batch_google(api_service, requests, tolerate_404=True)
+
+    def delete_events_office(self, email, iCalUIds) -> EventBatchResult:
+        """Events organized by `email` are deleted, the rest are declined.
+
+        Events are looked up in a $batch call and deleted (or declined) in another one.
+        """
+        events = self._get_events_by_iCalUId(email, iCalUIds)
+        result = EventBatchResult(succeeded={iCalUId: None for iCalUId in iCalUIds if iCalUId not in events})
+        found = list(events)
+        requests = []
+        for position, iCalUId in enumerate(found):
+            event = events[iCalUId]
             if event.get('organizer')['emailAddress']['address'] != email:
-                requests.post(
-                    f"https://graph.microsoft.com/v1.0/users/{email}/events/{event.get('id')}/decline",
-                    headers={'Authorization': f'Bearer {self.token["access_token"]}'}
-                )
+                requests.append(batch_request(
+                    str(position), 'POST', f"/users/{email}/events/{event.get('id')}/decline",
+                    body={'sendResponse': True}
+                ))
             else:
-                self._delete_office(f"/users/{email}/events/{event.get('id')}")
+                requests.append(batch_request(str(position), 'DELETE', f"/users/{email}/events/{event.get('id')}"))
+        for position, response in self._batch_office(requests).items():
+            iCalUId = found[int(position)]
+            if batch_succeeded(response) or response['status'] == 404:
+                result.succeeded[iCalUId] = None
+            else:
+                result.failed[iCalUId] = response.get('body')
+        return result
 
-    def _delete_office(self, endpoint, **kwargs):
-        return requests.delete(
-            f'https://graph.microsoft.com/v1.0/{endpoint}',
-            headers={'Authorization': f'Bearer {self.token["access_token"]}'},
-            **kwargs
+    def get_working_hours(self, emails: list[str]) -> dict[str, Optional[dict]]:
+        """Working hours each of `emails` set on the provider, {'start', 'end', 'days', 'timezone'} or None.
+
+        `start` and `end` are 'HH:MM', `days` the weekdays (monday is 0) and `timezone` a name as the
+        provider gives it. The Google Calendar API doesn't expose working hours, there they are None.
+        """
+        if DOMAIN.casefold() == "GOOGLE".casefold():
+            return {email: None for email in emails}
+        elif DOMAIN.casefold() == "OFFICE".casefold():
+            return self.get_working_hours_office(emails)
+
+    def get_working_hours_office(self, emails: list[str]) -> dict[str, Optional[dict]]:
+        responses = self._batch_office([
+            batch_request(str(position), 'GET', f'/users/{email}/mailboxSettings/workingHours')
+            for position, email in enumerate(emails)
+        ])
+        working_hours = {}
+        for position, email in enumerate(emails):
+            body = _batch_body(responses, str(position))
+            # Without a timezone the hours can't be placed, they aren't guessed
+            timezone = (body.get('timeZone') or {}).get('name')
+            if body.get('startTime') and body.get('endTime') and body.get('daysOfWeek') and timezone:
+                working_hours[email] = {
+                    'start': body['startTime'][:5],
+                    'end': body['endTime'][:5],
+                    'days': [OFFICE_WEEKDAYS.index(day) for day in body['daysOfWeek'] if day in OFFICE_WEEKDAYS],
+                    'timezone': timezone,
+                }
+            else:
+                working_hours[email] = None
+        return working_hours
+
+    def get_holidays(self, calendar_id: str, start: datetime.date, end: datetime.date) -> set[datetime.date]:
+        """Days from `start` to `end` (both included) covered by an all day event of `calendar_id`.
+
+        `calendar_id` is a calendar DOMAIN_ADMIN_ACC can read, i.e. a Google public holidays calendar.
+        """
+        if DOMAIN.casefold() == "GOOGLE".casefold():
+            ranges = self.get_all_day_events_google(calendar_id, start, end)
+        elif DOMAIN.casefold() == "OFFICE".casefold():
+            ranges = self.get_all_day_events_office(calendar_id, start, end)
+        holidays = set()
+        for first_day, day_after in ranges:
+            day = max(first_day, start)
+            while day < day_after and day <= end:
+                holidays.add(day)
+                day += datetime.timedelta(days=1)
+        return holidays
+
+    def get_all_day_events_google(self, calendar_id, start, end) -> list[tuple[datetime.date, datetime.date]]:
+        """(first day, day after the last one) of the all day events"""
+        api_service = self._google_service(DOMAIN_ADMIN_ACC)
+        ranges = []
+        page_token = None
+        while True:
+            events = api_service.events().list(
+                calendarId=calendar_id,
+                pageToken=page_token,
+                singleEvents=True,
+                timeMin=f'{start.isoformat()}T00:00:00Z',
+                timeMax=f'{(end + datetime.timedelta(days=1)).isoformat()}T00:00:00Z'
+            ).execute()
+            ranges.extend(
+                (datetime.date.fromisoformat(event['start']['date']), datetime.date.fromisoformat(event['end']['date']))
+                for event in events.get('items', [])
+                if event.get('start', {}).get('date')
+            )
+            page_token = events.get('nextPageToken')
+            if not page_token:
+                return ranges
+
+    def get_all_day_events_office(self, calendar_id, start, end) -> list[tuple[datetime.date, datetime.date]]:
+        """(first day, day after the last one) of the all day events"""
+        day_after = end + datetime.timedelta(days=1)
+        events = self._iter_office(
+            f'/users/{DOMAIN_ADMIN_ACC}/calendars/{calendar_id}/calendarView'
+            f'?startDateTime={start.isoformat()}T00:00:00&endDateTime={day_after.isoformat()}T00:00:00'
+            f'&$select=isAllDay,start,end'
         )
+        return [
+            (datetime.date.fromisoformat(event['start']['dateTime'][:10]),
+             datetime.date.fromisoformat(event['end']['dateTime'][:10]))
+            for event in events
+            if event.get('isAllDay')
+        ]
+
+    def _post_office(self, endpoint, **kwargs):
+        return get_graph_client().post(endpoint, self.token, **kwargs).json()
+
+    def _delete_office(self, endpoint, **kwargs):
+        return get_graph_client().delete(endpoint, self.token, **kwargs)
+
+    def _batch_office(self, requests):
+        """Responses by request id, see app.services.graph_client.batch_request"""
+        if not requests:
+            return {}
+        return get_graph_client().batch(requests, self.token)
+
+    def _get_all_office(self, endpoint, **kwargs):
+        """Every item of a paged collection, following @odata.nextLink"""
+        return list(self._iter_office(endpoint, **kwargs))
+
+    def _iter_office(self, endpoint, **kwargs):
+        """Items of a paged collection, the next page is requested when the previous one is consumed"""
+        while endpoint:
+            resp = self._get_office(endpoint, **kwargs)
+            yield from resp.get('value', [])
+            endpoint = resp.get('@odata.nextLink', '').replace(GRAPH_URL, '')
 
     def _get_event_by_iCalUId(self, email, iCalUId):
         """If email is DOMAIN_ADMIN_ACC it must search on all of its calendars
         otherwise it searches on the default calendar"""
+        return self._get_events_by_iCalUId(email, [iCalUId]).get(iCalUId)
+
+    def _get_events_by_iCalUId(self, email, iCalUIds) -> dict[str, dict]:
+        """Events found by iCalUId, looked up in $batch calls.
+
+        The default calendar is searched first (except for DOMAIN_ADMIN_ACC), the events not
+        found there are searched on every calendar of `email`.
+        """
+        found = {}
         if email != DOMAIN_ADMIN_ACC:
-            ev = self._get_office(f"/users/{email}/events?$filter=iCalUId eq '{iCalUId}'").get('value')
-            if ev:
-                return ev[0]
-        quantity = self._get_office(f"/users/{email}/calendars/$count")
-        id_list = self._get_office(f"/users/{email}/calendars?$select=id && top={quantity}").get('value', [])
-        for cal in id_list:
-            event = self._get_office(
-                f"/users/{email}/calendars/{cal['id']}/events?select=iCalUId"
-            ).get('value', [])
-            for ev in event:
-                if ev['iCalUId'] == iCalUId:
-                    return self._get_office(f"/users/{email}/calendars/{cal['id']}/events/{ev['id']}")
+            responses = self._batch_office([
+                batch_request(str(position), 'GET', f"/users/{email}/events?$filter=iCalUId eq '{iCalUId}'")
+                for position, iCalUId in enumerate(iCalUIds)
+            ])
+            for position, iCalUId in enumerate(iCalUIds):
+                events = _batch_body(responses, str(position)).get('value')
+                if events:
+                    found[iCalUId] = events[0]
+        missing = [iCalUId for iCalUId in iCalUIds if iCalUId not in found]
+        if not missing:
+            return found
+        calendars = self._get_all_office(f"/users/{email}/calendars?$select=id")
+        requests = [
+            batch_request(
+                f'{calendar_position}.{position}',
+                'GET',
+                f"/users/{email}/calendars/{cal['id']}/events?$filter=iCalUId eq '{iCalUId}'"
+            )
+            for calendar_position, cal in enumerate(calendars)
+            for position, iCalUId in enumerate(missing)
+        ]
+        responses = self._batch_office(requests)
+        for request in requests:
+            events = _batch_body(responses, request['id']).get('value')
+            if events:
+                found.setdefault(missing[int(request['id'].split('.')[1])], events[0])
+        return found
 
     def get_all_users_calendars(self) -> list[dict]:
         pass  # ToDo
@@ -557,8 +1153,7 @@ class CalendarManager:
         pass  # ToDo
 
     def get_calendars_google(self, email) -> list[dict]:
-        cred = self.cred.with_subject(email)
-        api_service = build('calendar', 'v3', credentials=cred)
+        api_service = self._google_service(email)
         resp = api_service.calendarList().list().execute()
 
         calendars = resp['items']
@@ -578,8 +1173,7 @@ class CalendarManager:
 
     def get_calendar_by_id_google(self, email, calendar_id):
         try:
-            cred = self.cred.with_subject(email)
-            api_service = build('calendar', 'v3', credentials=cred)
+            api_service = self._google_service(email)
             return api_service.calendarList().get(calendarId=calendar_id).execute()
         except HttpError as err:
             if err.resp.status == 404:
@@ -587,23 +1181,130 @@ class CalendarManager:
             else:
                 raise
 
+    def watch_calendar(self, email, calendar_id, address, token, ttl: int) -> dict:
+        """Ask the provider to notify `address` when the events of `calendar_id` change
+
+        Returns:
+            {'channel_id': ..., 'resource_id': ..., 'expiration': naive UTC datetime}
+        """
+        if DOMAIN.casefold() == "GOOGLE".casefold():
+            return self.watch_calendar_google(email, calendar_id, address, token, ttl)
+        elif DOMAIN.casefold() == "OFFICE".casefold():
+            return self.watch_calendar_office(email, calendar_id, address, token, ttl)
+
+    def watch_calendar_google(self, email, calendar_id, address, token, ttl: int) -> dict:
+        channel = self._google_service(email).events().watch(
+            calendarId=calendar_id,
+            body={
+                'id': uuid4().hex,
+                'type': 'web_hook',
+                'address': address,
+                'token': token,
+                'params': {'ttl': str(ttl)}
+            }
+        ).execute()
+        return {
+            'channel_id': channel['id'],
+            'resource_id': channel['resourceId'],
+            'expiration': datetime.datetime.utcfromtimestamp(int(channel['expiration']) / 1000)
+        }
+
+    def watch_calendar_office(self, email, calendar_id, address, token, ttl: int) -> dict:
+        if calendar_id == email:
+            resource = f'/users/{email}/events'
+        else:
+            resource = f'/users/{email}/calendars/{calendar_id}/events'
+        expiration = datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl)
+        subscription = self._post_office('/subscriptions', json={
+            'changeType': 'created,updated,deleted',
+            'notificationUrl': address,
+            'resource': resource,
+            'expirationDateTime': f'{expiration.isoformat()}Z',
+            'clientState': token
+        })
+        if 'id' not in subscription:
+            raise ValueError(f'Could not subscribe to {resource}. Response:\n{subscription}')
+        return {'channel_id': subscription['id'], 'resource_id': resource, 'expiration': expiration}
+
+    def renew_calendar_watch(self, email, calendar_id, address, token, ttl: int,
+                             channel_id, resource_id) -> dict:
+        """Extend a watch, Google channels can't be extended so a new one replaces it"""
+        if DOMAIN.casefold() == "GOOGLE".casefold():
+            channel = self.watch_calendar_google(email, calendar_id, address, token, ttl)
+            self.stop_calendar_watch_google(email, channel_id, resource_id)
+            return channel
+        elif DOMAIN.casefold() == "OFFICE".casefold():
+            expiration = datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl)
+            resp = get_graph_client().patch(
+                f'/subscriptions/{channel_id}', self.token,
+                json={'expirationDateTime': f'{expiration.isoformat()}Z'}
+            )
+            if resp.status_code == 404:
+                # Graph already dropped it
+                return self.watch_calendar_office(email, calendar_id, address, token, ttl)
+            resp.raise_for_status()
+            return {'channel_id': channel_id, 'resource_id': resource_id, 'expiration': expiration}
+
+    def stop_calendar_watch(self, email, channel_id, resource_id):
+        if DOMAIN.casefold() == "GOOGLE".casefold():
+            self.stop_calendar_watch_google(email, channel_id, resource_id)
+        elif DOMAIN.casefold() == "OFFICE".casefold():
+            self._delete_office(f'/subscriptions/{channel_id}')
+
+    def stop_calendar_watch_google(self, email, channel_id, resource_id):
+        try:
+            self._google_service(email).channels().stop(body={'id': channel_id, 'resourceId': resource_id}).execute()
+        except HttpError as err:
+            if err.resp.status == 404:
+                return
+            else:
+                raise
+
     def get_busy_slots_for_calendar(self, email, calendar_id, start, end, tz):
+        cache = get_freebusy_cache()
+        if cache is None:
+            return self._get_busy_slots_for_calendar(email, calendar_id, start, end, tz)
+        cal_id = calendar_id or email
+        return cache.get_many(
+            [cal_id], start, end, tz,
+            fetch=lambda ids, fetch_start, fetch_end: {
+                cal_id: self._get_busy_slots_for_calendar(email, calendar_id, fetch_start, fetch_end, tz)
+            },
+            slot_class=BusySlot
+        )[cal_id]
+
+    def _get_busy_slots_for_calendar(self, email, calendar_id, start, end, tz):
+        mirrored = self._mirrored_busy_slots([calendar_id or email], start, end, tz)
+        if mirrored:
+            return mirrored[calendar_id or email]
         if DOMAIN.casefold() == "GOOGLE".casefold():
             return self.get_busy_slots_for_calendar_google(email, calendar_id, start, end, tz)
         elif DOMAIN.casefold() == "OFFICE".casefold():
             return self.get_busy_slots_for_calendar_office(email, calendar_id, start, end, tz)
 
     def _freebusy_office(self, email, calendar_id, start, end, tz):
-        endpoint = (f"/users/{email}/calendars/{calendar_id}/events?"
-                    f"$filter=((start/dateTime le '{start}'and end/dateTime ge '{end}') "
-                    f"or (start/dateTime ge '{start}'and start/dateTime le '{end}') "
-                    f"or (end/dateTime ge '{start}'and end/dateTime le '{end}')) "
-                    f"and showAs ne 'free'")
-        return requests.get(
-            f'https://graph.microsoft.com/v1.0/{endpoint}',
-            headers={'Authorization': f'Bearer {self.token["access_token"]}',
-                     'Prefer': f'outlook.timezone = "{tz}"'}
-        ).json().get('value', [])
+        return self._get_office(
+            self._freebusy_office_endpoint(email, calendar_id, start, end),
+            headers={'Prefer': f'outlook.timezone = "{tz}"'}
+        ).get('value', [])
+
+    @staticmethod
+    def _freebusy_office_endpoint(email, calendar_id, start, end):
+        return (f"/users/{email}/calendars/{calendar_id}/events?"
+                f"$filter=((start/dateTime le '{start}'and end/dateTime ge '{end}') "
+                f"or (start/dateTime ge '{start}'and start/dateTime le '{end}') "
+                f"or (end/dateTime ge '{start}'and end/dateTime le '{end}')) "
+                f"and showAs ne 'free'")
+
+    @staticmethod
+    def _busy_slots_from_events_office(events, tz) -> list[BusySlot]:
+        return [
+            BusySlot(
+                start=pytz.timezone(tz).localize(parse(slot['start']['dateTime'])),
+                end=pytz.timezone(tz).localize(parse(slot['end']['dateTime']))
+            )
+            for slot in events
+        ]
 
     def get_busy_slots_for_calendar_office(
             self,
@@ -622,13 +1323,7 @@ class CalendarManager:
             end=end.replace(tzinfo=None).isoformat(),
             tz=tz
         )
-        return [
-            BusySlot(
-                start=pytz.timezone(tz).localize(parse(slot['start']['dateTime'])),
-                end=pytz.timezone(tz).localize(parse(slot['end']['dateTime']))
-            )
-            for slot in resp
-        ]
+        return self._busy_slots_from_events_office(resp, tz)
 
     def get_busy_slots_for_calendar_google(
             self,
@@ -653,6 +1348,8 @@ class CalendarManager:
             or
             [] if there are no events from `start` to `end` on `calendar_id`
 
+        Raises BusySlotsUnavailable if the calendar isn't in the answer or comes with errors,
+        so it's neither offered as free nor cached.
         """
         if not calendar_id:
             calendar_id = email
@@ -662,167 +1359,327 @@ class CalendarManager:
             "timeZone": tz,
             "items": [{'id': calendar_id}]
         }
-        cred = self.cred.with_subject(email)
-        api_service = build('calendar', 'v3', credentials=cred)
+        api_service = self._google_service(email)
         resp = api_service.freebusy().query(body=body).execute()
 
-        calendars = resp['calendars']
-        busy_slots = calendars.get(calendar_id, {'busy': []})
-        slots = busy_slots['busy']
+        calendar = resp['calendars'].get(calendar_id)
+        if calendar is None or calendar.get('errors'):
+            raise BusySlotsUnavailable([calendar_id])
         return [
             BusySlot(start=parse(slot['start']), end=parse(slot['end']))
-            for slot in slots
+            for slot in calendar['busy']
         ]
 
-    def get_free_slots_for_calendar(self,
-                                    email: str,
-                                    cal_id: str,
-                                    start_date: dt.datetime,
-                                    end_date: dt.datetime) -> list[FreeSlot]:
-        """Get free time slots of a calendar by iterating with a cursor over busy time slots."""
-        free_slots = []
-        cursor = start_date
-        busy_slots_response = self.get_busy_slots_for_calendar(email,
-                                                               cal_id,
-                                                               start_date,
-                                                               end_date,
-                                                               tz=self.BS_AS_TIMEZONE)
-        busy_slots = [slot.to_dict() for slot in busy_slots_response]
-
-        for slot in busy_slots:
-            start, end = parse(slot['start']), parse(slot['end'])
-            if start < start_date or end > end_date:
-                # Event does not belong to the current timeframe
-                continue
-            if cursor < start:
-                # There is a free slot until next event starts
-                free_slots.append(FreeSlot(cursor, start))
-                cursor = end
-            elif cursor >= start:
-                if cursor < end:
-                    # This time slot is occupied, advance the cursor
-                    cursor = end
-                elif cursor >= end:
-                    # Event has already happened
-                    continue
+    def get_busy_slots_for_calendars(
+            self,
+            ids: list[str],
+            start: datetime.datetime,
+            end: datetime.datetime,
+            tz: str,
+            email: Optional[str] = None,
+    ) -> dict[str, list[BusySlot]]:
+        """Busy slots of many calendars with as few provider round trips as possible
+
+        `email` is the account used to query, it must be able to see every calendar in `ids`.
+        Defaults to DOMAIN_ADMIN_ACC, the owner of the meeting rooms calendars.
+        Calendars are cached per day, see app.services.freebusy_cache.
 
-        if cursor < end_date:
-            # There's time left until the end of the day
-            free_slots.append(FreeSlot(cursor, end_date))
+        Returns:
+            {calendar_id: [BusySlot, ...]} with an entry for every id in `ids`
+        """
+        ids = list(dict.fromkeys(ids))
+        cache = get_freebusy_cache()
+        if cache is None:
+            return self._get_busy_slots_for_calendars(ids, start, end, tz, email)
+        return cache.get_many(
+            ids, start, end, tz,
+            fetch=lambda missing, fetch_start, fetch_end: self._get_busy_slots_for_calendars(
+                missing, fetch_start, fetch_end, tz, email
+            ),
+            slot_class=BusySlot
+        )
 
-        return free_slots
+    def _get_busy_slots_for_calendars(self, ids, start, end, tz, email=None):
+        busy_slots = self._mirrored_busy_slots(ids, start, end, tz)
+        missing = [cal_id for cal_id in ids if cal_id not in busy_slots]
+        if not missing:
+            return busy_slots
+        if DOMAIN.casefold() == "GOOGLE".casefold():
+            busy_slots.update(self.get_busy_slots_for_calendars_google(missing, start, end, tz, email))
+        elif DOMAIN.casefold() == "OFFICE".casefold():
+            busy_slots.update(self.get_busy_slots_for_calendars_office(missing, start, end, tz, email))
+        return busy_slots
+
+    @staticmethod
+    def _mirrored_busy_slots(ids, start, end, tz) -> dict[str, list[BusySlot]]:
+        """Busy slots of the calendars the event mirror can answer for"""
+        if not event_mirror.mirror_enabled():
+            return {}
+        timezone = pytz.timezone(tz)
+        return {
+            cal_id: [BusySlot(start=slot_start.astimezone(timezone), end=slot_end.astimezone(timezone))
+                     for slot_start, slot_end in slots]
+            for cal_id, slots in event_mirror.mirrored_busy_slots(ids, start, end).items()
+        }
 
-    def _is_free_slot_available_by_duration(self, duration, slot):
-        slot_start, slot_end = parse(slot['start']), parse(slot['end'])
-        SATURDAY, SUNDAY = 5, 6
-        NON_WORKING_DAYS = (SATURDAY, SUNDAY)
-        if slot_start.weekday() in NON_WORKING_DAYS or slot_end.weekday() in NON_WORKING_DAYS:
-            return None
-        minutes_diff = (slot_end - slot_start).total_seconds() / 60.0
-        if minutes_diff >= duration:
-            return FreeSlot(slot_start, slot_end)
-        else:
-            return None
+    def get_busy_slots_for_calendars_google(self, ids, start, end, tz=BS_AS_TIMEZONE, email=None):
+        """One freebusy query per GOOGLE_FREEBUSY_MAX_ITEMS calendars, sent concurrently
 
-    def _find_meeting_slot_with_multiple_cals(
-            self, busy_slots_list, duration, start, end, time_start, time_end
-    ) -> list[MeetingSlot]:
+        Raises BusySlotsUnavailable if any calendar wasn't answered (missing from the answer, or still
+        with errors when asked as its owner), so it's neither offered as free nor cached.
         """
-        Start y end determinan el rango de fechas en el cual se quiere realizar la reunion.
-        Se recibe tambien una lista de los espacios ocupados por todos los calendarios
-         que van a asistir a la misma.
-        Llenas el rango de las fechas que diste en start y end con estos espacios ocupados cada 5 minutos
-         y luego, mediante una diferencia, obtenes los espacios que tenes disponibles cada 5 minutos
-         dentro de ese rango dado previamente.
-        Para terminar, recorres cada espacio que tenes cada 5 minutos hasta encontrar alguno que,
-         si le sumas la duracion de la reunion, tambien este ese espacio disponible, siempre y cuando
-         tenga los espacios en el medio tambien disponibles. Es por esto que se compara una suma de la
-         duracion contra una posicion especificia dentro de la lista de los espacios disponibles. Esa
-         posicion especifica es un multiplo de 5 (porque usamos espacios cada 5 minutos) y es por esto
-         que se especifica previamente que la duracion tiene que ser multiplo de 5.
-        Como ultimo paso le realiza un checkeo por si fallo el algoritmo por algun motivo cosmico y este
-         espacio se agrega a la lista de espacios disponibles que tenes cada 5 minutos con el rango
-         de la duracion de la reunion. Despues sera necesario elegir uno de ellos a eleccion del usuario.
+        email = email or DOMAIN_ADMIN_ACC
+        executor = get_provider_executor('google')
+
+        def query(chunk):
+            body = {
+                "timeMin": start.isoformat(),
+                "timeMax": end.isoformat(),
+                "timeZone": tz,
+                "items": [{'id': cal_id} for cal_id in chunk]
+            }
+            # Services are per thread, see GoogleServicePool
+            return self._google_service(email).freebusy().query(body=body).execute()['calendars']
+
+        chunks = list(_chunks(ids, GOOGLE_FREEBUSY_MAX_ITEMS))
+        busy_slots = {}
+        not_shared = []
+        unavailable = []
+        for chunk, calendars in zip(chunks, executor.map(query, chunks)):
+            for cal_id in chunk:
+                calendar = calendars.get(cal_id)
+                if calendar is None:
+                    unavailable.append(cal_id)
+                elif calendar.get('errors'):
+                    not_shared.append(cal_id)
+                else:
+                    busy_slots[cal_id] = [
+                        BusySlot(start=parse(slot['start']), end=parse(slot['end']))
+                        for slot in calendar['busy']
+                    ]
+        # Calendars not shared with the querying account are asked as their owners
+        def query_as_owner(cal_id):
+            try:
+                return self.get_busy_slots_for_calendar_google(cal_id, cal_id, start, end, tz)
+            except BusySlotsUnavailable:
+                return None
+
+        for cal_id, slots in zip(not_shared, executor.map(query_as_owner, not_shared)):
+            if slots is None:
+                unavailable.append(cal_id)
+            else:
+                busy_slots[cal_id] = slots
+        if unavailable:
+            raise BusySlotsUnavailable([cal_id for cal_id in ids if cal_id in unavailable])
+        return busy_slots
+
+    def get_busy_slots_for_calendars_office(self, ids, start, end, tz="Pacific Standard Time", email=None):
+        """Users mailboxes are resolved with getSchedule, OFFICE_GET_SCHEDULE_MAX_ITEMS per request.
+
+        Ids without an @ are calendars of `email` (i.e. meeting rooms) and getSchedule can't see them,
+        their events are listed instead. Every request goes in the same $batch calls.
+        Raises BusySlotsUnavailable if any calendar wasn't answered (a failed or still throttled request,
+        a schedule with an error), so it's neither offered as free nor cached.
         """
-        meeting_slot_list = []
-        position = int(duration / 5)
-        dif = pd.date_range(start=start.isoformat(), end=end.isoformat(), freq='5T')
-        if busy_slots_list:
-            combined = pd.date_range(
-                busy_slots_list[0]['start'],
-                busy_slots_list[0]['end'],
-                freq='5T'
+        email = email or DOMAIN_ADMIN_ACC
+        mailboxes = [cal_id for cal_id in ids if '@' in cal_id]
+        calendars = [cal_id for cal_id in ids if '@' not in cal_id]
+        busy_slots = {}
+        requested_ids = {cal_id.casefold(): cal_id for cal_id in mailboxes}
+        timezone = pytz.timezone(tz)
+        prefer = {'Prefer': f'outlook.timezone = "{tz}"'}
+        start_no_tz = start.replace(tzinfo=None).isoformat()
+        end_no_tz = end.replace(tzinfo=None).isoformat()
+        schedules = [
+            batch_request(
+                f'schedule.{position}',
+                'POST',
+                f'/users/{email}/calendar/getSchedule',
+                headers=prefer,
+                body={
+                    "schedules": chunk,
+                    "startTime": {"dateTime": start_no_tz, "timeZone": tz},
+                    "endTime": {"dateTime": end_no_tz, "timeZone": tz},
+                    "availabilityViewInterval": 5
+                }
             )
-            for busy_slot in busy_slots_list[1:]:
-                combined = combined.union(pd.date_range(busy_slot['start'], busy_slot['end'], freq='5T'))
-            dif = dif.difference(combined)
-
-        pos = dif.indexer_between_time(time_start, time_end)
-        newdif = [dif[p] for p in pos]
-
-        for slot in newdif:
-            if newdif.index(slot) + duration / 5 < len(newdif):
-                if (newdif[newdif.index(slot)] + pd.Timedelta(minutes=duration)) \
-                        == newdif[newdif.index(slot) + position]:
-                    slot_start = newdif[newdif.index(slot)]
-                    slot_end = newdif[newdif.index(slot) + position]
-                    slot_to_use = FreeSlot(slot_start, slot_end).to_dict()
-                    viable_slot = self._is_free_slot_available_by_duration(
-                        slot=slot_to_use,
-                        duration=duration
+            for position, chunk in enumerate(_chunks(mailboxes, OFFICE_GET_SCHEDULE_MAX_ITEMS))
+        ]
+        calendar_events = [
+            batch_request(
+                f'calendar.{position}',
+                'GET',
+                self._freebusy_office_endpoint(email, cal_id, start_no_tz, end_no_tz),
+                headers=prefer
+            )
+            for position, cal_id in enumerate(calendars)
+        ]
+        responses = self._batch_office(schedules + calendar_events)
+        for request in schedules:
+            for schedule in _batch_body(responses, request['id']).get('value', []):
+                cal_id = requested_ids.get(schedule['scheduleId'].casefold(), schedule['scheduleId'])
+                if schedule.get('error'):
+                    continue
+                busy_slots[cal_id] = [
+                    BusySlot(
+                        start=timezone.localize(parse(item['start']['dateTime'])),
+                        end=timezone.localize(parse(item['end']['dateTime']))
                     )
-                    if viable_slot:
-                        meeting_slot_list.append(MeetingSlot(
-                            start=viable_slot.start,
-                            end=viable_slot.start + datetime.timedelta(minutes=duration)
-                        ))
-                        return meeting_slot_list  # Por ahora vamos a cortar en el primero que encuentre
-        return meeting_slot_list
-
-    def organize_meeting(
+                    for item in schedule.get('scheduleItems', [])
+                    if item.get('status') != 'free'
+                ]
+        for request, cal_id in zip(calendar_events, calendars):
+            if batch_succeeded(responses.get(request['id'])):
+                busy_slots[cal_id] = self._busy_slots_from_events_office(
+                    _batch_body(responses, request['id']).get('value', []), tz
+                )
+        unavailable = [cal_id for cal_id in ids if cal_id not in busy_slots]
+        if unavailable:
+            raise BusySlotsUnavailable(unavailable)
+        return busy_slots
+
+    def get_free_slots_for_calendar(self,
+                                    email: str,
+                                    cal_id: str,
+                                    start_date: dt.datetime,
+                                    end_date: dt.datetime) -> list[FreeSlot]:
+        """Get free time slots of a calendar, the time from start_date to end_date not covered by its busy slots"""
+        cal_id = cal_id or email
+        busy_slots = self.get_busy_slots_for_calendars([cal_id],
+                                                       start_date,
+                                                       end_date,
+                                                       tz=self.BS_AS_TIMEZONE,
+                                                       email=email)[cal_id]
+        window = intervals.Interval.of(start_date, end_date)
+        return [
+            FreeSlot(*free.to_datetimes(start_date.tzinfo))
+            for free in intervals.complement(intervals.from_slots(busy_slots), window)
+        ]
+
+    def _meeting_slot_at(self, availability: Availability, index: int, duration: int) -> list[MeetingSlot]:
+        if index < 0:
+            return []
+        slot_start = availability.grid.datetime_at(index)
+        return [MeetingSlot(start=slot_start, end=slot_start + datetime.timedelta(minutes=duration))]
+
+    def load_availability(
             self,
-            meeting_room: str,
             cals: list[str],
-            duration: int,
+            meeting_rooms: list[str],
             start: datetime.date,
             end: datetime.date,
             time_start: datetime.time,
             time_end: datetime.time,
-            tz: str = BS_AS_TIMEZONE
-    ) -> list[MeetingSlot]:
-        """Given calendars, return all the available time slots
-
-        Details:
-            - Some calendars have specified working hours (9AM-4PM), we should honor that restrictions
-            - Time slot should be greater or equal to meeting duration
-            - Eventually, we should be able to parametrize de amount of attendees, prepare for that.
-            - It would also be nice to have an argument (here or in another function)
-              to give more than 1 meeting option
+            tz: str = BS_AS_TIMEZONE,
+            working_hours: Optional[dict[str, WorkingHours]] = None,
+            holidays: Iterable[datetime.date] = ()
+    ) -> Availability:
+        """Busy slots of every attendee and meeting room calendar, fetched in a single batch.
+
+        Attendees are also busy outside of their `working_hours` (by email) and everyone on `holidays`.
         """
         timezone = pytz.timezone(tz)
         start = timezone.localize(datetime.datetime.combine(start, time_start))
         end = timezone.localize(datetime.datetime.combine(end, time_end))
-        busy_slots_list = []
-        if meeting_room != 'virtual':
-            meeting_room_slots_response = self.get_busy_slots_for_calendar(
-                email=DOMAIN_ADMIN_ACC,
-                calendar_id=meeting_room,
-                start=start - datetime.timedelta(minutes=5),
-                end=end + datetime.timedelta(minutes=5),
-                tz=tz
-            )
-            busy_slots_list = [slot.to_dict() for slot in meeting_room_slots_response]
-        for cal_id in cals:
-            slots_response = self.get_busy_slots_for_calendar(
-                email=cal_id,
-                calendar_id=None,
-                start=start - datetime.timedelta(minutes=5),
-                end=end + datetime.timedelta(minutes=5),
-                tz=tz
+        calendar_ids = list(dict.fromkeys([*meeting_rooms, *cals]))
+        busy_slots_by_calendar = self.get_busy_slots_for_calendars(
+            calendar_ids,
+            start=start - datetime.timedelta(minutes=5),
+            end=end + datetime.timedelta(minutes=5),
+            tz=tz
+        )
+        grid = TimeGrid(start, end, step=MEETING_GRID_MINUTES)
+        return Availability(
+            grid=grid,
+            busy_slots_by_calendar=busy_slots_by_calendar,
+            time_start=time_start,
+            time_end=time_end,
+            usable=holidays_mask(grid, holidays),
+            usable_by_calendar=working_hours_masks(grid, working_hours or {})
+        )
+
+    def find_ranked_meeting_slots(
+            self, availability: Availability, cals: list[str], duration: int, count: int,
+            preferred_time: Optional[datetime.time] = None
+    ) -> list[MeetingSlot]:
+        """Up to `count` slots where all `cals` can meet, best first, without meeting room"""
+        return self._ranked_meeting_slots(availability, availability.free(cals), duration, count, preferred_time)
+
+    def find_ranked_meeting_slots_by_room(
+            self, availability: Availability, cals: list[str], meeting_rooms: list[str], duration: int, count: int,
+            preferred_time: Optional[datetime.time] = None
+    ) -> dict[str, list[MeetingSlot]]:
+        """Up to `count` slots where all `cals` can meet, best first, for each meeting room calendar"""
+        attendees_free = availability.free(cals)
+        return {
+            meeting_room: self._ranked_meeting_slots(
+                availability, attendees_free & availability.free([meeting_room]), duration, count, preferred_time
             )
-            for slot in slots_response:
-                busy_slots_list.append(slot.to_dict())
+            for meeting_room in meeting_rooms
+        }
 
-        return self._find_meeting_slot_with_multiple_cals(
-            busy_slots_list, duration, start, end, time_start, time_end
-        )
+    def find_quorum_meeting_slots(
+            self,
+            availability: Availability,
+            cals: list[str],
+            required: list[str],
+            min_attendees: int,
+            meeting_rooms: list[str],
+            duration: int,
+            count: int,
+            preferred_time: Optional[datetime.time] = None
+    ) -> dict[Optional[str], list[MeetingSlot]]:
+        """Up to `count` slots where at least `min_attendees` of `cals`, `required` among them, can meet,
+        best first, for each meeting room calendar. Without meeting rooms (virtual meetings) the slots
+        are under the None key. See Availability.quorum_starts"""
+        slots_by_room = {}
+        for meeting_room in meeting_rooms or [None]:
+            slots_by_room[meeting_room] = []
+            for score, index, absentees in availability.quorum_starts(
+                    cals, required, min_attendees, duration, count, preferred_time, meeting_room
+            ):
+                slot_start = availability.grid.datetime_at(index)
+                slots_by_room[meeting_room].append(MeetingSlot(
+                    start=slot_start, end=slot_start + datetime.timedelta(minutes=duration),
+                    score=score, absentees=absentees
+                ))
+        return slots_by_room
+
+    def _ranked_meeting_slots(self, availability: Availability, free, duration: int, count: int,
+                              preferred_time: Optional[datetime.time]) -> list[MeetingSlot]:
+        slots = []
+        for score, index in availability.ranked_starts(free, duration, count, preferred_time):
+            slot_start = availability.grid.datetime_at(index)
+            slots.append(MeetingSlot(start=slot_start, end=slot_start + datetime.timedelta(minutes=duration),
+                                     score=score))
+        return slots
+
+    def find_meeting_slots_excusing_attendee(
+            self,
+            availability: Availability,
+            cals: list[str],
+            excusable: list[str],
+            meeting_rooms: list[str],
+            duration: int
+    ) -> dict[str, dict[Optional[str], list[MeetingSlot]]]:
+        """First slot where all `cals` but one can meet, for each attendee in `excusable` and each meeting room.
+
+        Every attendee is evaluated in a single pass over the loaded availability instead of
+        scheduling again without them. Without meeting rooms (virtual meetings) the slots are
+        under the None key.
+        """
+        free = availability.free_excusing_each(cals, excusable)
+        if meeting_rooms:
+            rooms_free = ~availability.busy[availability.rows(meeting_rooms)]
+            free = rooms_free[:, None, :] & free[None, :, :]
+        else:
+            free = free[None, :, :]
+            meeting_rooms = [None]
+        starts = availability.first_feasible_starts(free, duration)
+        return {
+            attendee: {
+                meeting_room: self._meeting_slot_at(availability, starts[room_row, attendee_row], duration)
+                for room_row, meeting_room in enumerate(meeting_rooms)
+            }
+            for attendee_row, attendee in enumerate(excusable)
+        }
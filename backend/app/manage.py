@@ -1,19 +1,40 @@
 # -*- coding: utf-8 -*-
+import datetime
 import os
+import random
+import time
 from pprint import pprint
 
 import click
+import pytz
 import requests
+from sqlalchemy import inspect, text
 
 from app.api import create_app
 from app.api_config import get_config
 from app.api_credentials import get_service_credentials_or_abort_with_http_500
-from app.blueprints.api_extra_functions import create_calendar
-from app.blueprints.helpers import get_model_by_email, get_model_by_id
-from app.calendar_class import CalendarManager
+from app.blueprints.api_extra_functions import create_calendar, set_event_locator
+from app.blueprints.helpers import (
+    delete_instances_by_id_list,
+    get_model_by_email,
+    get_model_by_id,
+    get_organization_calendars
+)
+from app.blueprints.notifications.notifications_blueprint import subscribe_calendars
+from app.calendar_class import BusySlot, CalendarManager
 from app.persistence import models as m
 from app.persistence.basemodel import BaseModel
 from app.persistence.session import get_engine, get_session
+from app.services.directory_cache import get_directory_cache, get_directory_users
+from app.services.event_mirror import sync_calendars
+from app.services.provider_concurrency import sequential_provider_calls
+from app.services.scheduler import TimeGrid
+from app.services.working_hours import WorkingHours
+from app.task_queue.tasks import (
+    schedule_calendar_events_sync,
+    schedule_calendar_subscriptions_renewal,
+    schedule_directory_refresh
+)
 
 
 @click.group()
@@ -62,6 +83,35 @@ def admin(email):
             print(f"✨ User {user_from_db.name} changed. Admin={user_from_db.admin}")
 
 
+@db.command()
+@click.argument('email')
+@click.argument('start', required=False)
+@click.argument('end', required=False)
+@click.option('--days', default='0,1,2,3,4', help='Comma separated weekdays, monday is 0')
+@click.option('--timezone', default=None, help='i.e. America/Argentina/Buenos_Aires, the one of the meeting if missing')
+@click.option('--clear', is_flag=True, help='Use the working hours of the provider again')
+def setworkinghours(email, start, end, days, timezone, clear):
+    """Working hours of the user (i.e. 09:00 18:00), meetings are only searched within them"""
+    app = create_app()
+    with app.app_context():
+        s = get_session()
+        user_from_db = get_model_by_email(email)
+        if clear:
+            user_from_db.working_hours = None
+        else:
+            if not start or not end:
+                raise click.UsageError('START and END are required unless --clear is given')
+            try:
+                working_hours = WorkingHours.from_dict({
+                    'start': start, 'end': end, 'days': [int(day) for day in days.split(',')], 'timezone': timezone
+                })
+            except ValueError as err:
+                raise click.BadParameter(str(err))
+            user_from_db.working_hours = working_hours.to_dict()
+        s.commit()
+        print(f"🕘 User {user_from_db.name} changed. Working hours={user_from_db.working_hours}")
+
+
 @db.command()
 def create():
     config = get_config()
@@ -74,6 +124,65 @@ def create():
     print("✨  All models were created")
 
 
+@db.command()
+def migrate():
+    """Create missing tables and add to existing ones the columns added to the models since then"""
+    config = get_config()
+    engine = get_engine(config.DATABASE_URL)
+
+    app = create_app()
+    with app.app_context():
+        BaseModel.metadata.create_all(engine)
+        inspector = inspect(engine)
+        with engine.begin() as connection:
+            for table in BaseModel.metadata.sorted_tables:
+                existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing_columns:
+                        continue
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                    print(f"🪄  Added column {table.name}.{column.name} ({column_type})")
+
+    print("✨  All models are up to date")
+
+
+@db.command()
+def backfilleventlocators():
+    """Store where the provider keeps the events of the meetings and reservations created before it was kept"""
+    app = create_app()
+    with app.app_context():
+        service_credentials = get_service_credentials_or_abort_with_http_500()
+        cman = CalendarManager(config=service_credentials)
+        s = get_session()
+        meetings = s.query(m.Meeting).filter(
+            m.Meeting.deleted_at.is_(None), m.Meeting.provider_event_id.is_(None)
+        ).all()
+        located = 0
+        for meeting in meetings:
+            emails = s.query(m.User.email).join(m.MeetingUser, m.MeetingUser.user_id == m.User.id).filter(
+                m.MeetingUser.meeting_id == meeting.id
+            )
+            # The event is searched on the calendar of each attendee until it's found
+            locator = next(filter(None, (cman.locate_event(email, meeting.event) for email, in emails)), None)
+            if locator:
+                set_event_locator(meeting, locator)
+                located += 1
+        s.commit()
+        print(f"📍  Located the events of {located} of {len(meetings)} meetings")
+        reservations = s.query(m.Reservation, m.User.email).join(
+            m.User, m.User.id == m.Reservation.user_id
+        ).filter(m.Reservation.deleted_at.is_(None), m.Reservation.provider_event_id.is_(None)).all()
+        located = 0
+        for reservation, email in reservations:
+            locator = cman.locate_event(email, reservation.event_id)
+            if locator:
+                set_event_locator(reservation, locator)
+                located += 1
+        s.commit()
+        print(f"📍  Located the events of {located} of {len(reservations)} reservations")
+
+
 @db.command()
 def recreate():
     config = get_config()
@@ -276,31 +385,26 @@ def deletemeetings():
 def deletereservations():
     app = create_app()
     with app.app_context():
-        base_url = 'http://localhost:8000'
+        service_credentials = get_service_credentials_or_abort_with_http_500()
+        cman = CalendarManager(config=service_credentials)
         s = get_session()
-        user_admin = s.query(m.User.name, m.User.email, m.User.admin).filter_by(admin=True).first()
-        if not user_admin:
-            raise Exception(f'There is not an admin user on DB.')
-        user = {
-            'email': user_admin.email,
-            'domain_id': None,
-            'name': user_admin.name
-        }
-        s = requests.Session()
-        s.post(f'{base_url}/login', json=user)
-        response = s.get(f'{base_url}/reservation')
-        print('Get all reservations - ', response.status_code, response.reason)
-        if response.status_code == 200:
-            reservations = response.json()['data']
-            for r_idx, r_val in enumerate(reservations):
-                response = s.delete(f"{base_url}/reservation?id={r_val['id']}")
-                print(f'Delete reservation [{r_idx + 1}] - ', response.status_code, response.reason)
-                if response.status_code != 200:
-                    raise Exception(f'Could not delete the reservation.\n{response.text}')
-            print("🧹  Reservations were deleted")
-        else:
-            raise Exception(f'Could not get all the reservations.\n{response.text}')
-        s.get(f'{base_url}/logout')
+        reservations = s.query(m.Reservation, m.User.email).join(
+            m.User, m.User.id == m.Reservation.user_id
+        ).filter(m.Reservation.deleted_at.is_(None)).all()
+        reservations_by_email = {}
+        for reservation, email in reservations:
+            reservations_by_email.setdefault(email, []).append(reservation)
+        failed = 0
+        for email, user_reservations in reservations_by_email.items():
+            # The events of each user are deleted in batches
+            result = cman.delete_events(email, [r.event_id for r in user_reservations])
+            print(f'Delete reservations of {email} - {len(result.succeeded)} deleted, {len(result.failed)} failed')
+            failed += len(result.failed)
+            deleted_ids = [r.id for r in user_reservations if r.event_id in result.succeeded]
+            delete_instances_by_id_list(deleted_ids, m.Reservation)
+        if failed:
+            raise Exception(f'Could not delete the events of {failed} reservations.')
+        print("🧹  Reservations were deleted")
 
 
 def generatemeetings():
@@ -702,6 +806,158 @@ def fillweek():
         print("✨  All events were created")
 
 
+@db.command()
+def clearweek():
+    app = create_app()
+    with app.app_context():
+        service_credentials = get_service_credentials_or_abort_with_http_500()
+        cman = CalendarManager(config=service_credentials)
+        google_domain = 'clubstack1.me'
+        office_domain = 'disnis.me'
+        if os.environ.get('DOMAIN') == 'GOOGLE':
+            domain = google_domain
+        elif os.environ.get('DOMAIN') == 'OFFICE':
+            domain = office_domain
+        else:
+            raise Exception('DOMAIN not set on environment variables')
+        emails = [f"{name}@{domain}" for name in ('chris', 'nis', 'nahue', 'banche')]
+        events_by_email = cman.get_events_between_time_for_users(
+            emails, "2021-12-13T00:00:00-03:00", "2021-12-18T00:00:00-03:00"
+        )
+        for email, events in events_by_email.items():
+            name = email.split('@')[0]
+            events = [e['id'] for e in events if e.get('summary') == "Evento generado con un script"]
+            cman.delete_events(email, events)
+            print(f'Delete {len(events)} events of {name}')
+        print("🧹  All events were deleted")
+
+
+@db.command()
+def subscribecalendars():
+    app = create_app()
+    with app.app_context():
+        if not get_config().NOTIFICATIONS_URL:
+            raise Exception('NOTIFICATIONS_URL not set on environment variables')
+        service_credentials = get_service_credentials_or_abort_with_http_500()
+        cman = CalendarManager(config=service_credentials)
+        created = subscribe_calendars(cman)
+        schedule_calendar_subscriptions_renewal(app.task_queue)
+        print(f"🔔  Subscribed to {len(created)} calendars")
+
+
+@db.command()
+def syncevents():
+    app = create_app()
+    with app.app_context():
+        if not get_config().CALENDAR_MIRROR_SYNC_INTERVAL:
+            raise Exception('CALENDAR_MIRROR_SYNC_INTERVAL not set on environment variables')
+        service_credentials = get_service_credentials_or_abort_with_http_500()
+        cman = CalendarManager(config=service_credentials)
+        synced = sync_calendars(cman, get_organization_calendars())
+        for calendar_id, changes in synced.items():
+            print(f'Sync {calendar_id} - ', 'failed' if changes is None else f'{changes} changes')
+        schedule_calendar_events_sync(app.task_queue)
+        print("🔄  Calendars were synced, the worker keeps them in sync")
+
+
+@db.command()
+def refreshdirectory():
+    app = create_app()
+    with app.app_context():
+        cache = get_directory_cache()
+        if cache is None:
+            raise Exception('DIRECTORY_REFRESH_INTERVAL not set on environment variables')
+        service_credentials = get_service_credentials_or_abort_with_http_500()
+        cman = CalendarManager(config=service_credentials)
+        users = cache.refresh(cman, full=True)
+        schedule_directory_refresh(app.task_queue)
+        print(f"📇  Directory snapshot reloaded with {users} users, the worker keeps it up to date")
+
+
+@db.command()
+@click.option('--attendees', default='1,5,10,15,30', help='Comma separated numbers of users to list')
+@click.option('--repeat', default=3)
+def benchmarkfanout(attendees, repeat):
+    """Wall time of listing this week's events of N directory users, one after the other and concurrently"""
+    app = create_app()
+    with app.app_context():
+        service_credentials = get_service_credentials_or_abort_with_http_500()
+        cman = CalendarManager(config=service_credentials)
+        emails = [user['email'] for user in get_directory_users(cman)]
+        start = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        end = start + datetime.timedelta(days=7)
+
+        def best_time(users):
+            times = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                cman.get_events_between_time_for_users(users, start.isoformat(), end.isoformat())
+                times.append(time.perf_counter() - started)
+            return min(times)
+
+        print(f"{'users':>6} {'sequential':>11} {'concurrent':>11} {'speedup':>8}")
+        for count in map(int, attendees.split(',')):
+            users = emails[:count]
+            with sequential_provider_calls():
+                sequential = best_time(users)
+            concurrent = best_time(users)
+            print(f"{len(users):>6} {sequential:>10.2f}s {concurrent:>10.2f}s {sequential / concurrent:>7.1f}x")
+
+
+@db.command()
+@click.option('--calendars', default=15)
+@click.option('--events', default=60, help='Busy slots per calendar')
+@click.option('--repeat', default=100)
+def benchmarkscheduler(calendars, events, repeat):
+    """Mean time of finding the starts of a 60 minutes meeting on two weeks of random busy calendars"""
+    tz = pytz.timezone(CalendarManager.BS_AS_TIMEZONE)
+    start = tz.localize(datetime.datetime(2021, 12, 13, 0))
+    end = start + datetime.timedelta(days=14)
+    rnd = random.Random(0)
+    busy = [
+        [BusySlot(start=s, end=s + datetime.timedelta(minutes=30 * rnd.randint(1, 4)))
+         for s in (start + datetime.timedelta(minutes=15 * rnd.randint(0, 1344)) for _ in range(events))]
+        for _ in range(calendars)
+    ]
+    grid = TimeGrid(start, end)
+    free = grid.free(busy)
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        grid.feasible_starts(free, 60, datetime.time(9), datetime.time(18))
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"{calendars} calendars, {events} busy slots each: {elapsed * 1000:.2f}ms per search")
+
+
+@db.command()
+@click.argument('calendar_id')
+@click.option('--base-url', default='http://localhost:8000')
+def sendnotification(calendar_id, base_url):
+    """Stand-in for the provider: notify the webhook that `calendar_id` changed"""
+    app = create_app()
+    with app.app_context():
+        subscription = get_session().query(m.CalendarSubscription).filter_by(
+            calendar_id=calendar_id, deleted_at=None
+        ).order_by(m.CalendarSubscription.expiration.desc()).first()
+        if not subscription:
+            raise Exception(f'There is no subscription to the calendar {calendar_id}.')
+        if subscription.provider == 'google':
+            response = requests.post(f'{base_url}/notifications/google', headers={
+                'X-Goog-Channel-ID': subscription.channel_id,
+                'X-Goog-Channel-Token': subscription.token,
+                'X-Goog-Resource-ID': subscription.resource_id,
+                'X-Goog-Resource-State': 'exists',
+            })
+        else:
+            response = requests.post(f'{base_url}/notifications/office', json={'value': [{
+                'subscriptionId': subscription.channel_id,
+                'clientState': subscription.token,
+                'changeType': 'updated',
+                'resource': subscription.resource_id,
+            }]})
+        print('Send notification - ', response.status_code, response.reason)
+
+
 def _delete_meetings_and_reservations():
     print("🛠  Trying to delete the meetings")
     deletemeetings()
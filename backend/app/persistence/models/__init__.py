@@ -6,6 +6,9 @@ from .box_model import Box  # noqa
 from .meeting_room_model import MeetingRoom  # noqa
 
 # Dynamic info, based on user interaction
+from .calendar_event_mirror_model import CalendarEventMirror  # noqa
+from .calendar_subscription_model import CalendarSubscription  # noqa
+from .calendar_sync_state_model import CalendarSyncState  # noqa
 from .meeting_model import Meeting  # noqa
 from .meeting_request_model import MeetingRequest  # noqa
 from .meeting_request_user_model import MeetingRequestUser  # noqa
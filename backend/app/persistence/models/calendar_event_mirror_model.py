@@ -0,0 +1,46 @@
+import datetime
+import json
+
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Index, UniqueConstraint
+
+from app.persistence.basemodel import BaseModel
+
+
+class CalendarEventMirror(BaseModel):
+    """Copy of a provider calendar event, see app.services.event_mirror"""
+    __tablename__ = 'calendar_event_mirror'
+    __table_args__ = (
+        UniqueConstraint('calendar_id', 'provider_event_id', name='unique_by_calendar_and_provider_event'),
+        Index('calendar_event_mirror_by_calendar_and_start', 'calendar_id', 'start'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    calendar_id = Column(String, nullable=False)
+    # Id the provider uses in its changes (the Graph id on office)
+    provider_event_id = Column(String, nullable=False)
+    # Id Ofisino uses for the event (the iCalUId on office)
+    event_id = Column(String, nullable=False)
+    summary = Column(String, default=None)
+    organizer_email = Column(String, default=None)
+    html_link = Column(String, default=None)
+    # UTC
+    start = Column(DateTime, nullable=False)
+    end = Column(DateTime, nullable=False)
+    # False for free (transparent), declined or cancelled events
+    busy = Column(Boolean, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.event_id,
+            'organizer': {
+                'email': self.organizer_email
+            },
+            'summary': self.summary,
+            'htmlLink': self.html_link,
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat(),
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
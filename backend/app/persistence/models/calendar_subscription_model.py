@@ -0,0 +1,43 @@
+import datetime
+import json
+
+import pytz
+from sqlalchemy import Column, Integer, String, DateTime
+
+from app.persistence.basemodel import BaseModel
+from app.persistence.timezone_var import TZ
+
+
+class CalendarSubscription(BaseModel):
+    """Push notifications of a calendar, a Google events.watch channel or a Graph subscription"""
+    __tablename__ = 'calendar_subscription'
+
+    id = Column(Integer, primary_key=True)
+    provider = Column(String, nullable=False)
+    # Calendar whose changes are notified, an user email or a meeting room calendar
+    calendar_id = Column(String, nullable=False)
+    # Account that created the subscription
+    owner_email = Column(String, nullable=False)
+    # Google channel id or Graph subscription id
+    channel_id = Column(String, nullable=False, unique=True)
+    # Google resource id, needed to stop the channel
+    resource_id = Column(String, default=None)
+    # Secret sent back with every notification (channel token or clientState)
+    token = Column(String, nullable=False)
+    # UTC
+    expiration = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=pytz.timezone(TZ).fromutc(datetime.datetime.utcnow()))
+    deleted_at = Column(DateTime, default=None)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'provider': self.provider,
+            'calendar_id': self.calendar_id,
+            'owner_email': self.owner_email,
+            'channel_id': self.channel_id,
+            'expiration': self.expiration.isoformat(),
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
@@ -0,0 +1,36 @@
+import json
+
+from sqlalchemy import Column, Integer, String, DateTime
+
+from app.persistence.basemodel import BaseModel
+
+
+class CalendarSyncState(BaseModel):
+    """Where the last sync of a mirrored calendar left off"""
+    __tablename__ = 'calendar_sync_state'
+
+    id = Column(Integer, primary_key=True)
+    calendar_id = Column(String, nullable=False, unique=True)
+    owner_email = Column(String, nullable=False)
+    # Google syncToken or Graph deltaLink
+    sync_token = Column(String, default=None)
+    # UTC, events of this window are mirrored
+    window_start = Column(DateTime, nullable=False)
+    window_end = Column(DateTime, nullable=False)
+    # UTC, None when Ofisino changed the calendar after the last sync
+    synced_at = Column(DateTime, default=None)
+    # Times Ofisino changed the calendar, a sync that started before the last change doesn't set synced_at
+    stale_marks = Column(Integer, default=0)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'calendar_id': self.calendar_id,
+            'owner_email': self.owner_email,
+            'window_start': self.window_start.isoformat(),
+            'window_end': self.window_end.isoformat(),
+            'synced_at': self.synced_at.isoformat() if self.synced_at else None,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
@@ -21,6 +21,10 @@ class Meeting(BaseModel):
     description = Column(String, nullable=True)
     summary = Column(String, nullable=True)
     event = Column(String, nullable=False)
+    # Where the provider keeps the event, see app.calendar_class.EventLocator
+    provider_event_id = Column(String, nullable=True)
+    event_calendar_id = Column(String, nullable=True)
+    event_organizer = Column(String, nullable=True)
     created_at = Column(DateTime, default=pytz.timezone(TZ).fromutc(datetime.datetime.utcnow()))
     deleted_at = Column(DateTime, default=None)
     meeting_user = relationship("MeetingUser", cascade="all,delete", backref='meeting')
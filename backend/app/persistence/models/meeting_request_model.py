@@ -17,6 +17,9 @@ class MeetingRequest(BaseModel):
     conditions = Column(JSON, nullable=False)
     summary = Column(String, default=None)
     status = Column(String, nullable=False)
+    # Options found by the scheduler (OrganizeMeetingSchema dumps), the confirm step picks one of them
+    options = Column(JSON, default=None)
+    task_id = Column(String, default=None)
     created_at = Column(DateTime, default=pytz.timezone(TZ).fromutc(datetime.datetime.utcnow()))
     deleted_at = Column(DateTime, default=None)
     meeting_request_user = relationship("MeetingRequestUser", cascade="all,delete", backref='meeting_request')
@@ -29,6 +32,8 @@ class MeetingRequest(BaseModel):
             'conditions': self.conditions,
             'summary': self.summary,
             'status': self.status,
+            'options': self.options,
+            'task_id': self.task_id,
         }
 
     def to_json(self):
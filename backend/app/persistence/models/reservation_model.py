@@ -16,6 +16,10 @@ class Reservation(BaseModel):
     date = Column(Date, nullable=False)
     box_id = Column(Integer, ForeignKey("box.id"), nullable=False)
     event_id = Column(String, nullable=False)
+    # Where the provider keeps the event, see app.calendar_class.EventLocator
+    provider_event_id = Column(String, nullable=True)
+    event_calendar_id = Column(String, nullable=True)
+    event_organizer = Column(String, nullable=True)
     created_at = Column(DateTime, default=pytz.timezone(TZ).fromutc(datetime.datetime.utcnow()))
     deleted_at = Column(DateTime, default=None)
 
@@ -3,7 +3,7 @@ import json
 
 import pytz
 from flask_login import UserMixin
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, JSON
 from sqlalchemy.orm import relationship
 
 from app.persistence.basemodel import BaseModel
@@ -19,6 +19,8 @@ class User(BaseModel, UserMixin):
     email = Column(String, nullable=False)
     avatar_url = Column(String, default=None, nullable=True)
     admin = Column(Boolean, default=False, nullable=False)
+    # {'start': 'HH:MM', 'end': 'HH:MM', 'days': [0..6], 'timezone'}, overrides the ones set on the provider
+    working_hours = Column(JSON, default=None, nullable=True)
     created_at = Column(DateTime, default=pytz.timezone(TZ).fromutc(datetime.datetime.utcnow()))
     deleted_at = Column(DateTime, default=None)
     reservation = relationship("Reservation", backref='user')
@@ -35,7 +37,8 @@ class User(BaseModel, UserMixin):
             'name': self.name,
             'email': self.email,
             'avatar_url': self.avatar_url,
-            'admin': self.admin
+            'admin': self.admin,
+            'working_hours': self.working_hours
         }
 
     def to_json(self):
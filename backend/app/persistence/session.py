@@ -1,12 +1,21 @@
 """See https://docs.sqlalchemy.org/en/14/orm/contextual.html?
 highlight=scoped_session#using-thread-local-scope-with-web-applications"""
+import os
+import threading
+
 import flask
 from flask import g
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
 from sqlalchemy.orm import sessionmaker, scoped_session
 
 from app.api_config import get_config
 
+# One engine (and therefore one connection pool) per database url and per worker process.
+_engines = {}
+_session_factories = {}
+_pool_counters = {}
+_engines_lock = threading.Lock()
+
 
 def get_session():
     if 'session' not in g:
@@ -15,12 +24,108 @@ def get_session():
 
 
 def _create_session(db_url):
-    engine = get_engine(db_url)
-    return scoped_session(sessionmaker(engine), scopefunc=flask._app_ctx_stack.__ident_func__)
+    return scoped_session(_get_session_factory(db_url), scopefunc=flask._app_ctx_stack.__ident_func__)
+
+
+def _get_session_factory(db_url):
+    factory = _session_factories.get(db_url)
+    if factory is None:
+        engine = get_engine(db_url)
+        with _engines_lock:
+            factory = _session_factories.setdefault(db_url, sessionmaker(engine))
+    return factory
 
 
 def get_engine(db_url):
-    return create_engine(db_url)
+    """Return the process wide engine for `db_url`, creating it on first use"""
+    engine = _engines.get(db_url)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(db_url)
+            if engine is None:
+                engine = _build_engine(db_url)
+                _engines[db_url] = engine
+    return engine
+
+
+def _build_engine(db_url):
+    config = get_config()
+    engine_kwargs = {
+        'pool_pre_ping': config.SQLALCHEMY_POOL_PRE_PING,
+        'pool_recycle': config.SQLALCHEMY_POOL_RECYCLE,
+    }
+    if not db_url.startswith('sqlite'):
+        # SQLite uses a pool without size limits, so these arguments are rejected there
+        engine_kwargs['pool_size'] = config.SQLALCHEMY_POOL_SIZE
+        engine_kwargs['max_overflow'] = config.SQLALCHEMY_MAX_OVERFLOW
+        engine_kwargs['pool_timeout'] = config.SQLALCHEMY_POOL_TIMEOUT
+    engine = create_engine(db_url, **engine_kwargs)
+    _register_pool_events(engine, db_url)
+    return engine
+
+
+def _register_pool_events(engine, db_url):
+    """Keep pool counters and make the pool safe to share across a fork (gunicorn --preload).
+
+    A connection opened by another process is never reused nor closed here: it's detached from
+    the pool and a fresh one is opened instead. See
+    https://docs.sqlalchemy.org/en/14/core/pooling.html#using-connection-pools-with-multiprocessing-or-os-fork
+    """
+    counters = _pool_counters.setdefault(db_url, {
+        'connects': 0,
+        'checkouts': 0,
+        'checkins': 0,
+        'invalidated': 0,
+        'max_checked_out': 0,
+    })
+
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        connection_record.info['pid'] = os.getpid()
+        counters['connects'] += 1
+
+    @event.listens_for(engine, 'checkout')
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        pid = os.getpid()
+        if connection_record.info['pid'] != pid:
+            counters['invalidated'] += 1
+            connection_record.connection = connection_proxy.connection = None
+            raise exc.DisconnectionError(
+                f"Connection record belongs to pid {connection_record.info['pid']}, "
+                f"attempting to check out in pid {pid}"
+            )
+        counters['checkouts'] += 1
+        checked_out = _pool_metric(engine.pool, 'checkedout')
+        if checked_out is not None:
+            counters['max_checked_out'] = max(counters['max_checked_out'], checked_out)
+
+    @event.listens_for(engine, 'checkin')
+    def checkin(dbapi_connection, connection_record):
+        counters['checkins'] += 1
+
+
+def _pool_metric(pool, name):
+    metric = getattr(pool, name, None)
+    return metric() if callable(metric) else None
+
+
+def get_pool_status(db_url=None):
+    """Connection pool stats of this worker process, useful to size workers and max_connections"""
+    db_url = db_url or get_config().DATABASE_URL
+    engine = _engines.get(db_url)
+    if engine is None:
+        return {'engine': None, 'pid': os.getpid()}
+    pool = engine.pool
+    return {
+        'engine': engine.url.render_as_string(hide_password=True),
+        'pid': os.getpid(),
+        'pool': type(pool).__name__,
+        'size': _pool_metric(pool, 'size'),
+        'checked_in': _pool_metric(pool, 'checkedin'),
+        'checked_out': _pool_metric(pool, 'checkedout'),
+        'overflow': _pool_metric(pool, 'overflow'),
+        **_pool_counters.get(db_url, {}),
+    }
 
 
 def close_session(exception=None):
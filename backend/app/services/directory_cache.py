@@ -0,0 +1,243 @@
+"""
+Snapshot of the organization directory (Google Admin users or Graph /users) kept in redis.
+
+Listing the directory pages through every user, so requests read a snapshot instead: a redis hash
+by email, looked up in O(1). The refresh_directory rq job refreshes it every
+DIRECTORY_REFRESH_INTERVAL seconds: after the first load only the users changed since the last
+refresh are transferred where the provider has a directory delta (Graph users/delta), the whole
+snapshot is replaced at once otherwise. A request only refreshes it itself when
+there is no snapshot, when it's older than DIRECTORY_MAX_AGE, or when an email is missing from it
+(a new user), at most once per MISS_REFRESH_MIN_AGE seconds.
+"""
+import json
+import threading
+import time
+from typing import Optional
+
+from loguru import logger
+from redis import RedisError
+
+from app.api_config import get_config
+from app.services.redis_client import get_redis
+
+USERS_KEY = 'directory:users'
+# Email of each provider user id, removed users are only identified by id
+IDS_KEY = 'directory:ids'
+REFRESHED_AT_KEY = 'directory:refreshed_at'
+DELTA_LINK_KEY = 'directory:delta_link'
+# Seconds a redis lock lets a single worker list the directory
+REFRESH_LOCK_TIMEOUT = 120
+# A snapshot younger than this isn't refreshed because of an unknown email
+MISS_REFRESH_MIN_AGE = 60
+
+
+class DirectoryCache:
+
+    def __init__(self, redis, max_age: int):
+        self._redis = redis
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.full_refreshes = 0
+
+    def refresh(self, cman, full: bool = False) -> int:
+        """Apply the directory changes since the last refresh, returns how many there were.
+
+        The first refresh, a `full` one, or one whose delta link expired replaces the snapshot.
+        """
+        # Imported here because calendar_class imports the services
+        from app.calendar_class import SyncTokenExpired
+
+        delta_link = None if full else _text(self._redis.get(DELTA_LINK_KEY))
+        changes = None
+        if delta_link:
+            try:
+                changes, next_delta_link = cman.sync_users(delta_link)
+            except SyncTokenExpired:
+                logger.info('Directory delta link expired')
+                delta_link = None
+        if delta_link:
+            self._apply(changes)
+        else:
+            changes, next_delta_link = cman.sync_users()
+            self._replace(changes)
+        pipeline = self._redis.pipeline()
+        if next_delta_link:
+            pipeline.set(DELTA_LINK_KEY, next_delta_link)
+        else:
+            pipeline.delete(DELTA_LINK_KEY)
+        pipeline.set(REFRESHED_AT_KEY, time.time())
+        pipeline.execute()
+        with self._lock:
+            self.refreshes += 1
+            self.full_refreshes += int(not delta_link)
+        logger.info(f'Directory snapshot refreshed with {len(changes)} changes')
+        return len(changes)
+
+    def _replace(self, changes):
+        users = {change['email']: _dump(change) for change in changes if not change['removed']}
+        ids = {change['id']: change['email'] for change in changes if not change['removed']}
+        pipeline = self._redis.pipeline()
+        for key, mapping in ((USERS_KEY, users), (IDS_KEY, ids)):
+            pipeline.delete(f'{key}:new')
+            if mapping:
+                pipeline.hset(f'{key}:new', mapping=mapping)
+                pipeline.rename(f'{key}:new', key)
+            else:
+                pipeline.delete(key)
+        pipeline.execute()
+
+    def _apply(self, changes):
+        """Changed users may only have the fields that changed, the rest come from the snapshot"""
+        if not changes:
+            return
+        user_ids = list(dict.fromkeys(change['id'] for change in changes))
+        emails = dict(zip(user_ids, map(_text, self._redis.hmget(IDS_KEY, user_ids))))
+        known = [email for email in emails.values() if email]
+        users = dict(zip(known, self._redis.hmget(USERS_KEY, known))) if known else {}
+        pipeline = self._redis.pipeline()
+        for change in changes:
+            old_email = emails.get(change['id'])
+            old_user = json.loads(users[old_email]) if users.get(old_email) else {}
+            if old_email and (change['removed'] or change.get('email') not in (None, old_email)):
+                pipeline.hdel(USERS_KEY, old_email)
+            if change['removed']:
+                pipeline.hdel(IDS_KEY, change['id'])
+                emails[change['id']] = None
+                continue
+            user = {
+                'name': change.get('name') or old_user.get('name'),
+                'email': change.get('email') or old_email,
+            }
+            if not user['email']:
+                continue
+            pipeline.hset(USERS_KEY, mapping={user['email']: json.dumps(user)})
+            pipeline.hset(IDS_KEY, mapping={change['id']: user['email']})
+            emails[change['id']] = user['email']
+            users[user['email']] = json.dumps(user)
+        pipeline.execute()
+
+    def users(self, cman) -> list[dict]:
+        """Every user of the directory, {'name', 'email'} sorted by email"""
+        self._ensure_fresh(cman)
+        users = [json.loads(user) for user in self._redis.hgetall(USERS_KEY).values()]
+        self._count(hits=1)
+        return sorted(users, key=lambda user: user['email'])
+
+    def find(self, cman, emails: list[str]) -> dict[str, dict]:
+        """Users of the directory with one of `emails`, by email"""
+        emails = list(dict.fromkeys(emails))
+        if not emails:
+            return {}
+        self._ensure_fresh(cman)
+        found = self._find(emails)
+        if len(found) < len(emails) and self.age() > MISS_REFRESH_MIN_AGE:
+            self._count(misses=1)
+            self._refresh_once(cman, max_age=MISS_REFRESH_MIN_AGE)
+            found = self._find(emails)
+        else:
+            self._count(hits=1)
+        return found
+
+    def age(self) -> Optional[float]:
+        """Seconds since the last refresh, None without snapshot"""
+        refreshed_at = self._redis.get(REFRESHED_AT_KEY)
+        return time.time() - float(refreshed_at) if refreshed_at else None
+
+    def status(self) -> dict:
+        try:
+            age = self.age()
+            size = self._redis.hlen(USERS_KEY)
+        except RedisError:
+            age = size = None
+        with self._lock:
+            return {
+                'users': size,
+                'age_seconds': round(age, 1) if age is not None else None,
+                'max_age': self.max_age,
+                'hits': self.hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'full_refreshes': self.full_refreshes,
+            }
+
+    def _find(self, emails):
+        users = self._redis.hmget(USERS_KEY, emails)
+        return {email: json.loads(user) for email, user in zip(emails, users) if user}
+
+    def _ensure_fresh(self, cman):
+        age = self.age()
+        if age is None or age > self.max_age:
+            self._count(misses=1)
+            self._refresh_once(cman, max_age=self.max_age)
+
+    def _refresh_once(self, cman, max_age):
+        """Refresh unless another worker did it while this one waited for the lock"""
+        with self._redis.lock(f'{USERS_KEY}:lock', timeout=REFRESH_LOCK_TIMEOUT, blocking_timeout=REFRESH_LOCK_TIMEOUT):
+            age = self.age()
+            if age is None or age > max_age:
+                self.refresh(cman)
+
+    def _count(self, hits=0, misses=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_directory_cache() -> Optional[DirectoryCache]:
+    """Process wide cache, None if DIRECTORY_REFRESH_INTERVAL disables it"""
+    global _cache
+    config = get_config()
+    if config.DIRECTORY_REFRESH_INTERVAL <= 0:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DirectoryCache(get_redis(), config.DIRECTORY_MAX_AGE)
+    return _cache
+
+
+def get_directory_users(cman) -> list[dict]:
+    """Every user of the organization directory, {'name', 'email'}"""
+    cache = get_directory_cache()
+    if cache is not None:
+        try:
+            return cache.users(cman)
+        except RedisError as err:
+            logger.warning(f'Directory cache unavailable: {err}')
+    return [_directory_user(user) for user in cman.get_users()]
+
+
+def find_directory_users(cman, emails: list[str]) -> dict[str, dict]:
+    """Users of the organization directory with one of `emails`, by email"""
+    cache = get_directory_cache()
+    if cache is not None:
+        try:
+            return cache.find(cman, emails)
+        except RedisError as err:
+            logger.warning(f'Directory cache unavailable: {err}')
+    return {
+        user['primaryEmail']: _directory_user(user) for user in cman.get_users() if user['primaryEmail'] in emails
+    }
+
+
+def _directory_user(user: dict) -> dict:
+    return {'name': user['name']['fullName'], 'email': user['primaryEmail']}
+
+
+def _dump(change: dict) -> str:
+    return json.dumps({'name': change['name'], 'email': change['email']})
+
+
+def _text(value) -> Optional[str]:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def get_directory_status() -> Optional[dict]:
+    return _cache.status() if _cache is not None else None
@@ -0,0 +1,188 @@
+"""
+Postgres mirror of the organization calendars, kept up to date with incremental syncs.
+
+The sync job (app.task_queue.tasks.sync_calendar_events) pulls only what changed since the last
+sync of each calendar (Google syncToken, Graph deltaLink). Busy slots and event listings are
+answered from the mirror when its last sync is recent and covers the requested window, from the
+provider otherwise. A calendar changed by Ofisino itself is marked stale until the next sync.
+"""
+import datetime
+import threading
+from typing import Optional
+
+import pytz
+from loguru import logger
+from sqlalchemy import func, update
+
+from app.api_config import get_config
+from app.persistence.models import CalendarEventMirror, CalendarSyncState
+from app.persistence.session import get_engine, get_session
+
+_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0, 'syncs': 0, 'full_syncs': 0}
+
+
+def mirror_enabled() -> bool:
+    return get_config().CALENDAR_MIRROR_SYNC_INTERVAL > 0
+
+
+def sync_calendar(cman, owner_email: str, calendar_id: str) -> int:
+    """Apply the changes of `calendar_id` since its last sync, returns how many there were"""
+    # Imported here because calendar_class imports this module
+    from app.calendar_class import SyncTokenExpired
+
+    config = get_config()
+    now = datetime.datetime.utcnow()
+    state = get_session().query(CalendarSyncState).filter_by(calendar_id=calendar_id).one_or_none()
+    if state is None:
+        state = CalendarSyncState(calendar_id=calendar_id, owner_email=owner_email)
+        get_session().add(state)
+    stale_marks = state.stale_marks or 0
+    # The window slides forward with full syncs, once half of the future days are gone
+    full_sync = (
+        not state.sync_token
+        or state.window_end < now + datetime.timedelta(days=config.CALENDAR_MIRROR_FUTURE_DAYS / 2)
+    )
+    changes = None
+    if not full_sync:
+        try:
+            changes, sync_token = cman.sync_calendar_events(owner_email, calendar_id, state.sync_token)
+        except SyncTokenExpired:
+            logger.info(f'Sync token of {calendar_id} expired')
+            full_sync = True
+    if full_sync:
+        state.window_start = now - datetime.timedelta(days=config.CALENDAR_MIRROR_PAST_DAYS)
+        state.window_end = now + datetime.timedelta(days=config.CALENDAR_MIRROR_FUTURE_DAYS)
+        changes, sync_token = cman.sync_calendar_events(
+            owner_email, calendar_id,
+            start=pytz.utc.localize(state.window_start),
+            end=pytz.utc.localize(state.window_end)
+        )
+        get_session().query(CalendarEventMirror).filter_by(calendar_id=calendar_id).delete()
+    _apply_changes(calendar_id, changes)
+    state.sync_token = sync_token
+    get_session().flush()
+    # A mark_stale made during the fetch wins, the changes may have missed what Ofisino just changed
+    get_session().execute(
+        update(CalendarSyncState).where(
+            CalendarSyncState.id == state.id,
+            func.coalesce(CalendarSyncState.stale_marks, 0) == stale_marks
+        ).values(synced_at=now).execution_options(synchronize_session=False)
+    )
+    get_session().commit()
+    with _lock:
+        _counters['syncs'] += 1
+        _counters['full_syncs'] += int(full_sync)
+    return len(changes)
+
+
+def _apply_changes(calendar_id, changes):
+    provider_ids = [change['provider_event_id'] for change in changes]
+    rows = {
+        row.provider_event_id: row
+        for row in get_session().query(CalendarEventMirror).filter(
+            CalendarEventMirror.calendar_id == calendar_id,
+            CalendarEventMirror.provider_event_id.in_(provider_ids)
+        )
+    }
+    for change in changes:
+        row = rows.get(change['provider_event_id'])
+        if change['removed']:
+            if row is not None:
+                get_session().delete(row)
+                del rows[change['provider_event_id']]
+            continue
+        if row is None:
+            row = CalendarEventMirror(calendar_id=calendar_id, provider_event_id=change['provider_event_id'])
+            get_session().add(row)
+            rows[change['provider_event_id']] = row
+        row.event_id = change['event_id']
+        row.summary = change['summary']
+        row.organizer_email = change['organizer_email']
+        row.html_link = change['html_link']
+        row.start = _utc(change['start'])
+        row.end = _utc(change['end'])
+        row.busy = change['busy']
+
+
+def sync_calendars(cman, calendars: list[tuple[str, str]]) -> dict[str, Optional[int]]:
+    """Sync every (owner email, calendar id), a calendar that fails doesn't stop the rest"""
+    synced = {}
+    for owner_email, calendar_id in calendars:
+        try:
+            synced[calendar_id] = sync_calendar(cman, owner_email, calendar_id)
+        except Exception as err:
+            get_session().rollback()
+            logger.warning(f'Could not sync the calendar {calendar_id}: {err}')
+            synced[calendar_id] = None
+    return synced
+
+
+def mark_stale(calendar_ids: list[str]):
+    """Stop answering from the mirror of `calendar_ids` until they are synced again"""
+    calendar_ids = [cal_id for cal_id in dict.fromkeys(calendar_ids) if cal_id]
+    if not calendar_ids:
+        return
+    # Its own transaction, so the session of the caller isn't committed
+    with get_engine(get_config().DATABASE_URL).begin() as connection:
+        connection.execute(
+            update(CalendarSyncState).where(CalendarSyncState.calendar_id.in_(calendar_ids)).values(
+                synced_at=None, stale_marks=func.coalesce(CalendarSyncState.stale_marks, 0) + 1
+            )
+        )
+
+
+def _fresh_calendars(calendar_ids, start, end) -> set[str]:
+    """Calendars whose mirror can answer for `start` to `end`"""
+    oldest_sync = datetime.datetime.utcnow() - datetime.timedelta(seconds=get_config().CALENDAR_MIRROR_MAX_AGE)
+    fresh = {
+        state.calendar_id
+        for state in get_session().query(CalendarSyncState.calendar_id).filter(
+            CalendarSyncState.calendar_id.in_(calendar_ids),
+            CalendarSyncState.synced_at >= oldest_sync,
+            CalendarSyncState.window_start <= _utc(start),
+            CalendarSyncState.window_end >= _utc(end)
+        )
+    }
+    with _lock:
+        _counters['hits'] += len(fresh)
+        _counters['misses'] += len(calendar_ids) - len(fresh)
+    return fresh
+
+
+def mirrored_busy_slots(calendar_ids: list[str], start: datetime.datetime,
+                        end: datetime.datetime) -> dict[str, list[tuple[datetime.datetime, datetime.datetime]]]:
+    """Busy (start, end) of the calendars the mirror can answer for, the rest are left out"""
+    fresh = _fresh_calendars(calendar_ids, start, end)
+    if not fresh:
+        return {}
+    busy_slots = {cal_id: [] for cal_id in fresh}
+    for event in _events_between(fresh, start, end).filter(CalendarEventMirror.busy.is_(True)):
+        busy_slots[event.calendar_id].append((pytz.utc.localize(event.start), pytz.utc.localize(event.end)))
+    return busy_slots
+
+
+def mirrored_events(calendar_id: str, start: datetime.datetime, end: datetime.datetime) -> Optional[list[dict]]:
+    """Busy events of `calendar_id` shaped as CalendarManager.get_events_between_time, None if not mirrored"""
+    if calendar_id not in _fresh_calendars([calendar_id], start, end):
+        return None
+    events = _events_between([calendar_id], start, end).filter(CalendarEventMirror.busy.is_(True))
+    return [event.to_dict() for event in events]
+
+
+def _events_between(calendar_ids, start, end):
+    return get_session().query(CalendarEventMirror).filter(
+        CalendarEventMirror.calendar_id.in_(calendar_ids),
+        CalendarEventMirror.start < _utc(end),
+        CalendarEventMirror.end > _utc(start)
+    ).order_by(CalendarEventMirror.start)
+
+
+def _utc(moment: datetime.datetime) -> datetime.datetime:
+    return moment.astimezone(pytz.utc).replace(tzinfo=None)
+
+
+def get_event_mirror_status() -> dict:
+    with _lock:
+        lookups = _counters['hits'] + _counters['misses']
+        return {**_counters, 'hit_ratio': round(_counters['hits'] / lookups, 3) if lookups else None}
@@ -0,0 +1,195 @@
+"""
+Read-through cache of calendar busy slots, shared by the workers through redis.
+
+Busy slots are stored per calendar and day (in the timezone of the query), so the same
+attendee looked up for different rooms, retries or meeting requests on the same days costs a
+single provider query per TTL. Each calendar has a version number that is part of the keys of
+its entries: Ofisino bumps it when it creates or deletes an event, which makes the entries of
+that calendar unreachable.
+"""
+import datetime
+import json
+import threading
+import time
+from typing import Callable, Optional
+
+import pytz
+from dateutil.parser import parse
+from loguru import logger
+from redis import RedisError
+
+from app.api_config import get_config
+from app.services.redis_client import get_redis
+
+KEY_PREFIX = 'freebusy'
+VERSION_KEY_PREFIX = 'freebusy-version'
+
+
+class FreeBusyCache:
+
+    def __init__(self, redis, ttl: int):
+        self._redis = redis
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+        self._served_age_total = 0.0
+        self._served_age_max = 0.0
+
+    def get_many(self, calendar_ids: list[str], start: datetime.datetime, end: datetime.datetime, tz: str,
+                 fetch: Callable, slot_class) -> dict[str, list]:
+        """Busy slots of each calendar that overlap `start` to `end`.
+
+        `fetch(calendar_ids, start, end)` returns {calendar_id: [slot, ...]} from the provider for
+        the calendars not cached. It's called with whole days so the result can be cached.
+        Slots are returned as `slot_class(start=..., end=...)`.
+        """
+        days = _days(start, end, tz)
+        try:
+            versions = self._versions(calendar_ids)
+            cached = self._load(calendar_ids, versions, days, tz)
+        except RedisError as err:
+            self._count_error(err)
+            return fetch(calendar_ids, start, end)
+        missing = [cal_id for cal_id in calendar_ids if cal_id not in cached]
+        with self._lock:
+            self.hits += len(cached)
+            self.misses += len(missing)
+        busy_slots = {
+            cal_id: [slot_class(start=parse(s['start']), end=parse(s['end'])) for s in slots]
+            for cal_id, slots in cached.items()
+        }
+        if missing:
+            timezone = pytz.timezone(tz)
+            fetched = fetch(
+                missing,
+                timezone.localize(datetime.datetime.combine(days[0], datetime.time.min)),
+                timezone.localize(datetime.datetime.combine(days[-1] + datetime.timedelta(days=1), datetime.time.min))
+            )
+            try:
+                self._store(fetched, versions, days, tz)
+            except RedisError as err:
+                self._count_error(err)
+            busy_slots.update(fetched)
+        return {
+            cal_id: [slot for slot in busy_slots.get(cal_id, []) if slot.start < end and slot.end > start]
+            for cal_id in calendar_ids
+        }
+
+    def invalidate(self, calendar_ids: list[str]):
+        """Forget the cached busy slots of `calendar_ids`, on every worker"""
+        calendar_ids = [cal_id for cal_id in dict.fromkeys(calendar_ids) if cal_id]
+        if not calendar_ids:
+            return
+        try:
+            pipeline = self._redis.pipeline()
+            for cal_id in calendar_ids:
+                pipeline.incr(f'{VERSION_KEY_PREFIX}:{cal_id}')
+            pipeline.execute()
+        except RedisError as err:
+            self._count_error(err)
+            return
+        with self._lock:
+            self.invalidations += len(calendar_ids)
+
+    def status(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+                'invalidations': self.invalidations,
+                'errors': self.errors,
+                # Age of the cached busy slots served, how stale the answers can be
+                'avg_age_seconds': round(self._served_age_total / self.hits, 1) if self.hits else None,
+                'max_age_seconds': round(self._served_age_max, 1),
+            }
+
+    def _versions(self, calendar_ids) -> dict[str, int]:
+        versions = self._redis.mget([f'{VERSION_KEY_PREFIX}:{cal_id}' for cal_id in calendar_ids])
+        return {cal_id: int(version or 0) for cal_id, version in zip(calendar_ids, versions)}
+
+    @staticmethod
+    def _key(cal_id, version, tz, day):
+        return f'{KEY_PREFIX}:{cal_id}:{version}:{tz}:{day.isoformat()}'
+
+    def _load(self, calendar_ids, versions, days, tz) -> dict[str, list[dict]]:
+        """Slots of the calendars with every day cached, a slot spanning days is listed once"""
+        keys = [self._key(cal_id, versions[cal_id], tz, day) for cal_id in calendar_ids for day in days]
+        entries = iter(self._redis.mget(keys))
+        now = time.time()
+        cached = {}
+        for cal_id in calendar_ids:
+            days_entries = [next(entries) for _ in days]
+            if not all(days_entries):
+                continue
+            slots = {}
+            oldest = now
+            for entry in map(json.loads, days_entries):
+                oldest = min(oldest, entry['fetched_at'])
+                for slot in entry['slots']:
+                    slots[(slot['start'], slot['end'])] = slot
+            cached[cal_id] = sorted(slots.values(), key=lambda s: parse(s['start']))
+            with self._lock:
+                self._served_age_total += now - oldest
+                self._served_age_max = max(self._served_age_max, now - oldest)
+        return cached
+
+    def _store(self, busy_slots, versions, days, tz):
+        timezone = pytz.timezone(tz)
+        fetched_at = time.time()
+        pipeline = self._redis.pipeline()
+        for cal_id, slots in busy_slots.items():
+            for day in days:
+                day_start = timezone.localize(datetime.datetime.combine(day, datetime.time.min))
+                day_end = timezone.localize(
+                    datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time.min)
+                )
+                entry = {
+                    'fetched_at': fetched_at,
+                    'slots': [
+                        {'start': slot.start.isoformat(), 'end': slot.end.isoformat()}
+                        for slot in slots if slot.start < day_end and slot.end > day_start
+                    ]
+                }
+                # Stored with the version read before the fetch, an invalidation meanwhile wins
+                pipeline.set(self._key(cal_id, versions[cal_id], tz, day), json.dumps(entry), ex=self.ttl)
+        pipeline.execute()
+
+    def _count_error(self, err):
+        logger.warning(f'Freebusy cache unavailable: {err}')
+        with self._lock:
+            self.errors += 1
+
+
+def _days(start: datetime.datetime, end: datetime.datetime, tz: str) -> list[datetime.date]:
+    """Days of `tz` from `start` to `end`"""
+    timezone = pytz.timezone(tz)
+    first = start.astimezone(timezone).date()
+    last = (end - datetime.timedelta(microseconds=1)).astimezone(timezone).date()
+    return [first + datetime.timedelta(days=n) for n in range((last - first).days + 1)]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_freebusy_cache() -> Optional[FreeBusyCache]:
+    """Process wide cache, None if FREEBUSY_CACHE_TTL disables it"""
+    global _cache
+    ttl = get_config().FREEBUSY_CACHE_TTL
+    if ttl <= 0:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = FreeBusyCache(get_redis(), ttl)
+    return _cache
+
+
+def get_freebusy_cache_status() -> Optional[dict]:
+    return _cache.status() if _cache is not None else None
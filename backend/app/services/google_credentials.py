@@ -0,0 +1,204 @@
+"""
+Google service account credentials shared by the whole worker process.
+
+The service account file is read once. Credentials delegated to each user (`with_subject`)
+are cached with their access token, so a user costs a single token request per token
+lifetime instead of one per request. Tokens are refreshed shortly before they expire, by a
+background thread for the users seen lately, and optionally shared with the other workers
+through redis so only one of them asks Google for a new one.
+"""
+import datetime
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from google.auth.transport.requests import Request
+from google.oauth2 import service_account
+from loguru import logger
+from redis import RedisError
+
+from app.api_config import get_config
+from app.services.redis_client import get_redis
+
+SCOPES = ['https://www.googleapis.com/auth/calendar',
+          'https://www.googleapis.com/auth/admin.directory.user']
+CREDENTIALS_FILE_NAME = 'service_credentials.json'
+REDIS_KEY_PREFIX = 'google-token'
+
+
+class GoogleCredentialManager:
+    """Drop in replacement of the service account credentials given to CalendarManager.
+
+    `with_subject` returns the same cached credentials, with a valid token, to every caller.
+    """
+
+    def __init__(self, credentials, refresh_margin: int, idle_timeout: int, redis=None, request=None):
+        self.credentials = credentials
+        self.service_account_email = credentials.service_account_email
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin)
+        self.idle_timeout = idle_timeout
+        self._redis = redis
+        self._request = request or Request()
+        self._subjects = {}
+        self._subject_locks = {}
+        self._last_used = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+        self.hits = 0
+        self.refreshes = 0
+        self.shared_hits = 0
+
+    def with_subject(self, subject: str):
+        with self._lock:
+            credentials = self._subjects.get(subject)
+            if credentials is None:
+                credentials = self.credentials.with_subject(subject)
+                self._subjects[subject] = credentials
+                self._subject_locks[subject] = threading.Lock()
+            self._last_used[subject] = time.monotonic()
+        if self._expiring(credentials, self.refresh_margin):
+            self._refresh(subject, credentials, self.refresh_margin)
+        else:
+            self.hits += 1
+        return credentials
+
+    def touch(self, subject: str):
+        """Record a use of the credentials of `subject` by an already built service.
+
+        Keeps `subject` among the users seen lately, so the background thread keeps refreshing it.
+        Returns the cached credentials, new ones if `subject` was forgotten meanwhile.
+        """
+        return self.with_subject(subject)
+
+    def refresh_expiring(self, margin: Optional[datetime.timedelta] = None):
+        """Refresh the tokens that expire within `margin`, forget the users not seen lately"""
+        margin = margin or self.refresh_margin
+        now = time.monotonic()
+        with self._lock:
+            idle = [subject for subject, used in self._last_used.items() if now - used > self.idle_timeout]
+            for subject in idle:
+                del self._subjects[subject], self._subject_locks[subject], self._last_used[subject]
+            subjects = list(self._subjects.items())
+        for subject, credentials in subjects:
+            if self._expiring(credentials, margin):
+                try:
+                    self._refresh(subject, credentials, margin)
+                except Exception as err:
+                    logger.warning(f'Could not refresh the google token of {subject}: {err}')
+
+    def start_background_refresh(self, interval: int):
+        """Refresh the tokens ahead of the requests every `interval` seconds (in this process)"""
+        if interval <= 0 or (self._thread is not None and self._thread_pid == os.getpid()):
+            return
+        self._thread_pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._refresh_loop,
+            args=(interval,),
+            name='google-credentials-refresh',
+            daemon=True
+        )
+        self._thread.start()
+
+    def status(self) -> dict:
+        return {
+            'subjects': len(self._subjects),
+            'hits': self.hits,
+            'refreshes': self.refreshes,
+            'shared_hits': self.shared_hits,
+            'redis': self._redis is not None,
+        }
+
+    def _refresh_loop(self, interval: int):
+        margin = self.refresh_margin + datetime.timedelta(seconds=interval)
+        while True:
+            time.sleep(interval)
+            self.refresh_expiring(margin)
+
+    @staticmethod
+    def _expiring(credentials, margin: datetime.timedelta) -> bool:
+        # google-auth expiry is a naive UTC datetime
+        return (
+            credentials.token is None
+            or credentials.expiry is None
+            or credentials.expiry - margin <= datetime.datetime.utcnow()
+        )
+
+    def _refresh(self, subject, credentials, margin):
+        with self._subject_locks[subject]:
+            if not self._expiring(credentials, margin):
+                # Refreshed by another thread meanwhile
+                return
+            if self._load_shared_token(subject, credentials, margin):
+                self.shared_hits += 1
+                return
+            credentials.refresh(self._request)
+            self.refreshes += 1
+            self._share_token(subject, credentials)
+
+    def _redis_key(self, subject):
+        return f'{REDIS_KEY_PREFIX}:{self.service_account_email}:{subject}'
+
+    def _load_shared_token(self, subject, credentials, margin) -> bool:
+        if self._redis is None:
+            return False
+        try:
+            shared = self._redis.get(self._redis_key(subject))
+        except RedisError as err:
+            logger.warning(f'Could not read the shared google token of {subject}: {err}')
+            return False
+        if not shared:
+            return False
+        shared = json.loads(shared)
+        expiry = datetime.datetime.fromisoformat(shared['expiry'])
+        if expiry - margin <= datetime.datetime.utcnow():
+            return False
+        credentials.token = shared['token']
+        credentials.expiry = expiry
+        return True
+
+    def _share_token(self, subject, credentials):
+        if self._redis is None or credentials.expiry is None:
+            return
+        ttl = int((credentials.expiry - datetime.datetime.utcnow()).total_seconds())
+        if ttl <= 0:
+            return
+        shared = json.dumps({'token': credentials.token, 'expiry': credentials.expiry.isoformat()})
+        try:
+            self._redis.set(self._redis_key(subject), shared, ex=ttl)
+        except RedisError as err:
+            logger.warning(f'Could not share the google token of {subject}: {err}')
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_google_credential_manager() -> GoogleCredentialManager:
+    """Process wide manager, raise ValueError if the service account file doesn't exist"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = _build_manager()
+    _manager.start_background_refresh(get_config().GOOGLE_TOKEN_REFRESH_INTERVAL)
+    return _manager
+
+
+def _build_manager():
+    if not os.path.exists(CREDENTIALS_FILE_NAME):
+        raise ValueError(f'Invalid credentials, check if {CREDENTIALS_FILE_NAME} exists on {os.getcwd()}')
+    config = get_config()
+    credentials = service_account.Credentials.from_service_account_file(CREDENTIALS_FILE_NAME, scopes=SCOPES)
+    return GoogleCredentialManager(
+        credentials,
+        refresh_margin=config.GOOGLE_TOKEN_REFRESH_MARGIN,
+        idle_timeout=config.GOOGLE_TOKEN_IDLE_TIMEOUT,
+        redis=get_redis() if config.GOOGLE_TOKEN_SHARE_REDIS else None
+    )
+
+
+def get_google_credentials_status() -> Optional[dict]:
+    return _manager.status() if _manager is not None else None
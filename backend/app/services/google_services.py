@@ -0,0 +1,146 @@
+"""
+Process wide pool of googleapiclient service objects.
+
+Building a service parses the discovery document and sets up a new authorized HTTP transport,
+so it's done once per (api, version, delegated subject) and the service is reused afterwards,
+keeping its transport and connections open. Discovery documents are the static ones shipped
+with googleapiclient, no network fetch is done to build a service.
+
+httplib2 transports are not thread safe, so services are not shared between threads: the
+thread is part of the pool key. Requests of the services are executed within the google quota
+of their delegated user, see app.services.provider_quota.
+"""
+import functools
+import json
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+
+from app.api_config import get_config
+from app.services.provider_quota import get_provider_quota, parse_retry_after
+
+# 403 reasons of the rate limits, the daily quota ones don't recover by retrying
+_RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+
+class QuotaHttpRequest(HttpRequest):
+    """HttpRequest executed within the quota of `subject`, the delegated user of its service"""
+
+    def __init__(self, *args, subject: Optional[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.subject = subject
+
+    def execute(self, http=None, num_retries=0):
+        return get_provider_quota('google').call(
+            self.subject, lambda: HttpRequest.execute(self, http=http, num_retries=num_retries), google_retry_after
+        )
+
+
+def google_retry_after(outcome) -> Optional[float]:
+    """Seconds Google asked to wait if `outcome` is a throttled call (0 if it didn't say), None otherwise"""
+    if not isinstance(outcome, HttpError):
+        return None
+    status = outcome.resp.status
+    if status == 403 and not _RATE_LIMIT_REASONS.intersection(_reasons(outcome)):
+        return None
+    if status in (403, 429, 500, 502, 503, 504):
+        return parse_retry_after(outcome.resp.get('retry-after'))
+    return None
+
+
+def _reasons(err: HttpError) -> set[str]:
+    try:
+        content = err.content.decode() if isinstance(err.content, bytes) else err.content
+        return {error.get('reason') for error in json.loads(content)['error'].get('errors', [])}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return set()
+
+
+class GoogleServicePool:
+    """Thread safe LRU of built googleapiclient services"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._services = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, credentials, subject: str, api: str = 'calendar', version: str = 'v3'):
+        """Service for `api` acting as `subject` (domain wide delegation of `credentials`)"""
+        key = (api, version, _credentials_id(credentials), subject, threading.get_ident())
+        touch = getattr(credentials, 'touch', None)
+        with self._lock:
+            pooled = self._services.get(key)
+            if pooled is not None:
+                self._services.move_to_end(key)
+        if pooled is not None:
+            service, subject_credentials = pooled
+            # The credential manager keeps refreshing the token of the subjects in use
+            if touch is None or touch(subject) is subject_credentials:
+                with self._lock:
+                    self.hits += 1
+                return service
+        with self._lock:
+            self.misses += 1
+        # Built outside the lock, two threads never share a key so there is no race on it
+        subject_credentials = credentials.with_subject(subject)
+        service = build(
+            api,
+            version,
+            credentials=subject_credentials,
+            static_discovery=True,
+            cache_discovery=False,
+            requestBuilder=functools.partial(QuotaHttpRequest, subject=subject)
+        )
+        with self._lock:
+            self._services[key] = (service, subject_credentials)
+            while len(self._services) > self.max_size:
+                self._services.popitem(last=False)
+                self.evictions += 1
+        return service
+
+    def clear(self):
+        with self._lock:
+            self._services.clear()
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._services),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+def _credentials_id(credentials):
+    # Service account credentials are rebuilt often, identify them by their account
+    return getattr(credentials, 'service_account_email', None) or id(credentials)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_google_service_pool() -> GoogleServicePool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = GoogleServicePool(max_size=get_config().GOOGLE_SERVICE_POOL_SIZE)
+    return _pool
+
+
+def get_google_service(credentials, subject: str, api: str = 'calendar', version: str = 'v3'):
+    return get_google_service_pool().get(credentials, subject, api, version)
+
+
+def get_google_service_pool_status() -> dict:
+    return get_google_service_pool().status()
@@ -0,0 +1,245 @@
+"""
+HTTP client shared by every Microsoft Graph call of a worker process.
+
+A single requests.Session keeps a pool of keep-alive connections to graph.microsoft.com,
+so calls don't pay a TCP and TLS handshake each. Every call gets the auth header of the
+token it's given, gzip encoding, and the configured timeouts. Latency is measured per endpoint
+(with the ids of the path replaced by placeholders). Calls are paced and retried when throttled
+by the office quota, see app.services.provider_quota.
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.api_config import get_config
+from app.services.provider_concurrency import get_provider_executor
+from app.services.provider_quota import APP_SUBJECT, ProviderQuota, get_provider_quota, parse_retry_after
+
+GRAPH_URL = 'https://graph.microsoft.com/v1.0'
+# Graph JSON batching limit, see https://docs.microsoft.com/en-us/graph/json-batching
+GRAPH_BATCH_MAX_REQUESTS = 20
+# Path segments that follow these ones are ids, they are grouped in the metrics
+_COLLECTIONS = {'users', 'calendars', 'events', 'subscriptions', 'groups', 'rooms', 'places'}
+# Graph throttles with 429, and answers 503 and 504 when it's overloaded
+THROTTLED_STATUS = {429, 503, 504}
+
+
+class GraphClient:
+
+    def __init__(self, pool_size: int, connect_timeout: float, read_timeout: float,
+                 quota: Optional[ProviderQuota] = None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.quota = quota
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Accept': 'application/json', 'Accept-Encoding': 'gzip'})
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def request(self, method: str, endpoint: str, token, **kwargs) -> requests.Response:
+        """Call `endpoint` (relative to GRAPH_URL) authenticated with `token` (the office credentials)"""
+        headers = {'Authorization': f'Bearer {token["access_token"]}', **kwargs.pop('headers', {})}
+        kwargs.setdefault('timeout', self.timeout)
+        # Calls a $batch call makes
+        cost = kwargs.pop('cost', 1)
+        if self.quota is None:
+            return self._send(method, endpoint, headers, **kwargs)
+        return self.quota.call(
+            _mailbox(endpoint), lambda: self._send(method, endpoint, headers, **kwargs), _retry_after, cost
+        )
+
+    def _send(self, method, endpoint, headers, **kwargs) -> requests.Response:
+        begin = time.perf_counter()
+        failed = True
+        try:
+            response = self.session.request(method, f'{GRAPH_URL}/{endpoint.lstrip("/")}', headers=headers, **kwargs)
+            failed = response.status_code >= 400
+            return response
+        finally:
+            self._record(method, endpoint, time.perf_counter() - begin, failed)
+
+    def get(self, endpoint, token, **kwargs) -> requests.Response:
+        return self.request('GET', endpoint, token, **kwargs)
+
+    def post(self, endpoint, token, **kwargs) -> requests.Response:
+        return self.request('POST', endpoint, token, **kwargs)
+
+    def patch(self, endpoint, token, **kwargs) -> requests.Response:
+        return self.request('PATCH', endpoint, token, **kwargs)
+
+    def delete(self, endpoint, token, **kwargs) -> requests.Response:
+        return self.request('DELETE', endpoint, token, **kwargs)
+
+    def batch(self, batch_requests: list[dict], token) -> dict[str, dict]:
+        """Send `batch_requests` (see batch_request) in as few $batch calls as possible.
+
+        Requests are packed GRAPH_BATCH_MAX_REQUESTS per call, a request is always sent in the
+        same call as the ones it depends on so Graph can order them.
+        Returns the responses ({'id', 'status', 'headers', 'body'}) by request id.
+        """
+        responses = {}
+        pending = batch_requests
+        attempt = 0
+        while pending:
+            chunks = list(_batch_chunks(pending))
+            # The $batch calls don't depend on each other, each chunk keeps its own dependencies
+            for response in get_provider_executor('office').map(
+                    lambda chunk: self.post('/$batch', token, json={'requests': chunk}, cost=len(chunk)), chunks):
+                response.raise_for_status()
+                for item in response.json().get('responses', []):
+                    responses[item['id']] = item
+            pending = self._throttled(pending, responses)
+            if pending and self.quota is not None:
+                retry_after = max(parse_retry_after(responses[r['id']].get('headers', {}).get('Retry-After'))
+                                  for r in pending)
+                delay = self.quota.retry_delay(attempt, retry_after)
+                if delay is None:
+                    break
+                self.quota.pause(delay)
+                attempt += 1
+            else:
+                break
+        return responses
+
+    @staticmethod
+    def _throttled(batch_requests, responses) -> list[dict]:
+        """Requests of a $batch call to send again: the throttled ones and the ones that depend on them"""
+        throttled = set()
+        retried = []
+        for request in batch_requests:
+            status = responses.get(request['id'], {}).get('status')
+            if status in THROTTLED_STATUS or (status == 424 and throttled.intersection(request.get('dependsOn', []))):
+                throttled.add(request['id'])
+                retried.append(request)
+        # Dependencies that succeeded are not sent again
+        for position, request in enumerate(retried):
+            if 'dependsOn' in request:
+                retried[position] = {key: value for key, value in request.items() if key != 'dependsOn'}
+                depends_on = [dependency for dependency in request['dependsOn'] if dependency in throttled]
+                if depends_on:
+                    retried[position]['dependsOn'] = depends_on
+        return retried
+
+    def _record(self, method, endpoint, seconds, failed):
+        key = f'{method} {endpoint_template(endpoint)}'
+        milliseconds = seconds * 1000
+        with self._lock:
+            metric = self._metrics.setdefault(key, {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            metric['calls'] += 1
+            metric['errors'] += int(failed)
+            metric['total_ms'] += milliseconds
+            metric['max_ms'] = max(metric['max_ms'], milliseconds)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                key: {
+                    'calls': metric['calls'],
+                    'errors': metric['errors'],
+                    'avg_ms': round(metric['total_ms'] / metric['calls'], 1),
+                    'max_ms': round(metric['max_ms'], 1),
+                }
+                for key, metric in self._metrics.items()
+            }
+
+
+def batch_request(request_id: str, method: str, endpoint: str, body=None, headers=None, depends_on=None) -> dict:
+    """One request of a $batch call, `endpoint` relative to GRAPH_URL as in GraphClient.request"""
+    request = {'id': request_id, 'method': method, 'url': '/' + endpoint.lstrip('/')}
+    headers = dict(headers or {})
+    if body is not None:
+        request['body'] = body
+        headers.setdefault('Content-Type', 'application/json')
+    if headers:
+        request['headers'] = headers
+    if depends_on:
+        request['dependsOn'] = list(depends_on)
+    return request
+
+
+def batch_succeeded(response: Optional[dict]) -> bool:
+    return response is not None and 200 <= response['status'] < 300
+
+
+def _batch_chunks(batch_requests: list[dict]) -> list[list[dict]]:
+    """Requests linked by dependsOn go together, groups are packed in order up to the batch limit"""
+    group_of = {}
+    groups = []
+    for request in batch_requests:
+        linked = {id(group_of[dependency]): group_of[dependency] for dependency in request.get('dependsOn', [])}
+        group = [request]
+        for linked_group in linked.values():
+            group = linked_group + group
+            groups.remove(linked_group)
+        # Keep the original order inside the group
+        group.sort(key=batch_requests.index)
+        for member in group:
+            group_of[member['id']] = group
+        groups.append(group)
+    groups.sort(key=lambda g: batch_requests.index(g[0]))
+
+    chunks = []
+    for group in groups:
+        if len(group) > GRAPH_BATCH_MAX_REQUESTS:
+            raise ValueError(f'{len(group)} dependent requests do not fit in a single $batch call')
+        if not chunks or len(chunks[-1]) + len(group) > GRAPH_BATCH_MAX_REQUESTS:
+            chunks.append([])
+        chunks[-1].extend(group)
+    return chunks
+
+
+def _mailbox(endpoint: str) -> str:
+    """Graph throttles per mailbox, /users/ana@ofisino.com/events -> ana@ofisino.com"""
+    segments = endpoint.split('?', 1)[0].strip('/').split('/')
+    if len(segments) > 1 and segments[0] == 'users':
+        return segments[1].lower()
+    return APP_SUBJECT
+
+
+def _retry_after(outcome) -> Optional[float]:
+    if getattr(outcome, 'status_code', None) in THROTTLED_STATUS:
+        return parse_retry_after(outcome.headers.get('Retry-After'))
+    return None
+
+
+def endpoint_template(endpoint: str) -> str:
+    """/users/ana@ofisino.com/calendars/AAMk/events?$filter=... -> /users/{id}/calendars/{id}/events"""
+    segments = endpoint.split('?', 1)[0].strip('/').split('/')
+    template = []
+    for position, segment in enumerate(segments):
+        if position and segments[position - 1] in _COLLECTIONS and not segment.startswith('$'):
+            template.append('{id}')
+        else:
+            template.append(segment)
+    return '/' + '/'.join(template)
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_graph_client() -> GraphClient:
+    """Process wide client, a forked worker gets its own connections"""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                config = get_config()
+                _client = GraphClient(
+                    pool_size=config.GRAPH_POOL_SIZE,
+                    connect_timeout=config.GRAPH_CONNECT_TIMEOUT,
+                    read_timeout=config.GRAPH_READ_TIMEOUT,
+                    quota=get_provider_quota('office')
+                )
+                _client_pid = os.getpid()
+    return _client
+
+
+def get_graph_client_status() -> dict:
+    return _client.status() if _client is not None and _client_pid == os.getpid() else {}
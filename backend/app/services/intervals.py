@@ -0,0 +1,99 @@
+"""
+Interval arithmetic over epoch seconds.
+
+Busy and free time is handled as lists of `Interval(start, end)` in integer epoch seconds, half
+open (the end isn't part of the interval). Every operation sorts its input once and sweeps it,
+O(n log n), and returns a normalized list: sorted, without overlapping or touching intervals and
+without empty ones. Datetimes are only converted at the edges (from_slots, to_datetimes).
+"""
+import datetime
+import heapq
+import math
+from typing import Iterable, NamedTuple
+
+
+class Interval(NamedTuple):
+    start: int
+    end: int
+
+    @classmethod
+    def of(cls, start: datetime.datetime, end: datetime.datetime) -> 'Interval':
+        """Rounded outwards to the second, a busy slot never shrinks"""
+        return cls(math.floor(start.timestamp()), math.ceil(end.timestamp()))
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start
+
+    def to_datetimes(self, tz: datetime.tzinfo) -> tuple[datetime.datetime, datetime.datetime]:
+        return datetime.datetime.fromtimestamp(self.start, tz), datetime.datetime.fromtimestamp(self.end, tz)
+
+
+def from_slots(slots: Iterable) -> list[Interval]:
+    """Intervals of objects with `start` and `end` timezone aware datetimes (i.e. BusySlot)"""
+    return [Interval.of(slot.start, slot.end) for slot in slots]
+
+
+def union(*interval_lists: Iterable[Interval]) -> list[Interval]:
+    """Time covered by any of the intervals"""
+    merged = []
+    for start, end in sorted(interval for intervals in interval_lists for interval in intervals):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1].end:
+            if end > merged[-1].end:
+                merged[-1] = Interval(merged[-1].start, end)
+        else:
+            merged.append(Interval(start, end))
+    return merged
+
+
+def intersect(*interval_lists: Iterable[Interval]) -> list[Interval]:
+    """Time covered by every list of intervals"""
+    if not interval_lists:
+        return []
+    # Each normalized list covers a point at most once, so it's covered by all when the count reaches
+    # the number of lists
+    normalized = [union(intervals) for intervals in interval_lists]
+    required = len(normalized)
+    result = []
+    covering = 0
+    opened_at = None
+    for moment, change in heapq.merge(*(_edges(intervals) for intervals in normalized)):
+        covering += change
+        if covering == required:
+            opened_at = moment
+        elif opened_at is not None:
+            if moment > opened_at:
+                result.append(Interval(opened_at, moment))
+            opened_at = None
+    return union(result)
+
+
+def complement(intervals: Iterable[Interval], window: Interval) -> list[Interval]:
+    """Time of `window` not covered by `intervals`"""
+    free = []
+    cursor = window.start
+    for start, end in union(intervals):
+        if end <= cursor:
+            continue
+        if start >= window.end:
+            break
+        if start > cursor:
+            free.append(Interval(cursor, start))
+        cursor = end
+    if cursor < window.end:
+        free.append(Interval(cursor, window.end))
+    return free
+
+
+def at_least(intervals: Iterable[Interval], seconds: int) -> list[Interval]:
+    """Intervals at least `seconds` long"""
+    return [interval for interval in intervals if interval.length >= seconds]
+
+
+def _edges(intervals: list[Interval]):
+    """Sorted (moment, +1 / -1) edges of normalized intervals, ends sort before starts at the same moment"""
+    for start, end in intervals:
+        yield start, 1
+        yield end, -1
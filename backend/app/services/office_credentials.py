@@ -0,0 +1,194 @@
+"""
+Microsoft Graph app token shared by the whole worker process.
+
+One MSAL client per process and the token kept in memory, refreshed shortly before it
+expires (on use and by a background thread). With redis, workers share the token and a redis
+lock makes sure a single worker asks Azure AD for a new one.
+"""
+import datetime
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+import msal
+from loguru import logger
+from redis import RedisError
+
+from app.api_config import get_config
+from app.services.redis_client import get_redis
+
+OFFICE_CONFIG = {
+    "client_id": os.getenv('OFFICE_CLIENT_ID', 'MISSING_KEY'),
+    "secret": os.getenv('OFFICE_SECRET', 'MISSING_KEY'),
+    "authority": f"https://login.microsoftonline.com/{os.getenv('OFFICE_TENANT_ID', 'MISSING_KEY')}",
+    "scope": ["https://graph.microsoft.com/.default"]  # Default means those registered within app.
+}
+REDIS_KEY = 'office-token'
+# Seconds a worker can hold the redis lock while it asks for a new token
+REDIS_LOCK_TIMEOUT = 30
+
+
+class OfficeTokenProvider:
+    """Current Graph token, also readable as the token dict it replaces (token['access_token'])"""
+
+    def __init__(self, client, scopes: list[str], refresh_margin: int, redis=None):
+        self.client = client
+        self.scopes = scopes
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin)
+        self._redis = redis
+        self._token = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+        self.hits = 0
+        self.refreshes = 0
+        self.shared_hits = 0
+
+    def token(self, margin: Optional[datetime.timedelta] = None) -> dict:
+        """Token valid for at least `margin` (the refresh margin by default)"""
+        margin = margin or self.refresh_margin
+        token = self._token
+        if not self._expiring(token, margin):
+            self.hits += 1
+            return token
+        with self._lock:
+            if self._expiring(self._token, margin):
+                self._token = self._shared_or_new_token(margin)
+            return self._token
+
+    @property
+    def access_token(self) -> str:
+        return self.token()['access_token']
+
+    def __getitem__(self, key):
+        return self.token()[key]
+
+    def get(self, key, default=None):
+        return self.token().get(key, default)
+
+    def start_background_refresh(self, interval: int):
+        """Refresh the token ahead of the requests every `interval` seconds (in this process)"""
+        if interval <= 0 or (self._thread is not None and self._thread_pid == os.getpid()):
+            return
+        self._thread_pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._refresh_loop,
+            args=(interval,),
+            name='office-token-refresh',
+            daemon=True
+        )
+        self._thread.start()
+
+    def status(self) -> dict:
+        return {
+            'expires_datetime': self._token['expires_datetime'] if self._token else None,
+            'hits': self.hits,
+            'refreshes': self.refreshes,
+            'shared_hits': self.shared_hits,
+            'redis': self._redis is not None,
+        }
+
+    def _refresh_loop(self, interval: int):
+        margin = self.refresh_margin + datetime.timedelta(seconds=interval)
+        while True:
+            time.sleep(interval)
+            try:
+                self.token(margin)
+            except Exception as err:
+                logger.warning(f'Could not refresh the office token: {err}')
+
+    @staticmethod
+    def _expiring(token: Optional[dict], margin: datetime.timedelta) -> bool:
+        return (
+            token is None
+            or datetime.datetime.fromisoformat(token['expires_datetime']) - margin <= datetime.datetime.utcnow()
+        )
+
+    def _shared_or_new_token(self, margin) -> dict:
+        if self._redis is None:
+            return self._new_token()
+        token = self._load_shared_token(margin)
+        if token:
+            return token
+        try:
+            with self._redis.lock(f'{REDIS_KEY}:lock', timeout=REDIS_LOCK_TIMEOUT,
+                                  blocking_timeout=REDIS_LOCK_TIMEOUT):
+                # Another worker may have refreshed it while we waited for the lock
+                token = self._load_shared_token(margin)
+                if token:
+                    return token
+                token = self._new_token()
+                self._share_token(token)
+                return token
+        except RedisError as err:
+            logger.warning(f'Could not coordinate the office token through redis: {err}')
+            return self._new_token()
+
+    def _new_token(self) -> dict:
+        logger.info('Trying to get a new token with the client app')
+        result = self.client.acquire_token_silent(self.scopes, account=None)
+        if not result:
+            logger.info("No suitable token exists in cache. Let's get a new one from AAD.")
+            result = self.client.acquire_token_for_client(scopes=self.scopes)
+        if 'access_token' not in result:
+            raise ValueError(f"Error authenticating against office API. Response:\n{result}")
+        expires = datetime.datetime.utcnow() + datetime.timedelta(seconds=result['expires_in'])
+        self.refreshes += 1
+        return {**result, 'expires_datetime': expires.isoformat()}
+
+    def _load_shared_token(self, margin) -> Optional[dict]:
+        try:
+            shared = self._redis.get(REDIS_KEY)
+        except RedisError as err:
+            logger.warning(f'Could not read the shared office token: {err}')
+            return None
+        if not shared:
+            return None
+        token = json.loads(shared)
+        if self._expiring(token, margin):
+            return None
+        self.shared_hits += 1
+        return token
+
+    def _share_token(self, token: dict):
+        expires = datetime.datetime.fromisoformat(token['expires_datetime'])
+        ttl = int((expires - datetime.datetime.utcnow()).total_seconds())
+        if ttl > 0:
+            self._redis.set(REDIS_KEY, json.dumps(token), ex=ttl)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_office_token_provider() -> OfficeTokenProvider:
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = _build_provider()
+    _provider.start_background_refresh(get_config().OFFICE_TOKEN_REFRESH_INTERVAL)
+    return _provider
+
+
+def _build_provider():
+    config = get_config()
+    logger.info('Trying to create a new instance of a client app')
+    client = msal.ConfidentialClientApplication(
+        OFFICE_CONFIG["client_id"],
+        authority=OFFICE_CONFIG["authority"],
+        client_credential=OFFICE_CONFIG["secret"],
+        validate_authority=False
+    )
+    return OfficeTokenProvider(
+        client,
+        scopes=OFFICE_CONFIG["scope"],
+        refresh_margin=config.OFFICE_TOKEN_REFRESH_MARGIN,
+        redis=get_redis() if config.OFFICE_TOKEN_SHARE_REDIS else None
+    )
+
+
+def get_office_token_status() -> Optional[dict]:
+    return _provider.status() if _provider is not None else None
@@ -0,0 +1,104 @@
+"""
+Bounded concurrency of the calls to the calendar providers.
+
+Calls that don't depend on each other (freebusy chunks, calendars queried as their owner, $batch
+chunks, one listing per user) are made from a pool of threads per provider instead of one after
+the other, so N of them cost about the latency of the slowest one instead of N round trips.
+The size of each pool (GOOGLE_MAX_CONCURRENCY, OFFICE_MAX_CONCURRENCY) bounds the calls in flight
+per worker process, and the provider quota still paces them. The calling thread waits for the
+results, so flask handlers and rq jobs use it as any blocking call.
+"""
+import contextlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+
+from app.api_config import get_config
+
+_local = threading.local()
+
+
+class ProviderExecutor:
+
+    def __init__(self, provider: str, max_workers: int):
+        self.provider = provider
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix=f'{provider}-calls') \
+            if max_workers > 1 else None
+        self._lock = threading.Lock()
+        self.fan_outs = 0
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def map(self, func: Callable, items: Iterable) -> list:
+        """`func` of each item, in order. The first exception raised by a call is raised"""
+        items = list(items)
+        # Calls made from a pool thread run inline, waiting on the pool from it could deadlock
+        if len(items) <= 1 or self._executor is None or getattr(_local, 'inline', False):
+            return [func(item) for item in items]
+        with self._lock:
+            self.fan_outs += 1
+        futures = [self._executor.submit(self._run, func, item) for item in items]
+        return [future.result() for future in futures]
+
+    def _run(self, func, item):
+        _local.inline = True
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return func(item)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'fan_outs': self.fan_outs,
+                'calls': self.calls,
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+            }
+
+
+@contextlib.contextmanager
+def sequential_provider_calls():
+    """Make the provider calls of this thread one after the other, to compare with the fan-out"""
+    previous = getattr(_local, 'inline', False)
+    _local.inline = True
+    try:
+        yield
+    finally:
+        _local.inline = previous
+
+
+_executors = {}
+_executors_pid = None
+_executors_lock = threading.Lock()
+
+
+def get_provider_executor(provider: str) -> ProviderExecutor:
+    """Process wide executor of `provider` ('google' or 'office'), a forked worker gets its own threads"""
+    global _executors, _executors_pid
+    executor = _executors.get(provider) if _executors_pid == os.getpid() else None
+    if executor is None:
+        with _executors_lock:
+            if _executors_pid != os.getpid():
+                _executors = {}
+                _executors_pid = os.getpid()
+            executor = _executors.get(provider)
+            if executor is None:
+                max_workers = getattr(get_config(), f'{provider.upper()}_MAX_CONCURRENCY')
+                executor = _executors[provider] = ProviderExecutor(provider, max_workers)
+    return executor
+
+
+def get_provider_concurrency_status() -> dict:
+    if _executors_pid != os.getpid():
+        return {}
+    return {provider: executor.status() for provider, executor in _executors.items()}
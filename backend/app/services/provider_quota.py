@@ -0,0 +1,180 @@
+"""
+Client side quota of the calls to the calendar providers (Google APIs and Microsoft Graph).
+
+Each worker process paces its calls with token buckets, one for the provider and one per subject
+(the delegated user on Google, the mailbox on Graph), since the providers throttle on both.
+A throttled call (429, 403 rateLimitExceeded, 503) is retried with jittered exponential backoff,
+or after the Retry-After of the provider, and it also holds back the next calls of its subject.
+Bursts are slowed down instead of failing: callers wait for a token or a retry.
+"""
+import random
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from app.api_config import get_config
+
+# Subject used for calls that don't act on a user or mailbox
+APP_SUBJECT = 'app'
+
+
+class TokenBucket:
+    """`rate` calls per second with bursts of up to `rate` calls, 0 is unlimited"""
+
+    def __init__(self, rate: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self._clock = clock
+        self._tokens = rate
+        self._updated = clock()
+        self._held_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, cost: int = 1) -> float:
+        """Take `cost` tokens, returns the seconds to wait before using them"""
+        with self._lock:
+            now = self._clock()
+            wait = max(0.0, self._held_until - now)
+            if self.rate <= 0:
+                return wait
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= cost
+            if self._tokens < 0:
+                wait = max(wait, -self._tokens / self.rate)
+            return wait
+
+    def hold(self, seconds: float):
+        """No call goes out for `seconds`, the provider asked to slow down"""
+        with self._lock:
+            self._held_until = max(self._held_until, self._clock() + seconds)
+
+
+class ProviderQuota:
+
+    def __init__(self, provider: str, rate: float, subject_rate: float, max_retries: int,
+                 base_delay: float, max_delay: float, sleep: Callable[[float], Any] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic):
+        self.provider = provider
+        self.subject_rate = subject_rate
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self._clock = clock
+        self._bucket = TokenBucket(rate, clock)
+        # One bucket per user or mailbox, bounded by the size of the organization
+        self._subject_buckets = {}
+        self._lock = threading.Lock()
+        self._counters = {'calls': 0, 'throttled': 0, 'retries': 0, 'gave_up': 0, 'waited_seconds': 0.0}
+
+    def call(self, subject: Optional[str], func: Callable, retry_after: Callable[[Any], Optional[float]],
+             cost: int = 1):
+        """Call `func` within the quota of `subject`, retrying it while the provider throttles it.
+
+        `retry_after(outcome)` gets what `func` returned or raised and returns None when it wasn't
+        throttled, otherwise the seconds the provider asked to wait (0 if it didn't say). `cost`
+        is the number of calls `func` makes, as a batch does. Once the retries are exhausted the
+        last outcome is returned or raised.
+        """
+        subject = subject or APP_SUBJECT
+        attempt = 0
+        while True:
+            self._wait(subject, cost)
+            try:
+                outcome = func()
+                failed = False
+            except Exception as err:
+                outcome = err
+                failed = True
+            throttled_for = retry_after(outcome)
+            if throttled_for is None:
+                break
+            delay = self.retry_delay(attempt, throttled_for)
+            if delay is None:
+                break
+            # Calls of the same subject made meanwhile by other threads wait too
+            self._subject_bucket(subject).hold(delay)
+            attempt += 1
+        if failed:
+            raise outcome
+        return outcome
+
+    def retry_delay(self, attempt: int, retry_after: float) -> Optional[float]:
+        """Seconds to wait before retrying a call throttled `attempt + 1` times, None to give up"""
+        self._count(throttled=1)
+        delay = max(retry_after, self._backoff(attempt))
+        if attempt >= self.max_retries or delay > self.max_delay:
+            self._count(gave_up=1)
+            return None
+        self._count(retries=1)
+        return delay
+
+    def pause(self, seconds: float):
+        """Wait before retrying the throttled requests of a batch"""
+        self._count(waited_seconds=seconds)
+        self._sleep(seconds)
+
+    def _wait(self, subject, cost):
+        wait = max(self._bucket.reserve(cost), self._subject_bucket(subject).reserve(cost))
+        self._count(calls=cost, waited_seconds=wait)
+        if wait > 0:
+            self._sleep(wait)
+
+    def _backoff(self, attempt) -> float:
+        return min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1)
+
+    def _subject_bucket(self, subject) -> TokenBucket:
+        with self._lock:
+            bucket = self._subject_buckets.get(subject)
+            if bucket is None:
+                bucket = self._subject_buckets[subject] = TokenBucket(self.subject_rate, self._clock)
+            return bucket
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, increment in increments.items():
+                self._counters[name] += increment
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                'waited_seconds': round(self._counters['waited_seconds'], 1),
+                'subjects': len(self._subject_buckets),
+            }
+
+
+_quotas = {}
+_quotas_lock = threading.Lock()
+
+
+def get_provider_quota(provider: str) -> ProviderQuota:
+    """Process wide quota of `provider` ('google' or 'office')"""
+    quota = _quotas.get(provider)
+    if quota is None:
+        with _quotas_lock:
+            quota = _quotas.get(provider)
+            if quota is None:
+                config = get_config()
+                prefix = provider.upper()
+                quota = _quotas[provider] = ProviderQuota(
+                    provider,
+                    rate=getattr(config, f'{prefix}_RATE_LIMIT'),
+                    subject_rate=getattr(config, f'{prefix}_SUBJECT_RATE_LIMIT'),
+                    max_retries=config.PROVIDER_MAX_RETRIES,
+                    base_delay=config.PROVIDER_RETRY_BASE_DELAY,
+                    max_delay=config.PROVIDER_RETRY_MAX_DELAY
+                )
+    return quota
+
+
+def get_provider_quota_status() -> dict:
+    return {provider: quota.status() for provider, quota in _quotas.items()}
+
+
+def parse_retry_after(value) -> float:
+    """Seconds of a Retry-After header, 0 if missing or given as a date"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return 0.0
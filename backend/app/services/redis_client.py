@@ -0,0 +1,19 @@
+"""Redis connection shared by the services of a worker process"""
+import threading
+
+from redis import Redis
+
+from app.api_config import get_config
+
+_redis = None
+_redis_lock = threading.Lock()
+
+
+def get_redis() -> Redis:
+    """Process wide client, redis-py keeps its own connection pool behind it"""
+    global _redis
+    if _redis is None:
+        with _redis_lock:
+            if _redis is None:
+                _redis = Redis.from_url(get_config().REDIS_URL)
+    return _redis
@@ -0,0 +1,365 @@
+"""
+Availability engine used to organize meetings.
+
+The scheduling window is split in a grid of points every `step` minutes, from `start` to `end`
+(both included). Each calendar becomes a boolean occupancy vector over that grid and finding a
+meeting is a matter of AND-ing the vectors and looking for runs of free points long enough
+to hold the meeting, which numpy does in microseconds.
+
+A point is busy when it falls inside a busy slot, edges included. So a meeting can't start
+at the exact minute another one ends (there's always a grid step in between), same as the
+pandas based scheduler this replaces.
+"""
+import datetime
+from typing import Iterable, Optional
+
+import numpy as np
+
+from app.services import intervals
+
+SATURDAY, SUNDAY = 5, 6
+NON_WORKING_DAYS = (SATURDAY, SUNDAY)
+DEFAULT_STEP_MINUTES = 5
+# Weights of the terms of the score of a meeting slot, each term goes from 0 to 1 and lower is better
+EARLINESS_WEIGHT = 1.0
+FRAGMENTATION_WEIGHT = 0.5
+PREFERRED_TIME_WEIGHT = 2.0
+ABSENCE_WEIGHT = 1.0
+
+_SECONDS_PER_DAY = 24 * 60 * 60
+# 1970-01-01 was a thursday
+_EPOCH_WEEKDAY = 3
+_EPOCH_DATE = datetime.date(1970, 1, 1)
+
+
+class TimeGrid:
+    """Grid of points every `step` minutes between `start` and `end`.
+
+    `start` and `end` must be timezone aware. Times of the day and weekdays are evaluated on
+    the timezone of `start`.
+    """
+
+    def __init__(self, start: datetime.datetime, end: datetime.datetime, step: int = DEFAULT_STEP_MINUTES):
+        if start.tzinfo is None or end.tzinfo is None:
+            raise ValueError('start and end must be timezone aware datetimes')
+        self.start = start
+        self.end = end
+        self.step = step
+        self.step_seconds = step * 60
+        self.origin = int(start.timestamp())
+        size = int((end - start).total_seconds() // self.step_seconds) + 1
+        self.size = max(size, 0)
+        self.epochs = self.origin + np.arange(self.size, dtype=np.int64) * self.step_seconds
+        self.seconds_of_day, self.weekdays, self.local_days = self._local_time(start.tzinfo)
+
+    def _local_time(self, tz: datetime.tzinfo):
+        """Time of the day in seconds, weekday and days since 1970-01-01 of every point on `tz`"""
+        local_epochs = self.epochs + self._utc_offsets(tz)
+        local_days = local_epochs // _SECONDS_PER_DAY
+        return local_epochs % _SECONDS_PER_DAY, (local_days + _EPOCH_WEEKDAY) % 7, local_days
+
+    @staticmethod
+    def _utc_offset_at(epoch, tz) -> int:
+        moment = datetime.datetime.fromtimestamp(int(epoch), tz=tz)
+        return int(moment.utcoffset().total_seconds())
+
+    def _utc_offsets(self, tz):
+        if not self.size:
+            return 0
+        first, last = self._utc_offset_at(self.epochs[0], tz), self._utc_offset_at(self.epochs[-1], tz)
+        if first == last:
+            return first
+        # The window crosses a DST change, resolve the offset point by point
+        return np.array([self._utc_offset_at(epoch, tz) for epoch in self.epochs], dtype=np.int64)
+
+    def datetime_at(self, index: int) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(int(self.epochs[index]), tz=self.start.tzinfo)
+
+    def occupancy(self, slots: Iterable) -> np.ndarray:
+        """Boolean vector, True on every grid point covered by one of `slots`.
+
+        `slots` are objects with `start` and `end` timezone aware datetimes (i.e. BusySlot)
+        """
+        # Overlapping slots are merged first, a calendar is often busy with a meeting and its room
+        merged = intervals.union(intervals.from_slots(slots))
+        busy = np.zeros(self.size, dtype=bool)
+        if not merged or not self.size:
+            return busy
+        starts = np.array([interval.start for interval in merged], dtype=np.float64)
+        ends = np.array([interval.end for interval in merged], dtype=np.float64)
+        first = np.ceil((starts - self.origin) / self.step_seconds).astype(np.int64)
+        last = np.floor((ends - self.origin) / self.step_seconds).astype(np.int64)
+        first = np.clip(first, 0, self.size)
+        last = np.clip(last, -1, self.size - 1)
+        valid = first <= last
+        changes = np.zeros(self.size + 1, dtype=np.int32)
+        np.add.at(changes, first[valid], 1)
+        np.add.at(changes, last[valid] + 1, -1)
+        return np.cumsum(changes[:-1]) > 0
+
+    def occupancy_matrix(self, slots_by_calendar: Iterable[Iterable]) -> np.ndarray:
+        """One occupancy row per calendar"""
+        rows = [self.occupancy(slots) for slots in slots_by_calendar]
+        if not rows:
+            return np.zeros((0, self.size), dtype=bool)
+        return np.vstack(rows)
+
+    def free(self, slots_by_calendar: Iterable[Iterable]) -> np.ndarray:
+        """True where every calendar is free"""
+        return ~self.occupancy_matrix(slots_by_calendar).any(axis=0)
+
+    def within_hours(self, time_start: datetime.time, time_end: datetime.time) -> np.ndarray:
+        """True on points whose time of the day is between `time_start` and `time_end`, both included"""
+        return _within(self.seconds_of_day, time_start, time_end)
+
+    def working_hours(self, time_start: datetime.time, time_end: datetime.time, days: Iterable[int],
+                      tz: Optional[datetime.tzinfo] = None) -> np.ndarray:
+        """True on points between `time_start` and `time_end` (both included) of `days` (monday is 0),
+        evaluated on `tz` (default the timezone of the grid)"""
+        if tz is None:
+            seconds_of_day, weekdays = self.seconds_of_day, self.weekdays
+        else:
+            seconds_of_day, weekdays, _ = self._local_time(tz)
+        return _within(seconds_of_day, time_start, time_end) & np.isin(weekdays, list(days))
+
+    def days_off(self, dates: Iterable[datetime.date]) -> np.ndarray:
+        """True on points that fall on one of `dates` on the timezone of the grid"""
+        return np.isin(self.local_days, [(date - _EPOCH_DATE).days for date in dates])
+
+    def working_days(self, non_working_days=NON_WORKING_DAYS) -> np.ndarray:
+        return ~np.isin(self.weekdays, non_working_days)
+
+    def span(self, duration: int) -> int:
+        """Amount of grid steps a meeting of `duration` minutes takes"""
+        return -(-duration // self.step)
+
+    def fits(
+            self,
+            free: np.ndarray,
+            duration: int,
+            time_start: datetime.time,
+            time_end: datetime.time,
+            non_working_days=NON_WORKING_DAYS,
+            usable: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Boolean mask of the grid points where a meeting of `duration` minutes can start.
+
+        A meeting fits when every point from its start to its end (both included) is free and
+        within hours, and it neither starts nor ends on a non working day.
+        `usable` is an extra mask to AND in, if given.
+        `free` can be a matrix, then each row is evaluated on its own (along the last axis).
+        The result is shorter than the grid, the last points can't hold a whole meeting.
+        """
+        span = self.span(duration)
+        window = span + 1
+        if window > self.size:
+            return np.zeros((*free.shape[:-1], 0), dtype=bool)
+        ok = self.available(free, time_start, time_end, usable)
+        ok_count = np.cumsum(ok, axis=-1, dtype=np.int32)
+        ok_count = np.concatenate((np.zeros((*ok.shape[:-1], 1), dtype=np.int32), ok_count), axis=-1)
+        fits = (ok_count[..., window:] - ok_count[..., :-window]) == window
+        working = self.working_days(non_working_days)
+        return fits & working[:self.size - span] & working[span:]
+
+    def available(self, free: np.ndarray, time_start: datetime.time, time_end: datetime.time,
+                  usable: Optional[np.ndarray] = None) -> np.ndarray:
+        """Points a meeting can take: free, within hours and usable"""
+        ok = free & self.within_hours(time_start, time_end)
+        if usable is not None:
+            ok &= usable
+        return ok
+
+    def feasible_starts(
+            self,
+            free: np.ndarray,
+            duration: int,
+            time_start: datetime.time,
+            time_end: datetime.time,
+            non_working_days=NON_WORKING_DAYS,
+            usable: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Indexes of the grid points where a meeting of `duration` minutes can start, see `fits`"""
+        return np.flatnonzero(self.fits(free, duration, time_start, time_end, non_working_days, usable))
+
+    def ranked_starts(
+            self,
+            free: np.ndarray,
+            duration: int,
+            count: int,
+            time_start: datetime.time,
+            time_end: datetime.time,
+            preferred_time: Optional[datetime.time] = None,
+            non_working_days=NON_WORKING_DAYS,
+            usable: Optional[np.ndarray] = None,
+    ) -> list[tuple[float, int]]:
+        """Up to `count` (score, index) of the best grid points to start a meeting, best first.
+
+        Every feasible start (see `fits`) is scored at once, lower is better:
+        - earliness, how far from the start of the grid it is
+        - fragmentation, how many of the free gaps it leaves before and after it, within its run of
+          free points, are too short for another meeting as long
+        - distance of its time of the day to `preferred_time`, if given
+        The chosen meetings don't overlap each other, so every option is a different time.
+        """
+        starts = self.feasible_starts(free, duration, time_start, time_end, non_working_days, usable)
+        ok = self.available(free, time_start, time_end, usable)
+        scores = self.scores(starts, ok, duration, time_start, time_end, preferred_time)
+        return self.best_starts(starts, scores, duration, count)
+
+    def scores(
+            self,
+            starts: np.ndarray,
+            ok: np.ndarray,
+            duration: int,
+            time_start: datetime.time,
+            time_end: datetime.time,
+            preferred_time: Optional[datetime.time] = None,
+    ) -> np.ndarray:
+        """Score of a meeting at each of `starts`, `ok` are the grid points a meeting can take. See ranked_starts"""
+        if not len(starts):
+            return np.zeros(0)
+        span = self.span(duration)
+        points = np.arange(self.size)
+        run_start = np.maximum.accumulate(np.where(ok, 0, points + 1))
+        run_end = np.minimum.accumulate(np.where(ok, self.size, points)[::-1])[::-1] - 1
+        gaps = np.stack((starts - run_start[starts], run_end[starts] - starts - span))
+        fragments = ((gaps > 0) & (gaps <= span)).sum(axis=0)
+        scores = EARLINESS_WEIGHT * starts / self.size + FRAGMENTATION_WEIGHT * fragments / 2
+        if preferred_time is not None:
+            distance = np.abs(self.seconds_of_day[starts] - _seconds(preferred_time))
+            distance = np.minimum(distance, _SECONDS_PER_DAY - distance)
+            hours = (_seconds(time_end) - _seconds(time_start)) % _SECONDS_PER_DAY or _SECONDS_PER_DAY
+            scores += PREFERRED_TIME_WEIGHT * np.minimum(distance / hours, 1)
+        return scores
+
+    def best_starts(self, starts: np.ndarray, scores: np.ndarray, duration: int, count: int) -> list[tuple[float, int]]:
+        """Up to `count` (score, index) of the lowest scored `starts` whose meetings don't overlap"""
+        span = self.span(duration)
+        ranked = []
+        for position in np.argsort(scores, kind='stable'):
+            start = int(starts[position])
+            if all(abs(start - other) > span for _, other in ranked):
+                ranked.append((float(scores[position]), start))
+                if len(ranked) == count:
+                    break
+        return ranked
+
+
+class Availability:
+    """Occupancy of many calendars over the same TimeGrid.
+
+    Busy slots are loaded once, then every question (which room, which attendees) is answered
+    in memory by combining rows of the occupancy matrix.
+    Masks are compiled once too: `usable` are the grid points anybody can meet at (i.e. not on
+    holidays) and `usable_by_calendar` the ones of each calendar (i.e. its working hours), out of
+    them a calendar is as busy as in a meeting. Starts they rule out are never generated.
+    """
+
+    def __init__(self, grid: TimeGrid, busy_slots_by_calendar: dict, time_start: datetime.time,
+                 time_end: datetime.time, usable: Optional[np.ndarray] = None,
+                 usable_by_calendar: Optional[dict] = None):
+        self.grid = grid
+        self.time_start = time_start
+        self.time_end = time_end
+        self.usable = usable
+        self.busy_slots_by_calendar = busy_slots_by_calendar
+        self.calendar_ids = list(busy_slots_by_calendar)
+        self._rows = {cal_id: row for row, cal_id in enumerate(self.calendar_ids)}
+        self.busy = grid.occupancy_matrix(busy_slots_by_calendar.values())
+        for cal_id, mask in (usable_by_calendar or {}).items():
+            if cal_id in self._rows:
+                self.busy[self._rows[cal_id]] |= ~mask
+
+    def rows(self, calendar_ids: Iterable[str]) -> list[int]:
+        return [self._rows[cal_id] for cal_id in calendar_ids]
+
+    def free(self, calendar_ids: Iterable[str]) -> np.ndarray:
+        """True where every calendar in `calendar_ids` is free"""
+        return ~self.busy[self.rows(calendar_ids)].any(axis=0)
+
+    def free_excusing_each(self, calendar_ids: list[str], excused_ids: list[str]) -> np.ndarray:
+        """Row i is True where every calendar in `calendar_ids` but `excused_ids[i]` is free.
+
+        Busy calendars are counted once per grid point and each excused row is subtracted,
+        so excusing n attendees costs a single pass instead of n schedulings.
+        """
+        busy_count = self.busy[self.rows(calendar_ids)].sum(axis=0, dtype=np.int32)
+        return (busy_count - self.busy[self.rows(excused_ids)]) == 0
+
+    def feasible_starts(self, free: np.ndarray, duration: int, usable: Optional[np.ndarray] = None) -> np.ndarray:
+        return self.grid.feasible_starts(free, duration, self.time_start, self.time_end,
+                                         usable=_both(usable, self.usable))
+
+    def ranked_starts(self, free: np.ndarray, duration: int, count: int,
+                      preferred_time: Optional[datetime.time] = None) -> list[tuple[float, int]]:
+        return self.grid.ranked_starts(free, duration, count, self.time_start, self.time_end, preferred_time,
+                                       usable=self.usable)
+
+    def quorum_starts(
+            self,
+            cals: list[str],
+            required: list[str],
+            min_attendees: int,
+            duration: int,
+            count: int,
+            preferred_time: Optional[datetime.time] = None,
+            meeting_room: Optional[str] = None,
+    ) -> list[tuple[float, int, list[str]]]:
+        """Up to `count` (score, index, absentees) of meetings at least `min_attendees` of `cals` can attend.
+
+        Every attendee in `required` must attend and `meeting_room`, if given, must be free.
+        Whether each attendee can attend a meeting starting at each grid point is evaluated at once
+        (a row per attendee) and the attendees are counted per start in a single pass, instead of
+        scheduling again for each combination of absentees. Meetings with fewer absentees score better.
+        """
+        grid = self.grid
+        room_free = self.free([meeting_room]) if meeting_room else np.ones(grid.size, dtype=bool)
+        free = ~self.busy[self.rows(cals)] & room_free
+        fits = grid.fits(free, duration, self.time_start, self.time_end, usable=self.usable)
+        if not fits.shape[-1]:
+            return []
+        required_rows = [cals.index(cal_id) for cal_id in required]
+        attending = fits.sum(axis=0)
+        starts = np.flatnonzero((attending >= min_attendees) & fits[required_rows].all(axis=0))
+        # Points a meeting with quorum can take, to measure the fragmentation around it
+        ok = (free.sum(axis=0) >= min_attendees) & free[required_rows].all(axis=0) & room_free
+        ok = grid.available(ok, self.time_start, self.time_end, self.usable)
+        scores = grid.scores(starts, ok, duration, self.time_start, self.time_end, preferred_time)
+        scores += ABSENCE_WEIGHT * (len(cals) - attending[starts]) / len(cals)
+        return [
+            (score, index, [cals[row] for row in np.flatnonzero(~fits[:, index])])
+            for score, index in grid.best_starts(starts, scores, duration, count)
+        ]
+
+    def first_feasible_starts(self, free: np.ndarray, duration: int) -> np.ndarray:
+        """First feasible start of each row of `free`, -1 for the rows where the meeting doesn't fit"""
+        fits = self.grid.fits(free, duration, self.time_start, self.time_end, usable=self.usable)
+        if not fits.shape[-1]:
+            return np.full(free.shape[:-1], -1, dtype=np.int64)
+        return np.where(fits.any(axis=-1), fits.argmax(axis=-1), -1)
+
+    def count_busy_slots(self, calendar_id: str, start: datetime.datetime, end: datetime.datetime) -> int:
+        """Amount of busy slots of `calendar_id` that overlap `start` - `end`, edges included"""
+        return sum(
+            1
+            for slot in self.busy_slots_by_calendar[calendar_id]
+            if slot.start <= end and slot.end >= start
+        )
+
+
+def _both(mask: Optional[np.ndarray], other: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    if mask is None or other is None:
+        return other if mask is None else mask
+    return mask & other
+
+
+def _within(seconds_of_day: np.ndarray, time_start: datetime.time, time_end: datetime.time) -> np.ndarray:
+    start_seconds = _seconds(time_start)
+    end_seconds = _seconds(time_end)
+    if start_seconds <= end_seconds:
+        return (seconds_of_day >= start_seconds) & (seconds_of_day <= end_seconds)
+    return (seconds_of_day >= start_seconds) | (seconds_of_day <= end_seconds)
+
+
+def _seconds(t: datetime.time) -> float:
+    return t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1_000_000
@@ -0,0 +1,198 @@
+"""
+Working hours of the users and holidays of the organization, compiled into scheduler masks.
+
+The working hours of a user are the ones stored on the db (User.working_hours) or else the ones
+set on the provider (Outlook mailbox settings, the Google Calendar API doesn't expose them).
+Holidays are the all day events of the HOLIDAY_CALENDAR_ID calendar. The working hours on the db
+are read by every search. The ones on the provider and the holidays change rarely, so each worker
+keeps them for WORKING_HOURS_MAX_AGE seconds and a search only asks the provider for the users and
+years it hasn't seen. They become boolean masks over the grid of the search, see
+app.services.scheduler.Availability.
+"""
+import dataclasses
+import datetime
+import threading
+import time
+from typing import Iterable, Optional
+
+import numpy as np
+import pytz
+from loguru import logger
+
+from app.api_config import get_config
+from app.persistence.models import User
+from app.persistence.session import get_session
+from app.services.scheduler import TimeGrid
+from app.services.windows_timezones import iana_timezone
+
+
+@dataclasses.dataclass(frozen=True)
+class WorkingHours:
+    start: datetime.time
+    end: datetime.time
+    # Weekdays, monday is 0
+    days: tuple[int, ...]
+    # IANA name, None if it wasn't given (setworkinghours without --timezone): the one of the meeting
+    timezone: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, value: dict) -> 'WorkingHours':
+        """From {'start': 'HH:MM', 'end': 'HH:MM', 'days': [0..6], 'timezone'} as stored or fetched.
+
+        The timezone is an IANA or Windows name (Outlook gives those), an unknown one raises ValueError
+        instead of reading the hours on another timezone.
+        """
+        timezone = value.get('timezone')
+        if timezone is not None:
+            timezone = iana_timezone(timezone)
+            if timezone is None:
+                raise ValueError(f"Unknown timezone {value['timezone']}")
+        return cls(
+            start=datetime.time.fromisoformat(value['start']),
+            end=datetime.time.fromisoformat(value['end']),
+            days=tuple(sorted(set(value['days']))),
+            timezone=timezone
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            'start': self.start.isoformat(timespec='minutes'),
+            'end': self.end.isoformat(timespec='minutes'),
+            'days': list(self.days),
+            'timezone': self.timezone,
+        }
+
+    def mask(self, grid: TimeGrid) -> np.ndarray:
+        """True on the points of `grid` within these working hours"""
+        tz = pytz.timezone(self.timezone) if self.timezone else None
+        return grid.working_hours(self.start, self.end, self.days, tz)
+
+
+class WorkingHoursCache:
+    """Working hours by email and holidays by year, each one kept for `max_age` seconds"""
+
+    def __init__(self, max_age: int):
+        self.max_age = max_age
+        self._working_hours = {}
+        self._holidays = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def working_hours(self, cman, emails: list[str], stored: dict[str, Optional[dict]]) -> dict[str, WorkingHours]:
+        """Working hours of each of `emails` that has them, `stored` are the ones on the db by email.
+
+        The stored ones are read by every search, so a change applies right away, only the ones of the
+        provider are kept.
+        """
+        emails = list(dict.fromkeys(emails))
+        found = {email: _parse(email, stored[email]) for email in emails if stored.get(email)}
+        without_stored = [email for email in emails if email not in found]
+        from_provider = self._fresh(self._working_hours, without_stored)
+        missing = [email for email in without_stored if email not in from_provider]
+        if missing:
+            fetched = cman.get_working_hours(missing)
+            fetched = {email: _parse(email, fetched.get(email)) for email in missing}
+            self._keep(self._working_hours, fetched)
+            from_provider.update(fetched)
+        found.update(from_provider)
+        return {email: working_hours for email, working_hours in found.items() if working_hours}
+
+    def holidays(self, cman, calendar_id: str, start: datetime.date, end: datetime.date) -> set[datetime.date]:
+        """Holidays from `start` to `end`, both included. Fetched a whole year at a time"""
+        years = list(range(start.year, end.year + 1))
+        found = self._fresh(self._holidays, years)
+        fetched = {
+            year: cman.get_holidays(calendar_id, datetime.date(year, 1, 1), datetime.date(year, 12, 31))
+            for year in years if year not in found
+        }
+        self._keep(self._holidays, fetched)
+        found.update(fetched)
+        return {day for days in found.values() for day in days if start <= day <= end}
+
+    def _fresh(self, entries: dict, keys: list) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            found = {
+                key: entries[key][1] for key in keys
+                if key in entries and now - entries[key][0] <= self.max_age
+            }
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def _keep(self, entries: dict, values: dict):
+        now = time.monotonic()
+        with self._lock:
+            entries.update((key, (now, value)) for key, value in values.items())
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                'users': len(self._working_hours),
+                'holiday_years': len(self._holidays),
+                'max_age': self.max_age,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+def _parse(email: str, value: Optional[dict]) -> Optional[WorkingHours]:
+    """None without working hours or if they are invalid"""
+    if not value:
+        return None
+    try:
+        return WorkingHours.from_dict(value)
+    except (KeyError, TypeError, ValueError) as err:
+        logger.warning(f'Invalid working hours of {email}: {err}')
+        return None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_working_hours_cache() -> WorkingHoursCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = WorkingHoursCache(get_config().WORKING_HOURS_MAX_AGE)
+    return _cache
+
+
+def get_working_hours(cman, emails: list[str]) -> dict[str, WorkingHours]:
+    """Working hours of the users of `emails` that have them set, on the db or on the provider"""
+    users = get_session().query(User.email, User.working_hours).filter(
+        User.email.in_(emails), User.deleted_at.is_(None)
+    ).all()
+    return get_working_hours_cache().working_hours(cman, emails, {user.email: user.working_hours for user in users})
+
+
+def get_holidays(cman, start: datetime.date, end: datetime.date) -> set[datetime.date]:
+    """Holidays of the organization from `start` to `end`, none without HOLIDAY_CALENDAR_ID"""
+    calendar_id = get_config().HOLIDAY_CALENDAR_ID
+    if not calendar_id:
+        return set()
+    return get_working_hours_cache().holidays(cman, calendar_id, start, end)
+
+
+def working_hours_masks(grid: TimeGrid, working_hours: dict[str, WorkingHours]) -> dict[str, np.ndarray]:
+    """Mask of the working hours of each calendar, users with the same hours share it"""
+    masks = {}
+    for hours in working_hours.values():
+        if hours not in masks:
+            masks[hours] = hours.mask(grid)
+    return {cal_id: masks[hours] for cal_id, hours in working_hours.items()}
+
+
+def holidays_mask(grid: TimeGrid, holidays: Iterable[datetime.date]) -> Optional[np.ndarray]:
+    """True on the points of `grid` that aren't holidays, None without holidays"""
+    holidays = list(holidays)
+    if not holidays:
+        return None
+    return ~grid.days_off(holidays)
+
+
+def get_working_hours_status() -> Optional[dict]:
+    return _cache.status() if _cache is not None else None
@@ -1,4 +1,19 @@
+import datetime
 import time
+from typing import Optional
+from uuid import uuid4
+
+from rq import get_current_job
+
+from app.api_config import get_config
+
+# Seconds an organize meeting job can run before rq kills it
+ORGANIZE_MEETING_JOB_TIMEOUT = 5 * 60
+CALENDAR_SUBSCRIPTIONS_RENEWAL_JOB_PREFIX = 'renew-calendar-subscriptions-'
+CALENDAR_EVENTS_SYNC_JOB_PREFIX = 'sync-calendar-events-'
+DIRECTORY_REFRESH_JOB_PREFIX = 'refresh-directory-'
+
+_app = None
 
 
 def example(seconds: int, **kwargs):
@@ -6,3 +21,129 @@ def example(seconds: int, **kwargs):
     time.sleep(int(seconds))
     print('Task completed')
     return seconds
+
+
+def organize_meeting(meeting_request_id: int, requester_email: str, args: dict):
+    """Search the options of a MeetingRequest created by POST /organizemeeting (async mode).
+
+    Progress is reported on the job meta (see /task/<task_id>) and the options are both stored
+    on the MeetingRequest and returned as the job result.
+    """
+    # Imported here because app.api imports this module to register the queue
+    from app.api_credentials import get_service_credentials_or_abort_with_http_500
+    from app.blueprints.calendar.calendar_api import compute_meeting_options
+    from app.blueprints.helpers import get_model_by_id, status_meeting_request
+    from app.calendar_class import CalendarManager
+    from app.persistence.models import MeetingRequest
+    from app.persistence.session import get_session
+
+    job = get_current_job()
+    with _get_app().app_context():
+        try:
+            cman = CalendarManager(config=get_service_credentials_or_abort_with_http_500())
+            return compute_meeting_options(
+                cman, meeting_request_id, requester_email, args, progress=_job_progress(job)
+            )
+        except Exception:
+            get_session().rollback()
+            mr = get_model_by_id(meeting_request_id, MeetingRequest, "meeting_request")
+            # The search failed, it doesn't mean there's no slot
+            mr.status = status_meeting_request['failed']
+            get_session().commit()
+            raise
+
+
+def renew_calendar_subscriptions():
+    """Renew the push notification subscriptions about to expire, then schedule the next run"""
+    from app.api_credentials import get_service_credentials_or_abort_with_http_500
+    from app.blueprints.notifications.notifications_blueprint import renew_subscriptions
+    from app.calendar_class import CalendarManager
+
+    with _get_app().app_context():
+        try:
+            cman = CalendarManager(config=get_service_credentials_or_abort_with_http_500())
+            return renew_subscriptions(cman)
+        finally:
+            schedule_calendar_subscriptions_renewal(_get_app().task_queue)
+
+
+def schedule_calendar_subscriptions_renewal(queue):
+    """Run renew_calendar_subscriptions in CALENDAR_SUBSCRIPTION_RENEW_INTERVAL seconds, unless it's already scheduled"""
+    _schedule_once(
+        queue, renew_calendar_subscriptions, CALENDAR_SUBSCRIPTIONS_RENEWAL_JOB_PREFIX,
+        get_config().CALENDAR_SUBSCRIPTION_RENEW_INTERVAL
+    )
+
+
+def sync_calendar_events(calendars: Optional[list[list[str]]] = None):
+    """Pull the changes of the calendars into the event mirror.
+
+    `calendars` are [owner email, calendar id] pairs, by default every calendar of the organization
+    is synced and the next run is scheduled.
+    """
+    from app.api_credentials import get_service_credentials_or_abort_with_http_500
+    from app.blueprints.helpers import get_organization_calendars
+    from app.calendar_class import CalendarManager
+    from app.services.event_mirror import sync_calendars
+
+    with _get_app().app_context():
+        try:
+            cman = CalendarManager(config=get_service_credentials_or_abort_with_http_500())
+            return sync_calendars(cman, calendars or get_organization_calendars())
+        finally:
+            if calendars is None:
+                schedule_calendar_events_sync(_get_app().task_queue)
+
+
+def schedule_calendar_events_sync(queue):
+    """Run sync_calendar_events in CALENDAR_MIRROR_SYNC_INTERVAL seconds, unless it's already scheduled"""
+    _schedule_once(
+        queue, sync_calendar_events, CALENDAR_EVENTS_SYNC_JOB_PREFIX, get_config().CALENDAR_MIRROR_SYNC_INTERVAL
+    )
+
+
+def refresh_directory():
+    """Replace the directory snapshot and schedule the next refresh"""
+    from app.api_credentials import get_service_credentials_or_abort_with_http_500
+    from app.calendar_class import CalendarManager
+    from app.services.directory_cache import get_directory_cache
+
+    with _get_app().app_context():
+        cache = get_directory_cache()
+        if cache is None:
+            return None
+        try:
+            return cache.refresh(CalendarManager(config=get_service_credentials_or_abort_with_http_500()))
+        finally:
+            schedule_directory_refresh(_get_app().task_queue)
+
+
+def schedule_directory_refresh(queue):
+    """Run refresh_directory in DIRECTORY_REFRESH_INTERVAL seconds, unless it's already scheduled"""
+    _schedule_once(queue, refresh_directory, DIRECTORY_REFRESH_JOB_PREFIX, get_config().DIRECTORY_REFRESH_INTERVAL)
+
+
+def _schedule_once(queue, func, job_prefix: str, seconds: int):
+    """Scheduled jobs need a worker started with --with-scheduler"""
+    scheduled = queue.scheduled_job_registry.get_job_ids()
+    if any(job_id.startswith(job_prefix) for job_id in scheduled):
+        return
+    queue.enqueue_in(datetime.timedelta(seconds=seconds), func, job_id=f'{job_prefix}{uuid4().hex}')
+
+
+def _get_app():
+    """One flask app per worker process, jobs only need its context"""
+    global _app
+    if _app is None:
+        from app.api import create_app
+        _app = create_app()
+    return _app
+
+
+def _job_progress(job):
+    def progress(step: str, percent: int):
+        if job is None:
+            return
+        job.meta['progress'] = {'step': step, 'percent': percent}
+        job.save_meta()
+    return progress
@@ -0,0 +1,23 @@
+from app.persistence.session import get_engine, get_pool_status
+
+
+def test_engine_is_shared_between_calls():
+    db_url = 'sqlite:///./testing.sqlite'
+    assert get_engine(db_url) is get_engine(db_url)
+
+
+def test_pool_status_counts_checkouts():
+    db_url = 'sqlite:///./testing.sqlite'
+    engine = get_engine(db_url)
+    before = get_pool_status(db_url)['checkouts']
+    with engine.connect():
+        pass
+    status = get_pool_status(db_url)
+    assert status['checkouts'] == before + 1
+    assert status['pid']
+
+
+def test_stats_needs_login(client):
+    resp = client.get('/stats')
+    # Sent to the login
+    assert resp.status_code == 302
@@ -0,0 +1,127 @@
+import contextlib
+
+from app.services import directory_cache
+from app.services.directory_cache import DirectoryCache
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value):
+        self.values[key] = str(value)
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def hdel(self, key, field):
+        self.values.get(key, {}).pop(field, None)
+
+    def rename(self, key, new_key):
+        self.values[new_key] = self.values.pop(key)
+
+    def hset(self, key, mapping):
+        self.values.setdefault(key, {}).update(mapping)
+
+    def hgetall(self, key):
+        return self.values.get(key, {})
+
+    def hmget(self, key, fields):
+        return [self.values.get(key, {}).get(field) for field in fields]
+
+    def hlen(self, key):
+        return len(self.values.get(key, {}))
+
+    def lock(self, name, timeout=None, blocking_timeout=None):
+        return contextlib.nullcontext()
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        pass
+
+
+class FakeCalendarManager:
+    def __init__(self, emails):
+        self.emails = emails
+        self.deltas = []
+        self.calls = []
+
+    def sync_users(self, delta_link=None):
+        self.calls.append(delta_link)
+        if delta_link:
+            return self.deltas.pop(0), f'delta-{len(self.calls)}'
+        return [
+            {'id': email, 'removed': False, 'name': email.split('@')[0].title(), 'email': email}
+            for email in self.emails
+        ], f'delta-{len(self.calls)}'
+
+
+def test_directory_is_listed_once_and_looked_up_by_email():
+    cache = DirectoryCache(FakeRedis(), max_age=3600)
+    cman = FakeCalendarManager(['beto@ofisino.com', 'ana@ofisino.com'])
+
+    users = cache.users(cman)
+    found = cache.find(cman, ['ana@ofisino.com'])
+
+    assert cman.calls == [None]
+    assert [user['email'] for user in users] == ['ana@ofisino.com', 'beto@ofisino.com']
+    assert found == {'ana@ofisino.com': {'name': 'Ana', 'email': 'ana@ofisino.com'}}
+    assert cache.status()['users'] == 2
+
+
+def test_unknown_emails_refresh_a_snapshot_older_than_a_minute():
+    redis = FakeRedis()
+    cache = DirectoryCache(redis, max_age=3600)
+    cman = FakeCalendarManager(['ana@ofisino.com'])
+    cache.refresh(cman)
+
+    assert cache.find(cman, ['carla@ofisino.com']) == {}
+    assert len(cman.calls) == 1
+
+    cman.deltas.append([{'id': 'c', 'removed': False, 'name': 'Carla', 'email': 'carla@ofisino.com'}])
+    redis.set(directory_cache.REFRESHED_AT_KEY, float(redis.get(directory_cache.REFRESHED_AT_KEY)) - 120)
+
+    assert list(cache.find(cman, ['carla@ofisino.com'])) == ['carla@ofisino.com']
+    assert cman.calls == [None, 'delta-1']
+    assert cache.status()['age_seconds'] < 60
+
+
+def test_stale_snapshot_is_refreshed_when_read():
+    redis = FakeRedis()
+    cache = DirectoryCache(redis, max_age=3600)
+    cman = FakeCalendarManager(['ana@ofisino.com'])
+    cache.refresh(cman)
+    redis.set(directory_cache.REFRESHED_AT_KEY, float(redis.get(directory_cache.REFRESHED_AT_KEY)) - 7200)
+
+    cman.deltas.append([])
+    cache.users(cman)
+
+    assert len(cman.calls) == 2
+    assert cache.status()['refreshes'] == 2
+
+
+def test_only_changed_users_are_applied_after_the_first_load():
+    cache = DirectoryCache(FakeRedis(), max_age=3600)
+    cman = FakeCalendarManager(['ana@ofisino.com', 'beto@ofisino.com', 'carla@ofisino.com'])
+    cache.refresh(cman)
+    cman.deltas.append([
+        {'id': 'ana@ofisino.com', 'removed': True},
+        # Renamed account, the delta only has the changed field
+        {'id': 'beto@ofisino.com', 'removed': False, 'name': None, 'email': 'roberto@ofisino.com'},
+        {'id': 'carla@ofisino.com', 'removed': False, 'name': 'Carla Gómez', 'email': None},
+    ])
+
+    changes = cache.refresh(cman)
+
+    assert changes == 3
+    assert cman.calls == [None, 'delta-1']
+    assert cache.users(cman) == [
+        {'name': 'Carla Gómez', 'email': 'carla@ofisino.com'},
+        {'name': 'Beto', 'email': 'roberto@ofisino.com'},
+    ]
+    assert cache.status()['full_refreshes'] == 1
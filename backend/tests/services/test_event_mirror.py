@@ -0,0 +1,121 @@
+import datetime
+
+import pytest
+import pytz
+
+from app.api import create_app
+from app.api_config import DevelopmentConfig
+from app.calendar_class import SyncTokenExpired
+from app.persistence.basemodel import BaseModel
+from app.persistence.session import get_engine
+from app.services import event_mirror
+
+
+class FakeCalendarManager:
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+
+    def sync_calendar_events(self, email, calendar_id, sync_token=None, start=None, end=None):
+        self.calls.append(sync_token)
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def _in(hours):
+    return pytz.utc.localize(datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0)) + \
+        datetime.timedelta(hours=hours)
+
+
+def _event(provider_event_id, start, end, busy=True):
+    return {
+        'provider_event_id': provider_event_id,
+        'removed': False,
+        'event_id': f'ical-{provider_event_id}',
+        'summary': f'Evento {provider_event_id}',
+        'organizer_email': 'ana@ofisino.com',
+        'html_link': None,
+        'start': start,
+        'end': end,
+        'busy': busy,
+    }
+
+
+@pytest.fixture
+def mirror_app(monkeypatch, tmp_path):
+    # event_mirror and the session read get_config()
+    monkeypatch.setenv('FLASK_ENV', 'development__')
+    monkeypatch.setattr(DevelopmentConfig, 'DATABASE_URL', f'sqlite:///{tmp_path}/mirror.sqlite')
+    monkeypatch.setattr(DevelopmentConfig, 'CALENDAR_MIRROR_SYNC_INTERVAL', 300)
+    BaseModel.metadata.create_all(get_engine(DevelopmentConfig.DATABASE_URL))
+    app = create_app(config_cls='app.api_config.DevelopmentConfig')
+    with app.app_context():
+        yield app
+
+
+def test_only_changes_are_pulled_after_the_first_sync(mirror_app):
+    cman = FakeCalendarManager([
+        ([_event('1', _in(1), _in(2)), _event('2', _in(3), _in(4)), _event('3', _in(5), _in(6), busy=False)], 't1'),
+        ([{'provider_event_id': '1', 'removed': True}, _event('2', _in(3), _in(5))], 't2'),
+    ])
+
+    event_mirror.sync_calendar(cman, 'ana@ofisino.com', 'ana@ofisino.com')
+    event_mirror.sync_calendar(cman, 'ana@ofisino.com', 'ana@ofisino.com')
+
+    assert cman.calls == [None, 't1']
+    busy = event_mirror.mirrored_busy_slots(['ana@ofisino.com', 'beto@ofisino.com'], _in(0), _in(8))
+    # Calendars never synced are left for the provider
+    assert busy == {'ana@ofisino.com': [(_in(3), _in(5))]}
+    events = event_mirror.mirrored_events('ana@ofisino.com', _in(0), _in(8))
+    assert [event['id'] for event in events] == ['ical-2']
+
+
+def test_expired_sync_token_triggers_a_full_sync(mirror_app):
+    cman = FakeCalendarManager([
+        ([_event('1', _in(1), _in(2))], 't1'),
+        SyncTokenExpired('ana@ofisino.com'),
+        ([_event('2', _in(3), _in(4))], 't2'),
+    ])
+
+    event_mirror.sync_calendar(cman, 'ana@ofisino.com', 'ana@ofisino.com')
+    event_mirror.sync_calendar(cman, 'ana@ofisino.com', 'ana@ofisino.com')
+
+    assert cman.calls == [None, 't1', None]
+    assert event_mirror.mirrored_busy_slots(['ana@ofisino.com'], _in(0), _in(8)) == {
+        'ana@ofisino.com': [(_in(3), _in(4))]
+    }
+
+
+def test_calendars_changed_by_ofisino_are_not_answered_until_synced(mirror_app):
+    cman = FakeCalendarManager([([_event('1', _in(1), _in(2))], 't1')])
+    event_mirror.sync_calendar(cman, 'ana@ofisino.com', 'ana@ofisino.com')
+
+    event_mirror.mark_stale(['ana@ofisino.com'])
+
+    assert event_mirror.mirrored_busy_slots(['ana@ofisino.com'], _in(0), _in(8)) == {}
+    assert event_mirror.mirrored_events('ana@ofisino.com', _in(0), _in(8)) is None
+
+
+def test_a_change_by_ofisino_during_a_sync_keeps_the_calendar_stale(mirror_app):
+    cman = FakeCalendarManager([([_event('1', _in(1), _in(2))], 't1'), ([], 't2')])
+    event_mirror.sync_calendar(cman, 'ana@ofisino.com', 'ana@ofisino.com')
+    sync_calendar_events = cman.sync_calendar_events
+
+    def changed_while_fetching(*args, **kwargs):
+        event_mirror.mark_stale(['ana@ofisino.com'])
+        return sync_calendar_events(*args, **kwargs)
+
+    cman.sync_calendar_events = changed_while_fetching
+    event_mirror.sync_calendar(cman, 'ana@ofisino.com', 'ana@ofisino.com')
+
+    assert cman.calls == [None, 't1']
+    assert event_mirror.mirrored_busy_slots(['ana@ofisino.com'], _in(0), _in(8)) == {}
+    # The next sync sees the change
+    cman.sync_calendar_events = sync_calendar_events
+    cman.answers.append(([], 't3'))
+    event_mirror.sync_calendar(cman, 'ana@ofisino.com', 'ana@ofisino.com')
+    assert event_mirror.mirrored_busy_slots(['ana@ofisino.com'], _in(0), _in(8)) == {
+        'ana@ofisino.com': [(_in(1), _in(2))]
+    }
@@ -0,0 +1,73 @@
+import datetime
+
+import pytz
+
+from app.calendar_class import BusySlot
+from app.services.freebusy_cache import FreeBusyCache
+
+TZ = 'America/Argentina/Buenos_Aires'
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def incr(self, key):
+        self.values[key] = int(self.values.get(key, 0)) + 1
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        pass
+
+
+class FakeProvider:
+    def __init__(self):
+        self.calls = []
+
+    def fetch(self, calendar_ids, start, end):
+        self.calls.append((calendar_ids, start, end))
+        return {
+            cal_id: [BusySlot(start=_at(13, 10), end=_at(13, 11)), BusySlot(start=_at(14, 9), end=_at(14, 10))]
+            for cal_id in calendar_ids
+        }
+
+
+def _at(day, hour):
+    return pytz.timezone(TZ).localize(datetime.datetime(2021, 12, day, hour))
+
+
+def test_busy_slots_are_fetched_once_per_calendar_and_day():
+    cache = FreeBusyCache(FakeRedis(), ttl=300)
+    provider = FakeProvider()
+
+    first = cache.get_many(['ana@ofisino.com'], _at(13, 9), _at(13, 18), TZ, provider.fetch, BusySlot)
+    second = cache.get_many(['ana@ofisino.com', 'beto@ofisino.com'], _at(13, 8), _at(13, 12), TZ,
+                            provider.fetch, BusySlot)
+
+    # The provider is asked for whole days, the answer only has the slots of the requested window
+    assert provider.calls[0][1:] == (_at(13, 0), _at(14, 0))
+    assert [calendar_ids for calendar_ids, _, _ in provider.calls] == [['ana@ofisino.com'], ['beto@ofisino.com']]
+    assert first['ana@ofisino.com'] == second['ana@ofisino.com'] == [BusySlot(start=_at(13, 10), end=_at(13, 11))]
+    assert cache.status()['hit_ratio'] == round(1 / 3, 3)
+
+
+def test_invalidated_calendars_are_fetched_again():
+    cache = FreeBusyCache(FakeRedis(), ttl=300)
+    provider = FakeProvider()
+
+    cache.get_many(['ana@ofisino.com', 'beto@ofisino.com'], _at(13, 9), _at(14, 18), TZ, provider.fetch, BusySlot)
+    cache.invalidate(['ana@ofisino.com'])
+    busy = cache.get_many(['ana@ofisino.com', 'beto@ofisino.com'], _at(13, 9), _at(14, 18), TZ,
+                          provider.fetch, BusySlot)
+
+    assert provider.calls[1][0] == ['ana@ofisino.com']
+    assert len(busy['beto@ofisino.com']) == 2
+    assert cache.status()['invalidations'] == 1
@@ -0,0 +1,81 @@
+import datetime
+
+from app.services.google_credentials import GoogleCredentialManager
+
+
+class FakeSubjectCredentials:
+    def __init__(self, subject, refreshed):
+        self.subject = subject
+        self.refreshed = refreshed
+        self.token = None
+        self.expiry = None
+
+    def refresh(self, request):
+        self.refreshed.append(self.subject)
+        self.token = f'token-{self.subject}-{len(self.refreshed)}'
+        self.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+
+class FakeServiceAccount:
+    service_account_email = 'ofisino@project.iam.gserviceaccount.com'
+
+    def __init__(self):
+        self.refreshed = []
+
+    def with_subject(self, subject):
+        return FakeSubjectCredentials(subject, self.refreshed)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+
+def _manager(service_account, redis=None):
+    return GoogleCredentialManager(
+        service_account, refresh_margin=300, idle_timeout=3600, redis=redis, request=object()
+    )
+
+
+def test_subject_credentials_and_tokens_are_cached():
+    service_account = FakeServiceAccount()
+    manager = _manager(service_account)
+
+    ana = manager.with_subject('ana@ofisino.com')
+    assert manager.with_subject('ana@ofisino.com') is ana
+    manager.with_subject('beto@ofisino.com')
+
+    assert service_account.refreshed == ['ana@ofisino.com', 'beto@ofisino.com']
+    assert manager.status()['hits'] == 1
+
+
+def test_tokens_about_to_expire_are_refreshed_ahead():
+    service_account = FakeServiceAccount()
+    manager = _manager(service_account)
+    ana = manager.with_subject('ana@ofisino.com')
+    beto = manager.with_subject('beto@ofisino.com')
+    ana.expiry = datetime.datetime.utcnow() + datetime.timedelta(minutes=2)
+
+    manager.refresh_expiring()
+
+    assert service_account.refreshed == ['ana@ofisino.com', 'beto@ofisino.com', 'ana@ofisino.com']
+    assert ana.expiry > datetime.datetime.utcnow() + datetime.timedelta(minutes=30)
+    assert beto.token == 'token-beto@ofisino.com-2'
+
+
+def test_tokens_are_shared_between_workers_through_redis():
+    redis = FakeRedis()
+    first_worker, second_worker = FakeServiceAccount(), FakeServiceAccount()
+
+    token = _manager(first_worker, redis).with_subject('ana@ofisino.com').token
+    shared = _manager(second_worker, redis).with_subject('ana@ofisino.com')
+
+    assert shared.token == token
+    assert first_worker.refreshed == ['ana@ofisino.com']
+    assert second_worker.refreshed == []
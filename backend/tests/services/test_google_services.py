@@ -0,0 +1,120 @@
+import datetime
+import threading
+
+import app.services.google_credentials as google_credentials
+import app.services.google_services as google_services
+from app.services.google_credentials import GoogleCredentialManager
+from app.services.google_services import GoogleServicePool
+
+
+class FakeCredentials:
+    service_account_email = 'ofisino@project.iam.gserviceaccount.com'
+
+    def with_subject(self, email):
+        return email
+
+
+def _fake_build(built):
+    def build(api, version, credentials, **kwargs):
+        built.append((api, version, credentials, kwargs))
+        return object()
+    return build
+
+
+def test_services_are_reused_per_api_and_subject(monkeypatch):
+    built = []
+    monkeypatch.setattr(google_services, 'build', _fake_build(built))
+    pool = GoogleServicePool(max_size=10)
+
+    calendar = pool.get(FakeCredentials(), 'ana@ofisino.com')
+    assert pool.get(FakeCredentials(), 'ana@ofisino.com') is calendar
+    assert pool.get(FakeCredentials(), 'beto@ofisino.com') is not calendar
+    assert pool.get(FakeCredentials(), 'ana@ofisino.com', api='admin', version='directory_v1') is not calendar
+
+    assert [(api, subject) for api, _, subject, _ in built] == [
+        ('calendar', 'ana@ofisino.com'),
+        ('calendar', 'beto@ofisino.com'),
+        ('admin', 'ana@ofisino.com'),
+    ]
+    assert all(kwargs['static_discovery'] and not kwargs['cache_discovery'] for *_, kwargs in built)
+    # Requests are executed within the quota of the delegated user
+    assert [kwargs['requestBuilder'].keywords for *_, kwargs in built] == [
+        {'subject': 'ana@ofisino.com'}, {'subject': 'beto@ofisino.com'}, {'subject': 'ana@ofisino.com'}
+    ]
+    assert pool.status() == {'size': 3, 'max_size': 10, 'hits': 1, 'misses': 3, 'evictions': 0}
+
+
+def test_least_recently_used_service_is_evicted(monkeypatch):
+    built = []
+    monkeypatch.setattr(google_services, 'build', _fake_build(built))
+    pool = GoogleServicePool(max_size=2)
+
+    ana = pool.get(FakeCredentials(), 'ana@ofisino.com')
+    pool.get(FakeCredentials(), 'beto@ofisino.com')
+    assert pool.get(FakeCredentials(), 'ana@ofisino.com') is ana
+    pool.get(FakeCredentials(), 'caro@ofisino.com')
+
+    assert pool.get(FakeCredentials(), 'ana@ofisino.com') is ana
+    assert pool.status()['evictions'] == 1
+    pool.get(FakeCredentials(), 'beto@ofisino.com')
+    assert len(built) == 4
+
+
+def test_services_are_not_shared_between_threads(monkeypatch):
+    monkeypatch.setattr(google_services, 'build', _fake_build([]))
+    pool = GoogleServicePool(max_size=10)
+    services = []
+    thread = threading.Thread(target=lambda: services.append(pool.get(FakeCredentials(), 'ana@ofisino.com')))
+    thread.start()
+    thread.join()
+
+    assert pool.get(FakeCredentials(), 'ana@ofisino.com') is not services[0]
+
+
+class FakeSubjectCredentials:
+    def __init__(self, subject, refreshed):
+        self.subject = subject
+        self.refreshed = refreshed
+        self.token = None
+        self.expiry = None
+
+    def refresh(self, request):
+        self.refreshed.append(self.subject)
+        self.token = f'token-{len(self.refreshed)}'
+        self.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+
+class FakeServiceAccount(FakeCredentials):
+    def __init__(self):
+        self.refreshed = []
+
+    def with_subject(self, email):
+        return FakeSubjectCredentials(email, self.refreshed)
+
+
+def test_pooled_services_keep_their_subject_refreshed_in_the_background(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(google_credentials.time, 'monotonic', lambda: now[0])
+    built = []
+    monkeypatch.setattr(google_services, 'build', _fake_build(built))
+    service_account = FakeServiceAccount()
+    manager = GoogleCredentialManager(service_account, refresh_margin=300, idle_timeout=3600, request=object())
+    pool = GoogleServicePool(max_size=10)
+
+    ana = pool.get(manager, 'ana@ofisino.com')
+    now[0] += 3000
+    assert pool.get(manager, 'ana@ofisino.com') is ana
+    now[0] += 3000
+    credentials = built[0][2]
+    credentials.expiry = datetime.datetime.utcnow() + datetime.timedelta(minutes=2)
+    manager.refresh_expiring()
+
+    # Used 50 minutes ago, built 100 minutes ago
+    assert manager.status()['subjects'] == 1
+    assert service_account.refreshed == ['ana@ofisino.com', 'ana@ofisino.com']
+
+    # Once forgotten the service is built again on the credentials the manager refreshes
+    now[0] += 4000
+    manager.refresh_expiring()
+    assert pool.get(manager, 'ana@ofisino.com') is not ana
+    assert built[1][2] is manager.with_subject('ana@ofisino.com')
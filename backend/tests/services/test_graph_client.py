@@ -0,0 +1,109 @@
+import pytest
+
+from app.services.graph_client import GraphClient, _batch_chunks, batch_request, endpoint_template
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, payload=None):
+        self.status_code = status_code
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        return FakeResponse(self.status_code)
+
+
+class FakeBatchSession(FakeSession):
+    """Answers every request of a $batch call with its own url"""
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        return FakeResponse(payload={'responses': [
+            {'id': request['id'], 'status': 200, 'body': {'url': request['url']}}
+            for request in kwargs['json']['requests']
+        ]})
+
+
+def test_requests_are_authenticated_and_use_the_configured_timeouts():
+    client = GraphClient(pool_size=2, connect_timeout=3, read_timeout=20)
+    client.session = FakeSession()
+
+    client.get('/users/ana@ofisino.com/calendar', {'access_token': 'abc'}, headers={'Prefer': 'x'})
+
+    method, url, kwargs = client.session.calls[0]
+    assert (method, url) == ('GET', 'https://graph.microsoft.com/v1.0/users/ana@ofisino.com/calendar')
+    assert kwargs['headers'] == {'Authorization': 'Bearer abc', 'Prefer': 'x'}
+    assert kwargs['timeout'] == (3, 20)
+
+
+def test_latency_is_measured_per_endpoint():
+    client = GraphClient(pool_size=2, connect_timeout=3, read_timeout=20)
+    client.session = FakeSession()
+    token = {'access_token': 'abc'}
+
+    client.get("/users/ana@ofisino.com/events?$filter=iCalUId eq 'x'", token)
+    client.get("/users/beto@ofisino.com/events?$filter=iCalUId eq 'y'", token)
+    client.session = FakeSession(status_code=404)
+    client.delete('/users/ana@ofisino.com/events/AAMkAD', token)
+
+    status = client.status()
+    assert set(status) == {'GET /users/{id}/events', 'DELETE /users/{id}/events/{id}'}
+    assert status['GET /users/{id}/events']['calls'] == 2
+    assert status['DELETE /users/{id}/events/{id}']['errors'] == 1
+
+
+def test_endpoint_template_keeps_graph_functions():
+    assert endpoint_template('/users/ana@ofisino.com/calendars/$count') == '/users/{id}/calendars/$count'
+    assert endpoint_template('users/ana@ofisino.com/calendar/getSchedule') == '/users/{id}/calendar/getSchedule'
+
+
+
+def test_batch_sends_up_to_20_requests_per_call():
+    client = GraphClient(pool_size=2, connect_timeout=3, read_timeout=20)
+    client.session = FakeBatchSession()
+    requests = [batch_request(str(i), 'GET', f'/users/user{i}@ofisino.com/calendar') for i in range(45)]
+
+    responses = client.batch(requests, {'access_token': 'abc'})
+
+    assert [len(kwargs['json']['requests']) for _, _, kwargs in client.session.calls] == [20, 20, 5]
+    assert {url for _, url, _ in client.session.calls} == {'https://graph.microsoft.com/v1.0/$batch'}
+    assert responses['44']['body']['url'] == '/users/user44@ofisino.com/calendar'
+
+
+def test_batch_keeps_dependent_requests_in_the_same_call():
+    requests = [batch_request(str(i), 'GET', f'/users/user{i}@ofisino.com') for i in range(19)]
+    requests.append(batch_request('a', 'GET', '/users/a@ofisino.com'))
+    requests.append(batch_request('b', 'DELETE', '/users/b@ofisino.com', depends_on=['a']))
+
+    chunks = _batch_chunks(requests)
+
+    assert [len(chunk) for chunk in chunks] == [19, 2]
+    assert [request['id'] for request in chunks[1]] == ['a', 'b']
+    with pytest.raises(ValueError):
+        _batch_chunks([batch_request('0', 'GET', '/me')] + [
+            batch_request(str(i), 'GET', '/me', depends_on=[str(i - 1)]) for i in range(1, 21)
+        ])
+
+
+def test_batch_request_bodies_are_json():
+    request = batch_request('1', 'POST', 'users/ana@ofisino.com/events/x/decline', body={'sendResponse': True})
+
+    assert request == {
+        'id': '1',
+        'method': 'POST',
+        'url': '/users/ana@ofisino.com/events/x/decline',
+        'body': {'sendResponse': True},
+        'headers': {'Content-Type': 'application/json'},
+    }
@@ -0,0 +1,42 @@
+import datetime
+
+import pytz
+
+from app.services import intervals
+from app.services.intervals import Interval
+
+
+def test_union_merges_unsorted_overlapping_and_touching_intervals():
+    assert intervals.union([Interval(50, 60), Interval(0, 10), Interval(5, 20), Interval(20, 30), Interval(40, 40)]) == [
+        Interval(0, 30), Interval(50, 60)
+    ]
+
+
+def test_intersect_keeps_the_time_covered_by_every_list():
+    ana = [Interval(0, 30), Interval(40, 100)]
+    beto = [Interval(10, 50), Interval(60, 70), Interval(60, 80)]
+    room = [Interval(0, 75)]
+
+    assert intervals.intersect(ana, beto, room) == [Interval(10, 30), Interval(40, 50), Interval(60, 75)]
+    assert intervals.intersect(ana, []) == []
+
+
+def test_complement_is_clipped_to_the_window_and_filtered_by_length():
+    busy = [Interval(90, 110), Interval(130, 135), Interval(180, 250)]
+
+    free = intervals.complement(busy, Interval(100, 200))
+
+    assert free == [Interval(110, 130), Interval(135, 180)]
+    assert intervals.at_least(free, 30) == [Interval(135, 180)]
+    assert intervals.complement([], Interval(0, 10)) == [Interval(0, 10)]
+
+
+def test_datetimes_round_trip_through_epoch_seconds():
+    tz = pytz.timezone('America/Argentina/Buenos_Aires')
+    start = tz.localize(datetime.datetime(2021, 12, 13, 9))
+    end = tz.localize(datetime.datetime(2021, 12, 13, 10, 30))
+
+    interval = Interval.of(start, end)
+
+    assert interval.length == 90 * 60
+    assert interval.to_datetimes(tz) == (start, end)
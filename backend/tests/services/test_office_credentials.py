@@ -0,0 +1,60 @@
+import contextlib
+import datetime
+
+from app.services.office_credentials import OfficeTokenProvider
+
+
+class FakeMsalClient:
+    def __init__(self, expires_in=3600):
+        self.expires_in = expires_in
+        self.requests = 0
+
+    def acquire_token_silent(self, scopes, account):
+        return None
+
+    def acquire_token_for_client(self, scopes):
+        self.requests += 1
+        return {'access_token': f'token-{self.requests}', 'token_type': 'Bearer', 'expires_in': self.expires_in}
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.locks = 0
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    @contextlib.contextmanager
+    def lock(self, name, timeout=None, blocking_timeout=None):
+        self.locks += 1
+        yield
+
+
+def test_token_is_kept_in_memory_until_it_is_about_to_expire():
+    client = FakeMsalClient()
+    provider = OfficeTokenProvider(client, scopes=['scope'], refresh_margin=300)
+
+    assert provider['access_token'] == 'token-1'
+    assert provider.access_token == 'token-1'
+    assert client.requests == 1
+
+    provider._token['expires_datetime'] = (datetime.datetime.utcnow() + datetime.timedelta(minutes=4)).isoformat()
+
+    assert provider['access_token'] == 'token-2'
+    assert provider.status()['refreshes'] == 2
+
+
+def test_workers_share_the_token_through_redis():
+    redis = FakeRedis()
+    first_client, second_client = FakeMsalClient(), FakeMsalClient()
+
+    first = OfficeTokenProvider(first_client, scopes=['scope'], refresh_margin=300, redis=redis)
+    second = OfficeTokenProvider(second_client, scopes=['scope'], refresh_margin=300, redis=redis)
+
+    assert first.access_token == second.access_token == 'token-1'
+    assert (first_client.requests, second_client.requests) == (1, 0)
+    assert redis.locks == 1
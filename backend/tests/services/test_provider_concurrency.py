@@ -0,0 +1,46 @@
+import threading
+
+import pytest
+
+from app.services.provider_concurrency import ProviderExecutor, sequential_provider_calls
+
+
+def test_calls_run_concurrently_and_results_keep_the_order():
+    executor = ProviderExecutor('office', max_workers=4)
+    # Every call waits for the others, it would time out if they ran one after the other
+    barrier = threading.Barrier(4, timeout=5)
+
+    def call(item):
+        barrier.wait()
+        return item * 2
+
+    assert executor.map(call, [1, 2, 3, 4]) == [2, 4, 6, 8]
+    status = executor.status()
+    assert status['calls'] == 4
+    assert status['max_in_flight'] == 4
+    assert status['in_flight'] == 0
+
+
+def test_errors_of_a_call_are_raised():
+    executor = ProviderExecutor('google', max_workers=2)
+
+    def call(item):
+        if item == 'b':
+            raise ValueError(item)
+        return item
+
+    with pytest.raises(ValueError):
+        executor.map(call, ['a', 'b', 'c'])
+
+
+def test_nested_and_sequential_calls_run_in_the_calling_thread():
+    executor = ProviderExecutor('google', max_workers=2)
+
+    def outer(item):
+        return executor.map(lambda _: threading.get_ident(), range(3))
+
+    for threads in executor.map(outer, range(2)):
+        assert len(set(threads)) == 1
+    with sequential_provider_calls():
+        assert set(executor.map(lambda _: threading.get_ident(), range(3))) == {threading.get_ident()}
+    assert executor.status()['fan_outs'] == 1
@@ -0,0 +1,130 @@
+import json
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from app.services.google_services import google_retry_after
+from app.services.graph_client import GraphClient
+from app.services.provider_quota import ProviderQuota, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, payload=None, headers=None):
+        self.status_code = status_code
+        self.payload = payload
+        self.headers = headers or {}
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        pass
+
+
+class ThrottlingSession:
+    """Throttles the first `throttled` calls with a Retry-After of 2 seconds"""
+
+    def __init__(self, throttled):
+        self.throttled = throttled
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        if self.calls <= self.throttled:
+            return FakeResponse(429, headers={'Retry-After': '2'})
+        return FakeResponse(200, payload={'value': []})
+
+
+def _quota(clock, **kwargs):
+    return ProviderQuota('office', **{
+        'rate': 0, 'subject_rate': 0, 'max_retries': 3, 'base_delay': 0.5, 'max_delay': 30,
+        'sleep': clock.sleep, 'clock': clock, **kwargs
+    })
+
+
+def test_bucket_spaces_calls_beyond_its_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, clock=clock)
+
+    waits = [bucket.reserve() for _ in range(4)]
+
+    assert waits == [0, 0, 0.5, 1.0]
+
+
+def test_throttled_graph_calls_are_retried_after_the_retry_after():
+    clock = FakeClock()
+    client = GraphClient(pool_size=2, connect_timeout=3, read_timeout=20, quota=_quota(clock))
+    client.session = ThrottlingSession(throttled=2)
+
+    response = client.get('/users/ana@ofisino.com/calendar', {'access_token': 'abc'})
+
+    assert response.status_code == 200
+    assert client.session.calls == 3
+    # Each retry waits at least the Retry-After the provider sent
+    assert clock.now >= 4
+    status = client.quota.status()
+    assert (status['calls'], status['throttled'], status['retries'], status['gave_up']) == (3, 2, 2, 0)
+
+
+def test_calls_give_up_after_the_retries_and_return_the_last_response():
+    clock = FakeClock()
+    client = GraphClient(pool_size=2, connect_timeout=3, read_timeout=20, quota=_quota(clock, max_retries=1))
+    client.session = ThrottlingSession(throttled=5)
+
+    response = client.get('/users/ana@ofisino.com/calendar', {'access_token': 'abc'})
+
+    assert response.status_code == 429
+    assert client.session.calls == 2
+    assert client.quota.status()['gave_up'] == 1
+
+
+def test_only_rate_limit_errors_of_google_are_retried():
+    def error(status, reason=None, headers=None):
+        content = json.dumps({'error': {'errors': [{'reason': reason}]}}).encode()
+        return HttpError(httplib2.Response({'status': status, **(headers or {})}), content)
+
+    assert google_retry_after(error(429, headers={'retry-after': '3'})) == 3
+    assert google_retry_after(error(403, 'userRateLimitExceeded')) == 0
+    assert google_retry_after(error(403, 'forbidden')) is None
+    assert google_retry_after(error(404, 'notFound')) is None
+
+
+def test_throttled_requests_of_a_batch_are_sent_again_with_their_dependents():
+    sent = []
+
+    class BatchSession:
+        def request(self, method, url, **kwargs):
+            requests = kwargs['json']['requests']
+            sent.append([(request['id'], request.get('dependsOn')) for request in requests])
+            first_call = len(sent) == 1
+            return FakeResponse(payload={'responses': [
+                {'id': 'a', 'status': 200}, {'id': 'b', 'status': 429, 'headers': {'Retry-After': '1'}},
+                {'id': 'c', 'status': 424},
+            ] if first_call else [{'id': request['id'], 'status': 200} for request in requests]})
+
+    clock = FakeClock()
+    client = GraphClient(pool_size=2, connect_timeout=3, read_timeout=20, quota=_quota(clock))
+    client.session = BatchSession()
+
+    responses = client.batch([
+        {'id': 'a', 'method': 'GET', 'url': '/a'},
+        {'id': 'b', 'method': 'GET', 'url': '/b', 'dependsOn': ['a']},
+        {'id': 'c', 'method': 'GET', 'url': '/c', 'dependsOn': ['b']},
+    ], {'access_token': 'abc'})
+
+    assert sent[1] == [('b', None), ('c', ['b'])]
+    assert {request_id: response['status'] for request_id, response in responses.items()} == {
+        'a': 200, 'b': 200, 'c': 200
+    }
+    assert clock.now >= 1
@@ -0,0 +1,166 @@
+import datetime
+import random
+
+import pandas as pd
+import pytest
+import pytz
+
+from app.calendar_class import BusySlot
+from app.services.scheduler import Availability, TimeGrid
+
+TZ = pytz.timezone('America/Argentina/Buenos_Aires')
+
+
+def _legacy_meeting_slots(busy_slots_list, duration, start, end, time_start, time_end):
+    """pandas scheduler previously used by CalendarManager, kept as the reference implementation.
+
+    Same algorithm, but it collects every viable slot instead of stopping at the first one.
+    """
+    meeting_slot_list = []
+    position = int(duration / 5)
+    dif = pd.date_range(start=start.isoformat(), end=end.isoformat(), freq='5T')
+    if busy_slots_list:
+        combined = pd.date_range(busy_slots_list[0]['start'], busy_slots_list[0]['end'], freq='5T')
+        for busy_slot in busy_slots_list[1:]:
+            combined = combined.union(pd.date_range(busy_slot['start'], busy_slot['end'], freq='5T'))
+        dif = dif.difference(combined)
+
+    pos = dif.indexer_between_time(time_start, time_end)
+    newdif = [dif[p] for p in pos]
+
+    for idx, slot in enumerate(newdif):
+        if idx + duration / 5 < len(newdif):
+            if (slot + pd.Timedelta(minutes=duration)) == newdif[idx + position]:
+                slot_start, slot_end = slot, newdif[idx + position]
+                if slot_start.weekday() in (5, 6) or slot_end.weekday() in (5, 6):
+                    continue
+                meeting_slot_list.append(slot_start.isoformat())
+    return meeting_slot_list
+
+
+def _engine_meeting_slots(busy_slots_by_calendar, duration, start, end, time_start, time_end):
+    grid = TimeGrid(start, end)
+    free = grid.free(busy_slots_by_calendar.values())
+    starts = grid.feasible_starts(free, duration, time_start, time_end)
+    return [grid.datetime_at(i).isoformat() for i in starts]
+
+
+def _random_case(rnd: random.Random):
+    first_day = datetime.date(2021, 12, 13) + datetime.timedelta(days=rnd.randint(0, 6))
+    days = rnd.randint(0, 3)
+    hour_start = rnd.randint(6, 12)
+    time_start = datetime.time(hour_start, rnd.choice(range(0, 60, 5)))
+    time_end = datetime.time(rnd.randint(hour_start + 1, 22), rnd.choice(range(0, 60, 5)))
+    start = TZ.localize(datetime.datetime.combine(first_day, time_start))
+    end = TZ.localize(datetime.datetime.combine(first_day + datetime.timedelta(days=days), time_end))
+    busy_slots_by_calendar = {}
+    for cal in range(rnd.randint(1, 5)):
+        slots = []
+        for _ in range(rnd.randint(0, 4 * (days + 1))):
+            slot_start = start + datetime.timedelta(minutes=5 * rnd.randint(-30, int((end - start).total_seconds() // 300)))
+            slot_end = slot_start + datetime.timedelta(minutes=5 * rnd.randint(1, 36))
+            slots.append(BusySlot(start=slot_start, end=slot_end))
+        busy_slots_by_calendar[f'user{cal}@ofisino.com'] = slots
+    duration = 5 * rnd.randint(1, 36)
+    return busy_slots_by_calendar, duration, start, end, time_start, time_end
+
+
+@pytest.mark.parametrize('seed', range(60))
+def test_engine_matches_legacy_scheduler(seed):
+    busy_slots_by_calendar, duration, start, end, time_start, time_end = _random_case(random.Random(seed))
+    busy_slots_list = [slot.to_dict() for slots in busy_slots_by_calendar.values() for slot in slots]
+
+    expected = _legacy_meeting_slots(busy_slots_list, duration, start, end, time_start, time_end)
+    found = _engine_meeting_slots(busy_slots_by_calendar, duration, start, end, time_start, time_end)
+
+    assert found == expected
+
+
+def test_meeting_cant_start_when_previous_one_ends():
+    start = TZ.localize(datetime.datetime(2021, 12, 13, 9))
+    end = TZ.localize(datetime.datetime(2021, 12, 13, 12))
+    busy = {'a': [BusySlot(start=start, end=start + datetime.timedelta(hours=1))]}
+
+    found = _engine_meeting_slots(busy, 60, start, end, datetime.time(9), datetime.time(12))
+
+    assert found[0] == '2021-12-13T10:05:00-03:00'
+
+
+def test_weekends_are_skipped():
+    saturday = TZ.localize(datetime.datetime(2021, 12, 18, 9))
+    end = TZ.localize(datetime.datetime(2021, 12, 20, 18))
+
+    found = _engine_meeting_slots({}, 30, saturday, end, datetime.time(9), datetime.time(18))
+
+    assert found[0] == '2021-12-20T09:00:00-03:00'
+
+
+def test_two_weeks_of_busy_calendars_only_offer_free_working_hours():
+    start = TZ.localize(datetime.datetime(2021, 12, 13, 0))
+    end = start + datetime.timedelta(days=14)
+    rnd = random.Random(0)
+    busy = {
+        f'user{cal}@ofisino.com': [
+            BusySlot(start=s, end=s + datetime.timedelta(minutes=30 * rnd.randint(1, 4)))
+            for s in (start + datetime.timedelta(minutes=15 * rnd.randint(0, 1344)) for _ in range(20))
+        ]
+        for cal in range(5)
+    }
+    grid = TimeGrid(start, end)
+
+    starts = [grid.datetime_at(i) for i in grid.feasible_starts(grid.free(busy.values()), 60,
+                                                                  datetime.time(9), datetime.time(18))]
+
+    assert starts
+    busy_slots = [slot for slots in busy.values() for slot in slots]
+    for meeting_start in starts:
+        meeting_end = meeting_start + datetime.timedelta(minutes=60)
+        assert meeting_start.weekday() < 5
+        assert datetime.time(9) <= meeting_start.time() and meeting_end.time() <= datetime.time(18)
+        assert not any(slot.start < meeting_end and meeting_start < slot.end for slot in busy_slots)
+
+
+def test_ranked_starts_avoid_leaving_unusable_gaps_and_dont_overlap():
+    start = TZ.localize(datetime.datetime(2021, 12, 13, 9))
+    end = TZ.localize(datetime.datetime(2021, 12, 13, 13))
+    busy = {'a': [BusySlot(start=start.replace(hour=10, minute=20), end=start.replace(hour=11))]}
+    grid = TimeGrid(start, end)
+
+    ranked = grid.ranked_starts(grid.free(busy.values()), 60, 3, datetime.time(9), datetime.time(13))
+
+    # 9:05 would leave 5 and 10 minutes free around it, 9:00 only 15 minutes before 10:20
+    assert [grid.datetime_at(i).strftime('%H:%M') for _, i in ranked] == ['09:00', '11:05']
+    assert [score for score, _ in ranked] == sorted(score for score, _ in ranked)
+
+
+def test_ranked_starts_are_closest_to_the_preferred_time():
+    start = TZ.localize(datetime.datetime(2021, 12, 13, 9))
+    end = TZ.localize(datetime.datetime(2021, 12, 13, 18))
+    grid = TimeGrid(start, end)
+
+    ranked = grid.ranked_starts(grid.free([]), 60, 3, datetime.time(9), datetime.time(18), datetime.time(15))
+
+    starts = [grid.datetime_at(i).strftime('%H:%M') for _, i in ranked]
+    assert starts[0] == '15:00'
+    assert len(starts) == 3 and all(abs(a - b) > 12 for n, (_, a) in enumerate(ranked) for _, b in ranked[n + 1:])
+
+
+def test_quorum_starts_count_attendees_and_name_the_absentees():
+    start = TZ.localize(datetime.datetime(2021, 12, 13, 9))
+    end = TZ.localize(datetime.datetime(2021, 12, 13, 13))
+    hour = datetime.timedelta(hours=1)
+    busy = {
+        'ana': [],
+        'beto': [BusySlot(start=start, end=start + 2 * hour)],
+        'carla': [BusySlot(start=start, end=start + hour)],
+        'dani': [BusySlot(start=start + hour, end=start + 3 * hour)],
+    }
+    availability = Availability(TimeGrid(start, end), busy, datetime.time(9), datetime.time(13))
+
+    found = availability.quorum_starts(['ana', 'beto', 'carla', 'dani'], ['ana'], 3, 60, 3)
+
+    starts = [(availability.grid.datetime_at(i).strftime('%H:%M'), absentees) for _, i, absentees in found]
+    # Nobody has the four of them free for an hour, at 11:05 only dani is missing
+    assert starts == [('11:05', ['dani'])]
+    assert availability.quorum_starts(['ana', 'beto', 'carla', 'dani'], ['ana', 'beto'], 3, 60, 3)[0][2] == ['dani']
+    assert availability.quorum_starts(['ana', 'beto', 'carla', 'dani'], ['dani'], 3, 60, 3) == []
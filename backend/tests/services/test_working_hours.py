@@ -0,0 +1,110 @@
+import datetime
+
+import pytz
+
+from app.services.scheduler import Availability, TimeGrid
+from app.services.working_hours import WorkingHours, WorkingHoursCache, holidays_mask, working_hours_masks
+
+TZ = pytz.timezone('America/Argentina/Buenos_Aires')
+
+
+class FakeCalendarManager:
+    def __init__(self, working_hours=None, holidays=()):
+        self.working_hours = working_hours or {}
+        self.holidays = set(holidays)
+        self.working_hours_calls = []
+        self.holidays_calls = []
+
+    def get_working_hours(self, emails):
+        self.working_hours_calls.append(emails)
+        return {email: self.working_hours.get(email) for email in emails}
+
+    def get_holidays(self, calendar_id, start, end):
+        self.holidays_calls.append((start, end))
+        return {day for day in self.holidays if start <= day <= end}
+
+
+def test_stored_working_hours_win_and_the_provider_is_asked_once():
+    cman = FakeCalendarManager(working_hours={
+        'b@doe.com': {'start': '08:00', 'end': '16:00', 'days': [0, 1, 2, 3], 'timezone': 'UTC'},
+        'c@doe.com': {'start': 'late', 'end': '16:00', 'days': [0]},
+    })
+    cache = WorkingHoursCache(max_age=60)
+    stored = {'a@doe.com': {'start': '10:00', 'end': '19:00', 'days': [0, 1, 2, 3, 4], 'timezone': 'UTC'}}
+    emails = ['a@doe.com', 'b@doe.com', 'c@doe.com', 'd@doe.com']
+
+    found = cache.working_hours(cman, emails, stored)
+    assert found == {
+        'a@doe.com': WorkingHours(datetime.time(10), datetime.time(19), (0, 1, 2, 3, 4), 'UTC'),
+        'b@doe.com': WorkingHours(datetime.time(8), datetime.time(16), (0, 1, 2, 3), 'UTC'),
+    }
+    assert cman.working_hours_calls == [['b@doe.com', 'c@doe.com', 'd@doe.com']]
+
+    assert cache.working_hours(cman, emails, stored) == found
+    assert len(cman.working_hours_calls) == 1
+    assert cache.status()['hits'] == 3
+
+
+def test_windows_timezones_are_mapped_and_unknown_ones_ignored():
+    cman = FakeCalendarManager(working_hours={
+        'a@doe.com': {'start': '09:00', 'end': '17:00', 'days': [0], 'timezone': 'Argentina Standard Time'},
+        'b@doe.com': {'start': '09:00', 'end': '17:00', 'days': [0], 'timezone': 'Customized Time Zone'},
+    })
+    cache = WorkingHoursCache(max_age=60)
+
+    found = cache.working_hours(cman, ['a@doe.com', 'b@doe.com'], {})
+
+    assert found == {'a@doe.com': WorkingHours(datetime.time(9), datetime.time(17), (0,), 'America/Buenos_Aires')}
+
+
+def test_changes_on_the_db_apply_to_the_next_search():
+    cman = FakeCalendarManager()
+    cache = WorkingHoursCache(max_age=60)
+    cache.working_hours(cman, ['a@doe.com'], {'a@doe.com': {'start': '10:00', 'end': '19:00', 'days': [0]}})
+
+    found = cache.working_hours(cman, ['a@doe.com'], {'a@doe.com': {'start': '08:00', 'end': '17:00', 'days': [0]}})
+    assert found['a@doe.com'].start == datetime.time(8)
+    # Cleared on the db, the ones of the provider are used
+    assert cache.working_hours(cman, ['a@doe.com'], {'a@doe.com': None}) == {}
+    assert cman.working_hours_calls == [['a@doe.com']]
+
+
+def test_holidays_are_fetched_a_year_at_a_time():
+    cman = FakeCalendarManager(holidays=[datetime.date(2021, 12, 8), datetime.date(2021, 12, 25)])
+    cache = WorkingHoursCache(max_age=60)
+
+    assert cache.holidays(cman, 'holidays', datetime.date(2021, 12, 1), datetime.date(2021, 12, 10)) == {
+        datetime.date(2021, 12, 8)
+    }
+    assert cache.holidays(cman, 'holidays', datetime.date(2021, 12, 20), datetime.date(2021, 12, 31)) == {
+        datetime.date(2021, 12, 25)
+    }
+    assert cman.holidays_calls == [(datetime.date(2021, 1, 1), datetime.date(2021, 12, 31))]
+
+
+def test_slots_are_within_the_working_hours_of_everyone_and_not_on_holidays():
+    start = TZ.localize(datetime.datetime(2021, 12, 13, 9))
+    grid = TimeGrid(start, start + datetime.timedelta(days=1, hours=9), step=15)
+    working_hours = {
+        # 10:00 to 12:00 in Buenos Aires
+        'b@doe.com': WorkingHours(datetime.time(13), datetime.time(15), (0, 1, 2, 3, 4), 'UTC'),
+        'c@doe.com': WorkingHours(datetime.time(13), datetime.time(15), (0, 1, 2, 3, 4), 'UTC'),
+    }
+    masks = working_hours_masks(grid, working_hours)
+    assert masks['b@doe.com'] is masks['c@doe.com']
+
+    availability = Availability(
+        grid=grid,
+        busy_slots_by_calendar={'a@doe.com': [], 'b@doe.com': [], 'c@doe.com': []},
+        time_start=datetime.time(9),
+        time_end=datetime.time(18),
+        usable=holidays_mask(grid, [datetime.date(2021, 12, 13)]),
+        usable_by_calendar=masks
+    )
+    starts = [grid.datetime_at(index).astimezone(TZ) for index in availability.feasible_starts(
+        availability.free(['a@doe.com', 'b@doe.com']), 60
+    )]
+    assert starts
+    assert all(start.date() == datetime.date(2021, 12, 14) for start in starts)
+    assert all(datetime.time(10) <= start.time() <= datetime.time(11) for start in starts)
+    assert holidays_mask(grid, []) is None
@@ -1,6 +1,311 @@
+import datetime
+
+import pytest
+
+import app.api_credentials as api_credentials
+import app.blueprints.calendar.calendar_api as calendar_api
+import app.calendar_class as calendar_class
+from app.task_queue import tasks
+from app.api import create_app
+from app.api_config import DevelopmentConfig
+from app.calendar_class import MeetingSlot
+from app.persistence.basemodel import BaseModel
+from app.persistence.models import MeetingRequest, User
+from app.persistence.session import get_engine, get_session
+
+
+class FakeJob:
+    def __init__(self, job_id, func=None, args=(), status='queued', result=None):
+        self.id = job_id
+        self.func = func
+        self.args = args
+        self.status = status
+        self.result = result
+        self.meta = {}
+
+    def get_id(self):
+        return self.id
+
+    def get_status(self):
+        return self.status
+
+
+class FakeQueue:
+    def __init__(self):
+        self.jobs = {}
+        self.down = False
+
+    def enqueue(self, func, args=(), **kwargs):
+        if self.down:
+            raise ConnectionError('redis is down')
+        job_id = f'job-{len(self.jobs) + 1}'
+        job = self.jobs[job_id] = FakeJob(job_id, func, args)
+        return job
+
+    def fetch_job(self, job_id):
+        return self.jobs.get(job_id)
+
+
+@pytest.fixture
+def db_app(monkeypatch, tmp_path):
+    """App on an empty sqlite db, with the task queue replaced by FakeQueue"""
+    monkeypatch.setenv('FLASK_ENV', 'development__')
+    monkeypatch.setattr(DevelopmentConfig, 'DATABASE_URL', f'sqlite:///{tmp_path}/api.sqlite')
+    BaseModel.metadata.create_all(get_engine(DevelopmentConfig.DATABASE_URL))
+    app = create_app(config_cls='app.api_config.DevelopmentConfig')
+    app.task_queue = FakeQueue()
+    with app.app_context():
+        yield app
+
+
+def _add_user(name, admin=False):
+    user = User(name=name, email=f'{name}@ofisino.com', admin=admin)
+    get_session().add(user)
+    get_session().commit()
+    return user
+
+
+@pytest.fixture
+def organizer(db_app, monkeypatch):
+    """Logged in client of ana, the directory knows every @ofisino.com email"""
+    monkeypatch.setattr(calendar_api, 'get_service_credentials_or_abort_with_http_500', lambda: {})
+    monkeypatch.setattr(calendar_api, 'CalendarManager', lambda config: object())
+    monkeypatch.setattr(calendar_api, 'find_directory_users', lambda cman, emails: {
+        email: {'name': email.split('@')[0]} for email in emails if email.endswith('@ofisino.com')
+    })
+    client = db_app.test_client()
+    _login(client, _add_user('ana'))
+    return client
+
+
+class FakeCalendarManager:
+    """Two slots where everybody can meet tomorrow, at 10:00 and at 15:00"""
+
+    def get_working_hours(self, emails):
+        return {}
+
+    def load_availability(self, **kwargs):
+        return kwargs
+
+    def find_ranked_meeting_slots(self, availability, cals, duration, count, preferred_time=None):
+        day = availability['start']
+        return [
+            MeetingSlot(start=datetime.datetime.combine(day, datetime.time(hour)),
+                        end=datetime.datetime.combine(day, datetime.time(hour)) + datetime.timedelta(minutes=duration))
+            for hour in (10, 15)
+        ][:count]
+
+
+def _organize_meeting_body(**kwargs):
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+    return {
+        'emails': ['ana@ofisino.com', 'beto@ofisino.com'],
+        'start': tomorrow.isoformat(),
+        'end': tomorrow.isoformat(),
+        'time_start': '09:00',
+        'time_end': '18:00',
+        'timezone': 'America/Argentina/Buenos_Aires',
+        'duration': 30,
+        'meeting_room_type': 'virtual',
+        **kwargs
+    }
+
+
+def _login(client, user):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+
 
 def test_that_home_says_hello_world(client):
     resp = client.get('/')
     assert resp.status_code == 200
     assert resp.headers['content-type'] == 'application/json'
     assert resp.json == {'Hello': 'World'}
+
+
+def test_office_webhook_answers_the_subscription_validation(client):
+    resp = client.post('/notifications/office?validationToken=abc%20123')
+
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/plain'
+    assert resp.get_data(as_text=True) == 'abc 123'
+
+
+def test_google_webhook_rejects_unknown_channels(client):
+    resp = client.post('/notifications/google', headers={'X-Goog-Resource-State': 'exists'})
+
+    assert resp.status_code == 404
+
+
+def test_task_status_needs_login(db_app):
+    resp = db_app.test_client().get('/task/job-1')
+
+    # Sent to the login
+    assert resp.status_code == 302
+
+
+def test_task_status_is_only_shown_to_the_user_that_requested_it(db_app):
+    ana, beto, admin = _add_user('ana'), _add_user('beto'), _add_user('admin', admin=True)
+    db_app.task_queue.jobs['job-1'] = FakeJob('job-1', status='finished', result=[{'kind': 'ok'}])
+    get_session().add(MeetingRequest(user_id=ana.id, conditions={}, status='Calculando', task_id='job-1'))
+    get_session().commit()
+    client = db_app.test_client()
+
+    _login(client, beto)
+    assert client.get('/task/job-1').json == {'error': 'Task job-1 does not exist'}
+    _login(client, ana)
+    assert client.get('/task/job-1').json['task_result'] == [{'kind': 'ok'}]
+    _login(client, admin)
+    assert client.get('/task/job-1').json['task_status'] == 'finished'
+
+
+def test_stats_are_only_shown_to_admins(db_app):
+    client = db_app.test_client()
+
+    _login(client, _add_user('ana'))
+    assert client.get('/stats').status_code == 405
+    _login(client, _add_user('admin', admin=True))
+    resp = client.get('/stats')
+    assert resp.status_code == 200
+    assert 'db_pool' in resp.json
+
+
+@pytest.mark.parametrize('endpoint', ['/busy-slots', '/free-slots'])
+def test_slots_of_an_unanswered_calendar_are_unavailable(db_app, monkeypatch, endpoint):
+    class UnansweredCalendarManager:
+        BS_AS_TIMEZONE = 'America/Argentina/Buenos_Aires'
+
+        def get_busy_slots_for_calendars(self, ids, *args, **kwargs):
+            raise calendar_class.BusySlotsUnavailable(ids)
+
+        def get_free_slots_for_calendar(self, email, cal_id, *args):
+            raise calendar_class.BusySlotsUnavailable([cal_id or email])
+
+    monkeypatch.setattr(calendar_api, 'get_service_credentials_or_abort_with_http_500', lambda: {})
+    monkeypatch.setattr(calendar_api, 'CalendarManager', lambda config: UnansweredCalendarManager())
+    _add_user('ana')
+
+    resp = db_app.test_client().get(endpoint, query_string={
+        'email': 'ana@ofisino.com', 'cal_id': 'ana@ofisino.com',
+        'start': '2021-12-13T09:00:00-03:00', 'end': '2021-12-13T18:00:00-03:00'
+    })
+
+    assert resp.status_code == 503
+    assert list(resp.json['errors']) == ['ana@ofisino.com']
+
+
+def test_async_organize_meeting_enqueues_the_search_and_keeps_the_task(db_app, organizer):
+    resp = organizer.post('/organizemeeting', json=_organize_meeting_body(run_async=True))
+
+    assert resp.status_code == 202
+    data = resp.json['data']
+    assert data['task_id'] == 'job-1'
+    assert data['status'] == 'Calculando'
+    job = db_app.task_queue.jobs['job-1']
+    assert job.args[:2] == (data['meeting_request_id'], 'ana@ofisino.com')
+    mr = get_session().query(MeetingRequest).get(data['meeting_request_id'])
+    assert mr.task_id == 'job-1'
+    # The requester can follow it
+    assert organizer.get('/task/job-1').json['task_status'] == 'queued'
+
+
+def test_meeting_request_fails_when_the_search_cant_be_enqueued(db_app, organizer):
+    db_app.task_queue.down = True
+
+    resp = organizer.post('/organizemeeting', json=_organize_meeting_body(run_async=True))
+
+    assert resp.status_code == 503
+    assert [mr.status for mr in get_session().query(MeetingRequest).all()] == ['Fallida']
+
+
+def test_a_crashed_search_is_failed_and_not_without_results(db_app, monkeypatch):
+    def crash(*args, **kwargs):
+        raise RuntimeError('provider down')
+
+    monkeypatch.setattr(tasks, '_get_app', lambda: db_app)
+    monkeypatch.setattr(api_credentials, 'get_service_credentials_or_abort_with_http_500', lambda: {})
+    monkeypatch.setattr(calendar_class, 'CalendarManager', lambda config: object())
+    monkeypatch.setattr(calendar_api, 'compute_meeting_options', crash)
+    ana = _add_user('ana')
+    mr = MeetingRequest(user_id=ana.id, conditions={}, status='Calculando', task_id='job-1')
+    get_session().add(mr)
+    get_session().commit()
+
+    with pytest.raises(RuntimeError):
+        tasks.organize_meeting(mr.id, 'ana@ofisino.com', {})
+
+    # The job commits on its own session
+    get_session().expire_all()
+    assert get_session().query(MeetingRequest).get(mr.id).status == 'Fallida'
+
+
+def test_a_crashed_sync_search_is_failed_and_not_left_computing(db_app, organizer, monkeypatch):
+    class CrashingCalendarManager(FakeCalendarManager):
+        def load_availability(self, **kwargs):
+            raise RuntimeError('provider down')
+
+    monkeypatch.setattr(calendar_api, 'CalendarManager', lambda config: CrashingCalendarManager())
+    db_app.config['PROPAGATE_EXCEPTIONS'] = False
+
+    resp = organizer.post('/organizemeeting', json=_organize_meeting_body())
+
+    assert resp.status_code == 500
+    get_session().expire_all()
+    assert [mr.status for mr in get_session().query(MeetingRequest).all()] == ['Fallida']
+
+
+def test_options_are_stored_and_one_of_them_is_confirmed_without_searching_again(db_app, organizer, monkeypatch):
+    monkeypatch.setattr(calendar_api, 'CalendarManager', lambda config: FakeCalendarManager())
+    created = []
+
+    def fake_create_meeting(**kwargs):
+        created.append(kwargs)
+        return {'id': 1, 'user_id': kwargs['requester_id'], 'meeting_room_id': 0,
+                'meeting_request_id': kwargs['meeting_request_id'], 'date': kwargs['start'],
+                'duration': kwargs['duration']}
+
+    monkeypatch.setattr(calendar_api, '_create_meeting', fake_create_meeting)
+
+    resp = organizer.post('/organizemeeting', json=_organize_meeting_body())
+
+    assert resp.status_code == 200
+    options = resp.json['data']
+    assert [option['kind'] for option in options] == ['ok', 'ok']
+    mr = get_session().query(MeetingRequest).one()
+    assert mr.status == 'En proceso'
+    assert mr.options == options
+
+    # Searching again would fail
+    monkeypatch.setattr(calendar_api, 'CalendarManager', None)
+    resp = organizer.post('/organizemeeting/confirm', json={
+        'meeting_request_id': mr.id, 'option_index': 1, 'description': '', 'summary': 'Daily'
+    })
+
+    assert resp.status_code == 200
+    assert len(created) == 1
+    assert created[0]['start'] == options[1]['start']
+    assert created[0]['attendees'] == ['ana@ofisino.com', 'beto@ofisino.com']
+    assert created[0]['organizer'] == 'ana@ofisino.com'
+    assert created[0]['meeting_room_id'] is None
+
+
+def test_stored_options_are_only_rejected_or_confirmed_by_the_requester(db_app, organizer, monkeypatch):
+    monkeypatch.setattr(calendar_api, 'CalendarManager', lambda config: FakeCalendarManager())
+    options = organizer.post('/organizemeeting', json=_organize_meeting_body()).json['data']
+    mr = get_session().query(MeetingRequest).one()
+    client = db_app.test_client()
+    _login(client, _add_user('carla'))
+
+    resp = client.post('/organizemeeting/reject', json={'meeting_request_id': mr.id, 'option_index': 0})
+    assert resp.status_code == 404
+    assert 'data' not in resp.json
+    resp = client.post('/organizemeeting/confirm', json={
+        'meeting_request_id': mr.id, 'option_index': 0, 'description': '', 'summary': 'Daily'
+    })
+    assert resp.status_code == 404
+
+    get_session().expire_all()
+    assert get_session().query(MeetingRequest).get(mr.id).options == options
+    # The requester still can
+    resp = organizer.post('/organizemeeting/reject', json={'meeting_request_id': mr.id, 'option_index': 0})
+    assert resp.json['data'] == options[1:]
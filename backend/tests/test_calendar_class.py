@@ -0,0 +1,458 @@
+import datetime
+from types import SimpleNamespace
+
+import pytest
+import pytz
+from googleapiclient.errors import HttpError
+
+import app.calendar_class as calendar_class
+import app.services.google_services as google_services
+from app.blueprints.calendar.calendar_api import _found_available_rooms, _found_conflict_options
+from app.calendar_class import BusySlot, CalendarManager, MeetingSlot
+from app.services.scheduler import Availability, TimeGrid
+
+
+class FakeRequest:
+    def __init__(self, response):
+        self.response = response
+
+    def execute(self):
+        return self.response
+
+
+class FakeFreeBusy:
+    def __init__(self, queries):
+        self.queries = queries
+
+    def query(self, body):
+        self.queries.append(body)
+        calendars = {
+            item['id']: {'busy': [{'start': body['timeMin'], 'end': body['timeMax']}]}
+            for item in body['items']
+        }
+        return FakeRequest({'calendars': calendars})
+
+
+class FakeService:
+    def __init__(self, queries):
+        self.queries = queries
+
+    def freebusy(self):
+        return FakeFreeBusy(self.queries)
+
+
+class FakeCredentials:
+    def with_subject(self, email):
+        return self
+
+
+def test_google_busy_slots_are_fetched_in_chunks(monkeypatch):
+    queries = []
+    monkeypatch.setattr(calendar_class, 'DOMAIN', 'GOOGLE')
+    monkeypatch.setattr(google_services, 'build', lambda *args, **kwargs: FakeService(queries))
+    google_services.get_google_service_pool().clear()
+    cman = CalendarManager(config=FakeCredentials())
+    tz = pytz.timezone(CalendarManager.BS_AS_TIMEZONE)
+    start = tz.localize(datetime.datetime(2021, 12, 13, 9))
+    end = tz.localize(datetime.datetime(2021, 12, 13, 18))
+    ids = [f'user{i}@ofisino.com' for i in range(60)]
+
+    busy = cman.get_busy_slots_for_calendars(ids, start, end, tz=CalendarManager.BS_AS_TIMEZONE)
+
+    assert len(queries) == 2
+    assert [len(q['items']) for q in queries] == [50, 10]
+    assert set(busy) == set(ids)
+    assert busy[ids[0]][0].start == start
+
+
+def test_office_busy_slots_of_users_and_rooms_share_a_batch(monkeypatch):
+    batches = []
+
+    def fake_batch(self, requests):
+        batches.append(requests)
+        responses = {}
+        for request in requests:
+            if request['method'] == 'POST':
+                value = [
+                    {'scheduleId': schedule.upper(), 'scheduleItems': [
+                        {'status': 'busy', 'start': {'dateTime': '2021-12-13T10:00:00'},
+                         'end': {'dateTime': '2021-12-13T11:00:00'}}
+                    ]}
+                    for schedule in request['body']['schedules']
+                ]
+            else:
+                value = [{'start': {'dateTime': '2021-12-13T12:00:00'}, 'end': {'dateTime': '2021-12-13T13:00:00'}}]
+            responses[request['id']] = {'id': request['id'], 'status': 200, 'body': {'value': value}}
+        return responses
+
+    monkeypatch.setattr(calendar_class, 'DOMAIN', 'OFFICE')
+    monkeypatch.setattr(CalendarManager, '_batch_office', fake_batch)
+    cman = CalendarManager(config={'access_token': 'abc'})
+    tz = pytz.timezone(CalendarManager.BS_AS_TIMEZONE)
+    start = tz.localize(datetime.datetime(2021, 12, 13, 9))
+    end = tz.localize(datetime.datetime(2021, 12, 13, 18))
+    ids = [f'user{i}@ofisino.com' for i in range(25)] + ['room-a', 'room-b']
+
+    busy = cman.get_busy_slots_for_calendars(ids, start, end, tz=CalendarManager.BS_AS_TIMEZONE, email='admin@ofisino.com')
+
+    assert len(batches) == 1
+    assert [request['method'] for request in batches[0]] == ['POST', 'POST', 'GET', 'GET']
+    assert busy['user24@ofisino.com'][0].start == tz.localize(datetime.datetime(2021, 12, 13, 10))
+    assert busy['room-a'][0].start == tz.localize(datetime.datetime(2021, 12, 13, 12))
+    assert busy['room-b'][0].start == tz.localize(datetime.datetime(2021, 12, 13, 12))
+
+
+def test_office_calendars_without_answer_are_not_taken_as_free(monkeypatch):
+    def fake_batch(self, requests):
+        responses = {}
+        for request in requests:
+            if request['method'] == 'POST':
+                value = [{'scheduleId': 'ana@ofisino.com', 'scheduleItems': []},
+                         {'scheduleId': 'beto@ofisino.com', 'error': {'message': 'Not found'}}]
+            else:
+                value = []
+            responses[request['id']] = {'id': request['id'], 'status': 200, 'body': {'value': value}}
+        # Still throttled after the retries
+        responses['calendar.1']['status'] = 429
+        return responses
+
+    monkeypatch.setattr(calendar_class, 'DOMAIN', 'OFFICE')
+    monkeypatch.setattr(CalendarManager, '_batch_office', fake_batch)
+    cman = CalendarManager(config={'access_token': 'abc'})
+    tz = pytz.timezone(CalendarManager.BS_AS_TIMEZONE)
+    start = tz.localize(datetime.datetime(2021, 12, 13, 9))
+    end = tz.localize(datetime.datetime(2021, 12, 13, 18))
+
+    with pytest.raises(calendar_class.BusySlotsUnavailable) as raised:
+        cman.get_busy_slots_for_calendars(['ana@ofisino.com', 'beto@ofisino.com', 'room-a', 'room-b'], start, end,
+                                          tz=CalendarManager.BS_AS_TIMEZONE, email='admin@ofisino.com')
+    assert raised.value.calendar_ids == ['beto@ofisino.com', 'room-b']
+
+
+def test_google_calendars_without_answer_are_not_taken_as_free(monkeypatch):
+    class PartialFreeBusy(FakeFreeBusy):
+        def query(self, body):
+            self.queries.append(body)
+            ids = [item['id'] for item in body['items']]
+            if ids == ['beto@ofisino.com']:
+                # Asked as the owner, still not answered
+                return FakeRequest({'calendars': {'beto@ofisino.com': {'errors': [{'reason': 'internalError'}]}}})
+            # beto isn't shared with the admin and room-a isn't answered at all
+            return FakeRequest({'calendars': {
+                'ana@ofisino.com': {'busy': []},
+                'beto@ofisino.com': {'errors': [{'reason': 'notFound'}], 'busy': []},
+            }})
+
+    class PartialService(FakeService):
+        def freebusy(self):
+            return PartialFreeBusy(self.queries)
+
+    queries = []
+    monkeypatch.setattr(calendar_class, 'DOMAIN', 'GOOGLE')
+    monkeypatch.setattr(google_services, 'build', lambda *args, **kwargs: PartialService(queries))
+    google_services.get_google_service_pool().clear()
+    cman = CalendarManager(config=FakeCredentials())
+    tz = pytz.timezone(CalendarManager.BS_AS_TIMEZONE)
+    start = tz.localize(datetime.datetime(2021, 12, 13, 9))
+    end = tz.localize(datetime.datetime(2021, 12, 13, 18))
+
+    with pytest.raises(calendar_class.BusySlotsUnavailable) as raised:
+        cman.get_busy_slots_for_calendars_google(['ana@ofisino.com', 'beto@ofisino.com', 'room-a'], start, end)
+    assert raised.value.calendar_ids == ['beto@ofisino.com', 'room-a']
+    assert len(queries) == 2
+
+
+def test_office_users_are_listed_with_their_id(monkeypatch):
+    requested = []
+
+    def fake_iter_office(self, endpoint, **kwargs):
+        requested.append(endpoint)
+        # Graph only returns the selected fields
+        fields = endpoint.split('$select=')[1].split('&')[0].split(',')
+        user = {'id': '1', 'displayName': 'Ana', 'userPrincipalName': 'ana@ofisino.com', 'mail': 'ana@ofisino.com'}
+        return iter([{field: user[field] for field in fields}])
+
+    monkeypatch.setattr(calendar_class, 'DOMAIN', 'OFFICE')
+    monkeypatch.setattr(CalendarManager, '_iter_office', fake_iter_office)
+    cman = CalendarManager(config={'access_token': 'abc'})
+
+    assert cman.get_users() == [{'id': '1', 'name': {'fullName': 'Ana'}, 'primaryEmail': 'ana@ofisino.com'}]
+    assert requested == ['/users?$select=id,displayName,userPrincipalName&$top=999']
+
+
+def test_office_directory_delta_follows_pages_and_keeps_the_delta_link(monkeypatch):
+    pages = {
+        '/users/delta?$select=id,displayName,userPrincipalName': {
+            'value': [{'id': '1', 'displayName': 'Ana', 'userPrincipalName': 'ana@ofisino.com'}],
+            '@odata.nextLink': 'https://graph.microsoft.com/v1.0/users/delta?$skiptoken=2',
+        },
+        '/users/delta?$skiptoken=2': {
+            'value': [{'id': '2', '@removed': {'reason': 'changed'}}],
+            '@odata.deltaLink': 'https://graph.microsoft.com/v1.0/users/delta?$deltatoken=3',
+        },
+    }
+    requested = []
+
+    def fake_get(endpoint, token, **kwargs):
+        requested.append(endpoint)
+        return SimpleNamespace(status_code=200, json=lambda: pages[endpoint], raise_for_status=lambda: None)
+
+    monkeypatch.setattr(calendar_class, 'DOMAIN', 'OFFICE')
+    monkeypatch.setattr(calendar_class, 'get_graph_client', lambda: SimpleNamespace(get=fake_get))
+    cman = CalendarManager(config={'access_token': 'abc'})
+
+    changes, delta_link = cman.sync_users()
+
+    assert requested == list(pages)
+    assert changes == [
+        {'id': '1', 'removed': False, 'name': 'Ana', 'email': 'ana@ofisino.com'},
+        {'id': '2', 'removed': True},
+    ]
+    assert delta_link == 'https://graph.microsoft.com/v1.0/users/delta?$deltatoken=3'
+
+
+class FakeBatch:
+    def __init__(self, callback, batches):
+        self.callback = callback
+        self.requests = []
+        batches.append(self.requests)
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        for request_id, event_id in self.requests:
+            if event_id == 'missing':
+                self.callback(request_id, None, HttpError(SimpleNamespace(status=404, reason='Not Found'), b''))
+            elif event_id == 'forbidden':
+                self.callback(request_id, None, HttpError(SimpleNamespace(status=403, reason='Forbidden'), b''))
+            else:
+                self.callback(request_id, '', None)
+
+
+class FakeEvents:
+    def delete(self, calendarId, eventId, sendUpdates):
+        return eventId
+
+
+class FakeBatchService:
+    def __init__(self, batches):
+        self.batches = batches
+
+    def events(self):
+        return FakeEvents()
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(callback, self.batches)
+
+
+def test_google_events_are_deleted_in_batches(monkeypatch):
+    batches = []
+    monkeypatch.setattr(calendar_class, 'DOMAIN', 'GOOGLE')
+    monkeypatch.setattr(google_services, 'build', lambda *args, **kwargs: FakeBatchService(batches))
+    google_services.get_google_service_pool().clear()
+    cman = CalendarManager(config=FakeCredentials())
+    event_ids = [f'event{i}' for i in range(58)] + ['missing', 'forbidden']
+
+    result = cman.delete_events('ana@ofisino.com', event_ids)
+
+    assert [len(batch) for batch in batches] == [50, 10]
+    # Events that no longer exist count as deleted
+    assert set(result.succeeded) == set(event_ids) - {'forbidden'}
+    assert list(result.failed) == ['forbidden']
+    assert result.failed['forbidden'].resp.status == 403
+
+
+def _availability(busy_hours_by_calendar):
+    tz = pytz.timezone(CalendarManager.BS_AS_TIMEZONE)
+    day = datetime.datetime(2021, 12, 13)
+    busy = {
+        cal_id: [
+            BusySlot(start=tz.localize(day.replace(hour=h)), end=tz.localize(day.replace(hour=h + 1)))
+            for h in hours
+        ]
+        for cal_id, hours in busy_hours_by_calendar.items()
+    }
+    grid = TimeGrid(tz.localize(day.replace(hour=9)), tz.localize(day.replace(hour=18)))
+    return Availability(grid, busy, datetime.time(9), datetime.time(18))
+
+
+def test_rooms_are_ranked_by_capacity_fit_and_then_by_earliest_slot(monkeypatch):
+    monkeypatch.setattr(calendar_class, 'DOMAIN', 'GOOGLE')
+    cman = CalendarManager(config=FakeCredentials())
+    availability = _availability({
+        'ana@ofisino.com': [9],
+        'beto@ofisino.com': [],
+        'big_room': [],
+        'small_room': [10, 11],
+        'full_room': list(range(9, 18)),
+    })
+    rooms = [
+        SimpleNamespace(id=1, calendar='big_room', capacity=10),
+        SimpleNamespace(id=2, calendar='small_room', capacity=2),
+        SimpleNamespace(id=3, calendar='full_room', capacity=2),
+    ]
+
+    [(slot_list, meeting_room_id)] = _found_available_rooms(
+        cman, availability, rooms, ['ana@ofisino.com', 'beto@ofisino.com'], duration=60, count=1
+    )
+
+    assert meeting_room_id == 2
+    assert slot_list[0].start.isoformat() == '2021-12-13T12:05:00-03:00'
+
+
+def test_excusing_each_attendee_matches_scheduling_without_them(monkeypatch):
+    monkeypatch.setattr(calendar_class, 'DOMAIN', 'GOOGLE')
+    cman = CalendarManager(config=FakeCredentials())
+    availability = _availability({
+        'ana@ofisino.com': [9, 12, 15],
+        'beto@ofisino.com': [10, 13, 16],
+        'caro@ofisino.com': [11, 14],
+        'room_a': [9, 10],
+        'room_b': [13, 14, 15, 16],
+    })
+    emails = ['ana@ofisino.com', 'beto@ofisino.com', 'caro@ofisino.com']
+
+    found = cman.find_meeting_slots_excusing_attendee(availability, emails, emails, ['room_a', 'room_b'], 60)
+
+    for excused in emails:
+        others = [email for email in emails if email != excused]
+        ranked = cman.find_ranked_meeting_slots_by_room(availability, others, ['room_a', 'room_b'], 60, count=10)
+        for room in ['room_a', 'room_b']:
+            # The first slot where the others can meet in the room, the ranked ones can't be earlier
+            starts = availability.feasible_starts(availability.free([*others, room]), 60)
+            if not len(starts):
+                assert found[excused][room] == ranked[room] == []
+                continue
+            first = availability.grid.datetime_at(starts[0])
+            assert found[excused][room] == [MeetingSlot(start=first, end=first + datetime.timedelta(minutes=60))]
+            assert min(slot.start for slot in ranked[room]) >= first
+
+
+def test_conflict_options_are_ranked_by_displaced_events(monkeypatch):
+    monkeypatch.setattr(calendar_class, 'DOMAIN', 'GOOGLE')
+    cman = CalendarManager(config=FakeCredentials())
+    availability = _availability({
+        'org@ofisino.com': [],
+        'ana@ofisino.com': [9, 10, 11, 12, 13, 14, 15, 16, 17],
+        'beto@ofisino.com': [9, 10, 11, 12, 13],
+    })
+    emails = ['org@ofisino.com', 'ana@ofisino.com', 'beto@ofisino.com']
+
+    options = _found_conflict_options(
+        cman, availability, [], emails, ['ana@ofisino.com', 'beto@ofisino.com'], duration=60
+    )
+
+    # Excusing beto gives no slot (ana is busy all day), excusing ana is the only option
+    assert [(email, slot_list[0].start.isoformat()) for slot_list, _, email in options] == [
+        ('ana@ofisino.com', '2021-12-13T14:05:00-03:00'),
+    ]
+
+    availability = _availability({
+        'org@ofisino.com': [],
+        'ana@ofisino.com': [9, 10, 11, 15, 16, 17],
+        'beto@ofisino.com': [],
+    })
+    # beto has a single 3 hours event, from 12 to 15
+    tz = pytz.timezone(CalendarManager.BS_AS_TIMEZONE)
+    availability = Availability(
+        availability.grid,
+        {
+            **availability.busy_slots_by_calendar,
+            'beto@ofisino.com': [BusySlot(
+                start=tz.localize(datetime.datetime(2021, 12, 13, 12)),
+                end=tz.localize(datetime.datetime(2021, 12, 13, 15))
+            )],
+        },
+        availability.time_start,
+        availability.time_end
+    )
+
+    options = _found_conflict_options(
+        cman, availability, [], emails, ['ana@ofisino.com', 'beto@ofisino.com'], duration=60
+    )
+
+    # Excusing ana is earlier (9:00) but displaces two of her events, excusing beto displaces one
+    assert [(email, slot_list[0].start.isoformat()) for slot_list, _, email in options] == [
+        ('beto@ofisino.com', '2021-12-13T12:05:00-03:00'),
+        ('ana@ofisino.com', '2021-12-13T09:00:00-03:00'),
+    ]
+
+
+def test_timezone_is_looked_up_by_the_offset_unless_given():
+    cman = CalendarManager.__new__(CalendarManager)
+
+    # Half hour offsets keep the sign of the hours
+    assert cman._get_timezone_from_datetime('2021-12-13T10:00:00-03:30') == 'America/St_Johns'
+    assert cman._get_timezone_from_datetime('2021-12-13T10:00:00+05:45') == 'Asia/Kathmandu'
+    assert cman._get_timezone_from_datetime('2021-12-13T10:00:00-03:00', CalendarManager.BS_AS_TIMEZONE) == \
+        CalendarManager.BS_AS_TIMEZONE
+
+
+def test_office_event_is_deleted_through_its_locator_without_searching(monkeypatch):
+    posted = []
+    deleted = []
+
+    def fake_post(self, endpoint, **kwargs):
+        posted.append(endpoint)
+        return {'id': 'AAMk-1', 'iCalUId': 'ical-1'}
+
+    def fake_search(self, email, iCalUIds):
+        raise AssertionError('The event should not be searched')
+
+    monkeypatch.setattr(calendar_class, 'DOMAIN', 'OFFICE')
+    monkeypatch.setattr(calendar_class, 'DOMAIN_ADMIN_ACC', 'admin@ofisino.com')
+    monkeypatch.setattr(CalendarManager, '_batch_office', lambda self, requests: {})
+    monkeypatch.setattr(CalendarManager, '_post_office', fake_post)
+    monkeypatch.setattr(CalendarManager, '_delete_office', lambda self, endpoint: deleted.append(endpoint))
+    monkeypatch.setattr(CalendarManager, '_get_events_by_iCalUId', fake_search)
+    cman = CalendarManager(config={'access_token': 'abc'})
+
+    locator = cman.create_event('ana@ofisino.com', 'ana@ofisino.com', 'Daily', '2021-12-13T10:00:00-03:00',
+                                '2021-12-13T10:30:00-03:00', '', ['beto@ofisino.com'], 'virtual', 'room-a')
+    cman.delete_event_for_all_users('beto@ofisino.com', locator.event_id, locator, ['beto@ofisino.com'])
+
+    assert posted == ['/users/admin@ofisino.com/calendars/room-a/events']
+    assert locator == calendar_class.EventLocator(
+        event_id='ical-1', provider_event_id='AAMk-1', calendar_id='room-a', organizer='admin@ofisino.com'
+    )
+    assert deleted == ['/users/admin@ofisino.com/events/AAMk-1']
+
+
+def test_free_slots_are_the_window_not_covered_by_unsorted_busy_slots(monkeypatch):
+    monkeypatch.setattr(calendar_class, 'DOMAIN', 'GOOGLE')
+    cman = CalendarManager(config=FakeCredentials())
+    tz = pytz.timezone(CalendarManager.BS_AS_TIMEZONE)
+
+    def at(hour, minute=0):
+        return tz.localize(datetime.datetime(2021, 12, 13, hour, minute))
+
+    busy = [BusySlot(at(14), at(15)), BusySlot(at(8), at(10)), BusySlot(at(14, 30), at(16)), BusySlot(at(17), at(19))]
+    monkeypatch.setattr(cman, 'get_busy_slots_for_calendars', lambda ids, *args, **kwargs: {ids[0]: busy})
+
+    free = cman.get_free_slots_for_calendar('ana@ofisino.com', None, at(9), at(18))
+
+    assert [(slot.start, slot.end) for slot in free] == [(at(10), at(14)), (at(16), at(17))]
+
+
+def test_room_options_are_the_best_non_overlapping_slots(monkeypatch):
+    monkeypatch.setattr(calendar_class, 'DOMAIN', 'GOOGLE')
+    cman = CalendarManager(config=FakeCredentials())
+    availability = _availability({
+        'ana@ofisino.com': [9],
+        'beto@ofisino.com': [14],
+        'big_room': [],
+        'small_room': [10],
+    })
+    rooms = [
+        SimpleNamespace(id=1, calendar='big_room', capacity=10),
+        SimpleNamespace(id=2, calendar='small_room', capacity=2),
+    ]
+
+    options = _found_available_rooms(
+        cman, availability, rooms, ['ana@ofisino.com', 'beto@ofisino.com'], duration=60, count=3
+    )
+
+    assert [(slot_list[0].start.strftime('%H:%M'), room_id) for slot_list, room_id in options] == [
+        ('11:05', 2), ('12:55', 2), ('15:05', 2)
+    ]
@@ -285,7 +285,7 @@ const OrganizeMeetings: React.FunctionComponent = () => {
 			.then((response) => {
 				setOrganizeMeetingRows(
 					response.data.data.filter(
-						(item: any) => item.status !== 'En proceso' && item.status !== 'Sin resultados'
+						(item: any) => item.status !== 'En proceso' && item.status !== 'Sin resultados' && item.status !== 'Fallida'
 					)
 				);
 			})